@@ -0,0 +1,178 @@
+"""
+Auditoria da Base e da UNION
+Varre a 'Base de Clientes ' e a UNION uma única vez e aponta o que hoje só
+aparece abrindo cada PDF:
+- valor de venda ausente ou não numérico (o PDF mostra "Verificar")
+- sigla e unidade vazias (produto "Verificar")
+- clientes sem nenhum lançamento casado na UNION (totais zerados)
+- linhas da UNION somadas para mais de um CPF: pela regra `nome in CLIENTE` do
+  SOMASES, um nome contido em outro absorve os lançamentos do outro, e um mesmo
+  nome cadastrado com CPFs diferentes (homônimos) recebe as mesmas linhas em cada um
+
+Os nomes de clientes são procurados em todos os nomes distintos da UNION de uma
+vez (autômato de Aho-Corasick), em tempo proporcional ao tamanho dos textos e
+ao número de casamentos, em vez de comparar cada cliente com cada nome.
+"""
+
+import json
+import sys
+from collections import deque
+
+from snapshot_planilha import ANO_PADRAO, categoria_lancamento
+
+
+class AutomatoNomes:
+    """Aho-Corasick sobre os nomes (minúsculos) dos clientes"""
+
+    def __init__(self, nomes):
+        self.transicoes = [{}]     # estado -> {caractere: estado}
+        self.falha = [0]
+        self.saidas = [()]         # estado -> nomes que terminam nele (incluindo via falha)
+
+        for nome in nomes:
+            estado = 0
+            for caractere in nome:
+                proximo = self.transicoes[estado].get(caractere)
+                if proximo is None:
+                    proximo = len(self.transicoes)
+                    self.transicoes[estado][caractere] = proximo
+                    self.transicoes.append({})
+                    self.falha.append(0)
+                    self.saidas.append(())
+                estado = proximo
+            self.saidas[estado] = (nome,)
+
+        fila = deque(self.transicoes[0].values())
+        while fila:
+            estado = fila.popleft()
+            for caractere, proximo in self.transicoes[estado].items():
+                fila.append(proximo)
+                recuo = self.falha[estado]
+                while recuo and caractere not in self.transicoes[recuo]:
+                    recuo = self.falha[recuo]
+                destino = self.transicoes[recuo].get(caractere, 0)
+                self.falha[proximo] = destino if destino != proximo else 0
+                self.saidas[proximo] = self.saidas[proximo] + self.saidas[self.falha[proximo]]
+
+    def contidos(self, texto):
+        """Nomes contidos em `texto` (conjunto)"""
+        encontrados = set()
+        estado = 0
+        for caractere in texto:
+            while estado and caractere not in self.transicoes[estado]:
+                estado = self.falha[estado]
+            estado = self.transicoes[estado].get(caractere, 0)
+            encontrados.update(self.saidas[estado])
+        return encontrados
+
+
+class RelatorioAuditoria:
+    """Resultado da auditoria de uma base (linhas são as da planilha)"""
+
+    def __init__(self):
+        self.total_clientes = 0
+        self.total_lancamentos = 0
+        self.sem_valor_venda = []      # {'linha', 'cpf', 'cliente'}
+        self.sem_produto = []          # {'linha', 'cpf', 'cliente'}: sigla e unidade vazias
+        self.sem_lancamentos = []      # {'linha', 'cpf', 'cliente'}
+        self.lancamentos_compartilhados = []   # {'cliente_union', 'linhas', 'cpfs', 'clientes'}
+
+    def resumo(self):
+        return {
+            'total_clientes': self.total_clientes,
+            'total_lancamentos': self.total_lancamentos,
+            'sem_valor_venda': len(self.sem_valor_venda),
+            'sem_produto': len(self.sem_produto),
+            'sem_lancamentos': len(self.sem_lancamentos),
+            'nomes_union_compartilhados': len(self.lancamentos_compartilhados),
+            'linhas_union_compartilhadas': sum(
+                len(item['linhas']) for item in self.lancamentos_compartilhados
+            ),
+        }
+
+    def para_dict(self):
+        return {
+            'resumo': self.resumo(),
+            'sem_valor_venda': self.sem_valor_venda,
+            'sem_produto': self.sem_produto,
+            'sem_lancamentos': self.sem_lancamentos,
+            'lancamentos_compartilhados': self.lancamentos_compartilhados,
+        }
+
+
+def auditar(clientes, lancamentos):
+    """
+    Audita em uma passada por cada aba.
+
+    `clientes`: pares (linha, dados) com as chaves de buscar_por_cpf.
+    `lancamentos`: tuplas (linha, cliente, entrada, divisao) da UNION.
+    Só contam os lançamentos que entram em algum total (categoria_lancamento),
+    como no cálculo da declaração.
+    """
+    relatorio = RelatorioAuditoria()
+
+    # Base: campos que viram "Verificar" e CPFs por nome (minúsculo) de cliente
+    cpfs_por_nome = {}
+    linhas_por_nome = {}
+    for linha, dados in clientes:
+        relatorio.total_clientes += 1
+        item = {'linha': linha, 'cpf': dados['cpf'], 'cliente': dados['cliente']}
+        valor = dados['valor_venda']
+        if not (isinstance(valor, (int, float)) and valor > 0):
+            relatorio.sem_valor_venda.append(item)
+        if not dados['sigla'] and not dados['unidade']:
+            relatorio.sem_produto.append(item)
+
+        nome = dados['cliente'].lower()
+        cpfs = cpfs_por_nome.setdefault(nome, [])
+        if dados['cpf'] not in cpfs:
+            cpfs.append(dados['cpf'])
+        linhas_por_nome.setdefault(nome, []).append(item)
+
+    # UNION: linhas somadas, agrupadas pelo nome (minúsculo)
+    linhas_union = {}
+    for linha, cliente, entrada, divisao in lancamentos:
+        relatorio.total_lancamentos += 1
+        if categoria_lancamento(cliente, entrada, divisao) is not None:
+            linhas_union.setdefault(str(cliente).lower(), []).append(linha)
+
+    automato = AutomatoNomes(nome for nome in cpfs_por_nome if nome)
+    casados = set()
+    for nome_union, linhas in linhas_union.items():
+        nomes = automato.contidos(nome_union)
+        casados.update(nomes)
+        # Nomes diferentes ou o mesmo nome com vários CPFs: as linhas contam em cada CPF
+        cpfs = {cpf for nome in nomes for cpf in cpfs_por_nome[nome]}
+        if len(cpfs) > 1:
+            relatorio.lancamentos_compartilhados.append({
+                'cliente_union': nome_union,
+                'linhas': linhas,
+                'cpfs': len(cpfs),
+                'clientes': [
+                    {'cliente': nome, 'cpfs': cpfs_por_nome[nome]}
+                    for nome in sorted(nomes, key=len, reverse=True)
+                ],
+            })
+
+    for nome, itens in linhas_por_nome.items():
+        if nome not in casados:
+            relatorio.sem_lancamentos.extend(itens)
+    relatorio.sem_lancamentos.sort(key=lambda item: item['linha'])
+    return relatorio
+
+
+def main():
+    """Uso: python Scripts/auditoria_base.py <planilha.xlsx> [ano]"""
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+
+    from snapshot_planilha import SnapshotPlanilha
+
+    ano = int(sys.argv[2]) if len(sys.argv) > 2 else ANO_PADRAO
+    snapshot = SnapshotPlanilha(sys.argv[1], ano=ano)
+    print(json.dumps(snapshot.auditoria().para_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
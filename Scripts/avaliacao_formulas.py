@@ -0,0 +1,911 @@
+"""
+Avaliação de Fórmulas da Planilha
+O snapshot lê a planilha com `data_only=True`, ou seja, o último valor calculado
+que o Excel gravou em cada célula. Um xlsx salvo por uma ferramenta que não grava
+esses valores chega com as fórmulas vazias (None) e os totais viram 0 sem aviso.
+
+Este módulo avalia as fórmulas da própria planilha:
+- o grafo de dependências (célula -> fórmulas que a leem) é montado uma vez;
+- cada fórmula é avaliada uma única vez (memoização), em ordem de dependência;
+- numa nova versão do arquivo, só as células alteradas e as fórmulas que dependem
+  delas (direta ou indiretamente) são recalculadas.
+
+Suporta o subconjunto de funções usado em planilhas de controle (SOMA, SOMASES,
+PROCV, SE, SEERRO, CONCATENAR...). Fórmulas fora dele ficam com o valor gravado no
+arquivo, se houver, e são listadas em `nao_suportadas`.
+
+Uso: python Scripts/avaliacao_formulas.py <planilha.xlsx>
+     python Scripts/avaliacao_formulas.py --verificar   (autoverificação da detecção)
+"""
+
+import fnmatch
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict, deque
+from xml.etree import ElementTree
+
+from openpyxl import load_workbook
+from openpyxl.formula import Tokenizer
+from openpyxl.formula.tokenizer import Token
+from openpyxl.utils.cell import get_column_letter, range_boundaries
+
+logger = logging.getLogger(__name__)
+
+_NS_PLANILHA = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_RELACOES = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_NS_PACOTE = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+# ---------------------------------------------------------------- detecção
+
+
+def _arquivos_abas(pacote):
+    """Nome da aba -> caminho do XML dentro do xlsx"""
+    livro = ElementTree.fromstring(pacote.read('xl/workbook.xml'))
+    relacoes = ElementTree.fromstring(pacote.read('xl/_rels/workbook.xml.rels'))
+    destinos = {rel.get('Id'): rel.get('Target') for rel in relacoes.iter(f'{_NS_PACOTE}Relationship')}
+
+    arquivos = {}
+    for aba in livro.iter(f'{_NS_PLANILHA}sheet'):
+        destino = destinos.get(aba.get(f'{_NS_RELACOES}id'), '')
+        arquivos[aba.get('name')] = destino.lstrip('/') if destino.startswith('/') else f'xl/{destino}'
+    return arquivos
+
+
+# Abertura da tag de fórmula: `<f>`, `<f t="shared" ...>` ou `<f .../>`
+_TAG_FORMULA = re.compile(rb'<f[\s>/]')
+
+
+def abas_sem_valores(arquivo_excel, abas):
+    """
+    Abas (entre `abas`) com fórmulas sem valor calculado gravado.
+
+    Não faz parse da aba: procura a primeira fórmula (tag `<f>`; `<filters>`,
+    `<firstHeader>` e afins não contam) no XML e examina só a célula dela. Quem
+    salva o arquivo grava o valor de todas as fórmulas (Excel, LibreOffice) ou de
+    nenhuma (openpyxl e afins), então a primeira basta.
+    """
+    encontradas = set()
+    with zipfile.ZipFile(arquivo_excel) as pacote:
+        arquivos = _arquivos_abas(pacote)
+        for aba in abas:
+            if aba not in arquivos:
+                continue
+            with pacote.open(arquivos[aba]) as xml:
+                conteudo = xml.read()
+            formula = _TAG_FORMULA.search(conteudo)
+            if formula is None:
+                continue
+            inicio = conteudo.rfind(b'<c ', 0, formula.start())
+            fim = conteudo.find(b'</c>', formula.start())
+            if inicio < 0 or fim < 0:
+                continue
+            # Fragmento sem as declarações de namespace da raiz: tags sem prefixo
+            celula = ElementTree.fromstring(conteudo[inicio:fim + len(b'</c>')])
+            valor = celula.find('v')
+            if valor is None or not valor.text:
+                encontradas.add(aba)
+    return encontradas
+
+
+# ---------------------------------------------------------------- valores
+
+
+class ErroExcel(str):
+    """Valor de erro (#DIV/0!, #N/A...), propagado como no Excel"""
+
+
+ERRO_VALOR = ErroExcel('#VALUE!')
+ERRO_DIV0 = ErroExcel('#DIV/0!')
+ERRO_NA = ErroExcel('#N/A')
+ERRO_REF = ErroExcel('#REF!')
+ERRO_CICLO = ErroExcel('#CICLO!')
+
+
+class FormulaNaoSuportada(ValueError):
+    """Construção ou função fora do subconjunto avaliado"""
+
+
+def _numero(valor):
+    """Coerção numérica do Excel (vazio = 0); ErroExcel se não for possível"""
+    if isinstance(valor, ErroExcel):
+        return valor
+    if valor is None or valor == '':
+        return 0
+    if isinstance(valor, bool):
+        return int(valor)
+    if isinstance(valor, (int, float)):
+        return valor
+    try:
+        return float(str(valor).strip())
+    except ValueError:
+        return ERRO_VALOR
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'TRUE' if valor else 'FALSE'
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _logico(valor):
+    if isinstance(valor, str) and not isinstance(valor, ErroExcel):
+        if valor.upper() in ('TRUE', 'FALSE'):
+            return valor.upper() == 'TRUE'
+        return ERRO_VALOR
+    numero = _numero(valor)
+    return numero if isinstance(numero, ErroExcel) else bool(numero)
+
+
+def _planos(argumentos):
+    """Valores de argumentos que podem ser faixas (listas de linhas) ou escalares"""
+    for argumento in argumentos:
+        if isinstance(argumento, list):
+            for linha in argumento:
+                yield from linha
+        else:
+            yield argumento
+
+
+def _numeros_da_faixa(argumentos):
+    """Números para SOMA/MÁXIMO...: em faixas, textos e vazios são ignorados"""
+    for argumento in argumentos:
+        if isinstance(argumento, list):
+            for valor in _planos([argumento]):
+                if isinstance(valor, ErroExcel):
+                    yield valor
+                elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                    yield valor
+        else:
+            yield _numero(argumento)
+
+
+def _criterio(criterio):
+    """Predicado de SOMASE/CONT.SE: '>=5', '<>x', 'a*b', 10..."""
+    if not isinstance(criterio, str):
+        alvo = _numero(criterio)
+        return lambda valor: _numero(valor) == alvo if valor not in (None, '') else False
+
+    for operador in ('>=', '<=', '<>', '>', '<', '='):
+        if criterio.startswith(operador):
+            resto = criterio[len(operador):]
+            break
+    else:
+        operador, resto = '=', criterio
+
+    numero = _numero(resto) if resto != '' else ERRO_VALOR
+    if not isinstance(numero, ErroExcel):
+        def comparar(valor):
+            valor = _numero(valor) if isinstance(valor, (int, float)) or _eh_numero(valor) else None
+            if valor is None:
+                return operador == '<>'
+            return _COMPARACOES[operador](valor, numero)
+        return comparar
+
+    padrao = resto.lower()
+    if operador in ('=', '<>') and any(c in padrao for c in '*?'):
+        def casar(valor):
+            casou = fnmatch.fnmatchcase(_texto(valor).lower(), padrao)
+            return casou if operador == '=' else not casou
+        return casar
+    return lambda valor: _COMPARACOES[operador](_texto(valor).lower(), padrao)
+
+
+def _eh_numero(valor):
+    return not isinstance(_numero(valor), ErroExcel) and valor not in (None, '')
+
+
+_COMPARACOES = {
+    '=': lambda a, b: a == b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+def _comparar(operador, a, b):
+    """Comparação do Excel: números < textos < lógicos; textos sem diferenciar maiúsculas"""
+    def chave(valor):
+        if valor is None:
+            return (0, 0)
+        if isinstance(valor, bool):
+            return (2, valor)
+        if isinstance(valor, (int, float)):
+            return (0, valor)
+        return (1, str(valor).lower())
+
+    a = '' if a is None and isinstance(b, str) else a
+    b = '' if b is None and isinstance(a, str) else b
+    return _COMPARACOES[operador](chave(a), chave(b))
+
+
+def _somases(faixa_soma, pares, contar=False):
+    predicados = [(faixa, _criterio(criterio)) for faixa, criterio in pares]
+    valores = list(_planos([faixa_soma])) if faixa_soma is not None else None
+    colunas = [list(_planos([faixa])) for faixa, _ in predicados]
+    total = 0
+    for indice in range(len(colunas[0]) if colunas else 0):
+        if all(predicado(coluna[indice]) for coluna, (_, predicado) in zip(colunas, predicados)):
+            if contar:
+                total += 1
+            else:
+                valor = valores[indice] if indice < len(valores) else None
+                if isinstance(valor, ErroExcel):
+                    return valor
+                if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                    total += valor
+    return total
+
+
+def _procv(valor, tabela, coluna, aproximado=True):
+    coluna = int(_numero(coluna))
+    if not isinstance(tabela, list) or not 1 <= coluna <= (len(tabela[0]) if tabela else 0):
+        return ERRO_REF
+    if _logico(aproximado) is True:
+        raise FormulaNaoSuportada('PROCV/VLOOKUP com correspondência aproximada')
+    for linha in tabela:
+        if not isinstance(linha[0], ErroExcel) and _comparar('=', linha[0], valor):
+            return linha[coluna - 1]
+    return ERRO_NA
+
+
+def _arredondar(valor, casas=0):
+    valor, casas = _numero(valor), int(_numero(casas))
+    # Meio para longe do zero, como o Excel (round() do Python arredonda para o par)
+    fator = 10 ** casas
+    return int(abs(valor) * fator + 0.5 + 1e-9) / fator * (1 if valor >= 0 else -1)
+
+
+def _media(argumentos):
+    numeros = list(_numeros_da_faixa(argumentos))
+    return sum(numeros) / len(numeros) if numeros else ERRO_DIV0
+
+
+# Funções com argumentos já avaliados (faixas chegam como listas de linhas)
+FUNCOES = {
+    'SUM': lambda *a: sum(_numeros_da_faixa(a)),
+    'MIN': lambda *a: min(_numeros_da_faixa(a), default=0),
+    'MAX': lambda *a: max(_numeros_da_faixa(a), default=0),
+    'AVERAGE': lambda *a: _media(a),
+    'COUNT': lambda *a: sum(1 for v in _planos(a) if isinstance(v, (int, float)) and not isinstance(v, bool)),
+    'COUNTA': lambda *a: sum(1 for v in _planos(a) if v not in (None, '')),
+    'ABS': lambda v: abs(_numero(v)),
+    'INT': lambda v: int(_numero(v) // 1),
+    'ROUND': _arredondar,
+    'AND': lambda *a: all(_logico(v) for v in _planos(a)),
+    'OR': lambda *a: any(_logico(v) for v in _planos(a)),
+    'NOT': lambda v: not _logico(v),
+    'SUMIF': lambda faixa, criterio, soma=None: _somases(soma if soma is not None else faixa, [(faixa, criterio)]),
+    'SUMIFS': lambda soma, *pares: _somases(soma, list(zip(pares[::2], pares[1::2]))),
+    'COUNTIF': lambda faixa, criterio: _somases(None, [(faixa, criterio)], contar=True),
+    'COUNTIFS': lambda *pares: _somases(None, list(zip(pares[::2], pares[1::2])), contar=True),
+    'VLOOKUP': _procv,
+    'CONCATENATE': lambda *a: ''.join(_texto(v) for v in a),
+    'CONCAT': lambda *a: ''.join(_texto(v) for v in _planos(a)),
+    'UPPER': lambda v: _texto(v).upper(),
+    'LOWER': lambda v: _texto(v).lower(),
+    'TRIM': lambda v: ' '.join(_texto(v).split()),
+    'LEFT': lambda v, n=1: _texto(v)[:int(_numero(n))],
+    'RIGHT': lambda v, n=1: _texto(v)[-int(_numero(n)):] if int(_numero(n)) else '',
+    'MID': lambda v, inicio, n: _texto(v)[int(_numero(inicio)) - 1:int(_numero(inicio)) - 1 + int(_numero(n))],
+    'LEN': lambda v: len(_texto(v)),
+    'VALUE': lambda v: _numero(v),
+}
+
+# Funções que avaliam os próprios argumentos (curto-circuito)
+FUNCOES_PREGUICOSAS = {'IF', 'IFERROR'}
+
+
+# ---------------------------------------------------------------- compilação
+
+
+class Formula:
+    """Fórmula compilada: árvore da expressão e referências lidas"""
+
+    __slots__ = ('texto', 'arvore', 'celulas', 'faixas', 'erro')
+
+    def __init__(self, texto, aba_padrao):
+        self.texto = texto
+        self.celulas = set()      # (aba, linha, coluna)
+        self.faixas = []          # (aba, linha1, coluna1, linha2, coluna2), None = aba inteira
+        self.erro = None
+        try:
+            self.arvore = _Compilador(texto, aba_padrao, self).compilar()
+        except FormulaNaoSuportada as e:
+            self.arvore = None
+            self.erro = str(e)
+
+
+class _Compilador:
+    """Análise da fórmula (tokens do openpyxl) para uma árvore de tuplas"""
+
+    PRECEDENCIA = {'&': 1, '=': 0, '<>': 0, '<': 0, '>': 0, '<=': 0, '>=': 0,
+                   '+': 2, '-': 2, '*': 3, '/': 3, '^': 4}
+
+    def __init__(self, texto, aba_padrao, formula):
+        self.tokens = [
+            token for token in Tokenizer(texto).items if token.type != Token.WSPACE
+        ]
+        self.posicao = 0
+        self.aba_padrao = aba_padrao
+        self.formula = formula
+
+    def _atual(self):
+        return self.tokens[self.posicao] if self.posicao < len(self.tokens) else None
+
+    def compilar(self):
+        if not self.tokens:
+            raise FormulaNaoSuportada('Fórmula vazia')
+        arvore = self._expressao(0)
+        if self._atual() is not None:
+            raise FormulaNaoSuportada(f"Token inesperado: {self._atual().value}")
+        return arvore
+
+    def _expressao(self, precedencia_minima):
+        esquerda = self._unario()
+        while True:
+            token = self._atual()
+            if token is None or token.type != Token.OP_IN:
+                return esquerda
+            precedencia = self.PRECEDENCIA.get(token.value)
+            if precedencia is None:
+                raise FormulaNaoSuportada(f"Operador não suportado: {token.value}")
+            if precedencia < precedencia_minima:
+                return esquerda
+            self.posicao += 1
+            # ^ também é associativo à esquerda no Excel
+            esquerda = ('op', token.value, esquerda, self._expressao(precedencia + 1))
+
+    def _unario(self):
+        token = self._atual()
+        if token is not None and token.type == Token.OP_PRE:
+            self.posicao += 1
+            operando = self._unario()
+            return ('neg', operando) if token.value == '-' else operando
+        valor = self._primario()
+        while self._atual() is not None and self._atual().type == Token.OP_POST:
+            self.posicao += 1
+            valor = ('op', '/', valor, ('valor', 100))
+        return valor
+
+    def _primario(self):
+        token = self._atual()
+        if token is None:
+            raise FormulaNaoSuportada('Fórmula incompleta')
+        self.posicao += 1
+
+        if token.type == Token.OPERAND:
+            if token.subtype == Token.NUMBER:
+                numero = float(token.value)
+                return ('valor', int(numero) if numero.is_integer() else numero)
+            if token.subtype == Token.TEXT:
+                return ('valor', token.value[1:-1].replace('""', '"'))
+            if token.subtype == Token.LOGICAL:
+                return ('valor', token.value.upper() == 'TRUE')
+            if token.subtype == Token.ERROR:
+                return ('valor', ErroExcel(token.value))
+            return self._referencia(token.value)
+
+        if token.type == Token.FUNC and token.subtype == Token.OPEN:
+            nome = token.value[:-1].upper().replace('_XLFN.', '').replace('_XLWS.', '')
+            if nome not in FUNCOES and nome not in FUNCOES_PREGUICOSAS:
+                raise FormulaNaoSuportada(f"Função não suportada: {nome}")
+            return ('funcao', nome, self._argumentos())
+
+        if token.type == Token.PAREN and token.subtype == Token.OPEN:
+            valor = self._expressao(0)
+            fechamento = self._atual()
+            if fechamento is None or fechamento.type != Token.PAREN:
+                raise FormulaNaoSuportada('Parêntese sem fechamento')
+            self.posicao += 1
+            return valor
+
+        raise FormulaNaoSuportada(f"Construção não suportada: {token.value}")
+
+    def _argumentos(self):
+        argumentos = []
+        while True:
+            token = self._atual()
+            if token is None:
+                raise FormulaNaoSuportada('Função sem fechamento')
+            if token.type == Token.FUNC and token.subtype == Token.CLOSE:
+                self.posicao += 1
+                if argumentos:
+                    argumentos.append(('vazio',))
+                return argumentos
+            if token.type == Token.SEP and token.subtype == Token.ARG:
+                self.posicao += 1
+                argumentos.append(('vazio',))
+                continue
+
+            argumentos.append(self._expressao(0))
+            token = self._atual()
+            if token is not None and token.type == Token.SEP and token.subtype == Token.ARG:
+                self.posicao += 1
+                continue
+            if token is not None and token.type == Token.FUNC and token.subtype == Token.CLOSE:
+                self.posicao += 1
+                return argumentos
+            raise FormulaNaoSuportada('Argumentos malformados')
+
+    def _referencia(self, texto):
+        aba, separador, endereco = texto.rpartition('!')
+        if not separador:
+            aba = self.aba_padrao
+        elif aba.startswith("'") and aba.endswith("'"):
+            aba = aba[1:-1].replace("''", "'")
+        if aba.startswith('['):
+            raise FormulaNaoSuportada('Referência a outro arquivo')
+        try:
+            coluna1, linha1, coluna2, linha2 = range_boundaries(endereco.replace('$', ''))
+        except ValueError:
+            raise FormulaNaoSuportada(f"Referência não suportada: {texto}")
+
+        if ':' not in endereco:
+            self.formula.celulas.add((aba, linha1, coluna1))
+            return ('celula', aba, linha1, coluna1)
+        faixa = (aba, linha1, coluna1, linha2, coluna2)
+        self.formula.faixas.append(faixa)
+        return ('faixa',) + faixa
+
+
+# ---------------------------------------------------------------- motor
+
+
+class MotorFormulas:
+    """
+    Células de todas as abas de um xlsx, com as fórmulas compiladas e avaliadas
+    sob demanda. `recarregar` aplica uma nova versão do arquivo recalculando só o
+    que mudou.
+    """
+
+    def __init__(self, arquivo_excel):
+        self.arquivo_excel = arquivo_excel
+        self.lock = threading.Lock()
+        self.abas = []
+        self.dimensoes = {}                # aba -> (max_linha, max_coluna)
+        self.constantes = {}               # (aba, linha, coluna) -> valor
+        self.formulas = {}                 # (aba, linha, coluna) -> Formula
+        self.gravados = {}                 # (aba, linha, coluna) -> valor calculado no arquivo
+        self.valores = {}                  # memo: (aba, linha, coluna) -> valor avaliado
+        self.avaliacoes = 0                # fórmulas avaliadas desde a criação
+        self._montar_indices()
+        self._aplicar(*self._ler())
+
+    # -------------------------------------------------------------- leitura
+
+    def _ler(self):
+        """(abas, dimensões, constantes, textos das fórmulas, valores gravados)"""
+        constantes, textos, gravados, dimensoes = {}, {}, {}, {}
+        wb = load_workbook(self.arquivo_excel, read_only=True, data_only=False)
+        try:
+            abas = list(wb.sheetnames)
+            for aba in abas:
+                max_linha = max_coluna = 0
+                for linha in wb[aba].iter_rows():
+                    for celula in linha:
+                        valor = celula.value
+                        if valor is None:
+                            continue
+                        chave = (aba, celula.row, celula.column)
+                        max_linha = max(max_linha, celula.row)
+                        max_coluna = max(max_coluna, celula.column)
+                        if celula.data_type == 'f':
+                            textos[chave] = str(valor) if isinstance(valor, str) else None
+                        else:
+                            constantes[chave] = valor
+                dimensoes[aba] = (max_linha, max_coluna)
+        finally:
+            wb.close()
+
+        if textos:
+            # Valores já calculados pelo Excel: usados nas fórmulas não suportadas
+            wb = load_workbook(self.arquivo_excel, read_only=True, data_only=True)
+            try:
+                for aba in abas:
+                    colunas = {}
+                    for chave in textos:
+                        if chave[0] == aba:
+                            colunas.setdefault(chave[1], []).append(chave[2])
+                    if not colunas:
+                        continue
+                    for numero, linha in enumerate(wb[aba].iter_rows(values_only=True), start=1):
+                        for coluna in colunas.get(numero, ()):
+                            if coluna <= len(linha) and linha[coluna - 1] is not None:
+                                gravados[(aba, numero, coluna)] = linha[coluna - 1]
+            finally:
+                wb.close()
+        return abas, dimensoes, constantes, textos, gravados
+
+    # -------------------------------------------------------------- grafo
+
+    def _montar_indices(self):
+        self.dependentes = defaultdict(set)          # célula -> fórmulas que a leem
+        self.faixas_por_coluna = defaultdict(list)   # (aba, coluna) -> [(linha1, linha2, fórmula)]
+        self.faixas_abertas = defaultdict(list)      # aba -> [(linha1, linha2, fórmula)] (linhas inteiras)
+        self.linhas_formulas = defaultdict(list)     # (aba, coluna) -> linhas com fórmula (ordenadas)
+        self.precedentes = {}                        # fórmula -> fórmulas que ela lê
+
+    def _registrar(self, chave, formula):
+        for celula in formula.celulas:
+            self.dependentes[celula].add(chave)
+        for aba, linha1, coluna1, linha2, coluna2 in formula.faixas:
+            entrada = (linha1 or 1, linha2 or float('inf'), chave)
+            if coluna1 is None:
+                self.faixas_abertas[aba].append(entrada)
+                continue
+            for coluna in range(coluna1, coluna2 + 1):
+                self.faixas_por_coluna[(aba, coluna)].append(entrada)
+
+    def _desregistrar(self, chave, formula):
+        for celula in formula.celulas:
+            self.dependentes[celula].discard(chave)
+        for aba, linha1, coluna1, linha2, coluna2 in formula.faixas:
+            entrada = (linha1 or 1, linha2 or float('inf'), chave)
+            listas = ([self.faixas_abertas[aba]] if coluna1 is None else
+                      [self.faixas_por_coluna[(aba, c)] for c in range(coluna1, coluna2 + 1)])
+            for lista in listas:
+                lista.remove(entrada)
+
+    def _calcular_precedentes(self, chave):
+        """Fórmulas lidas por `chave` (células diretas e fórmulas dentro das faixas)"""
+        formula = self.formulas[chave]
+        precedentes = {celula for celula in formula.celulas if celula in self.formulas}
+        for aba, linha1, coluna1, linha2, coluna2 in formula.faixas:
+            max_linha, max_coluna = self.dimensoes.get(aba, (0, 0))
+            for coluna in range(coluna1 or 1, (coluna2 or max_coluna) + 1):
+                linhas = self.linhas_formulas.get((aba, coluna), ())
+                inicio = bisect_left(linhas, linha1 or 1)
+                fim = bisect_right(linhas, linha2 or max_linha)
+                precedentes.update((aba, linha, coluna) for linha in linhas[inicio:fim])
+        precedentes.discard(chave)
+        self.precedentes[chave] = precedentes
+
+    def _dependentes_de(self, celula):
+        aba, linha, coluna = celula
+        yield from self.dependentes.get(celula, ())
+        for lista in (self.faixas_por_coluna.get((aba, coluna), ()), self.faixas_abertas.get(aba, ())):
+            for linha1, linha2, chave in lista:
+                if linha1 <= linha <= linha2:
+                    yield chave
+
+    def _sujar(self, alteradas):
+        """Remove da memoização as fórmulas que dependem (transitivamente) de `alteradas`"""
+        fila = deque(alteradas)
+        sujas = set()
+        while fila:
+            celula = fila.popleft()
+            for chave in self._dependentes_de(celula):
+                if chave not in sujas:
+                    sujas.add(chave)
+                    fila.append(chave)
+        for chave in sujas | set(alteradas):
+            self.valores.pop(chave, None)
+        return sujas
+
+    # -------------------------------------------------------------- versões
+
+    def _aplicar(self, abas, dimensoes, constantes, textos, gravados):
+        """Aplica o conteúdo lido; retorna as células cujo conteúdo mudou"""
+        alteradas = set()
+        for chave in set(self.constantes) | set(constantes):
+            if self.constantes.get(chave) != constantes.get(chave):
+                alteradas.add(chave)
+
+        formulas_antes = set(self.formulas)
+        for chave in formulas_antes - set(textos):
+            self._desregistrar(chave, self.formulas.pop(chave))
+            self.precedentes.pop(chave, None)
+            alteradas.add(chave)
+        for chave, texto in textos.items():
+            atual = self.formulas.get(chave)
+            if atual is not None and atual.texto == texto:
+                continue
+            if atual is not None:
+                self._desregistrar(chave, atual)
+            formula = Formula(texto or '', chave[0])
+            self.formulas[chave] = formula
+            self._registrar(chave, formula)
+            alteradas.add(chave)
+
+        self.abas, self.dimensoes, self.constantes = abas, dimensoes, constantes
+        self.gravados = gravados
+        estrutura_mudou = formulas_antes != set(self.formulas)
+        if estrutura_mudou:
+            self.linhas_formulas = defaultdict(list)
+            for aba, linha, coluna in sorted(self.formulas):
+                self.linhas_formulas[(aba, coluna)].append(linha)
+        for chave in self.formulas:
+            if estrutura_mudou or chave in alteradas:
+                self._calcular_precedentes(chave)
+        return alteradas
+
+    def recarregar(self):
+        """Relê o arquivo e invalida só o que depende das células alteradas"""
+        alteradas = self._aplicar(*self._ler())
+        sujas = self._sujar(alteradas)
+        logger.info(
+            f"Fórmulas de {self.arquivo_excel}: {len(alteradas)} células alteradas, "
+            f"{len(sujas)} fórmulas a recalcular"
+        )
+        return sujas
+
+    def alterar(self, alteracoes):
+        """Altera constantes em memória ({(aba, linha, coluna): valor}); retorna as fórmulas sujas"""
+        for chave, valor in alteracoes.items():
+            if valor is None:
+                self.constantes.pop(chave, None)
+            else:
+                self.constantes[chave] = valor
+        return self._sujar(alteracoes)
+
+    # -------------------------------------------------------------- avaliação
+
+    def valor(self, aba, linha, coluna):
+        chave = (aba, linha, coluna)
+        if chave not in self.formulas:
+            return self.constantes.get(chave)
+        if chave not in self.valores:
+            self._avaliar_pendentes(chave)
+        return self.valores[chave]
+
+    def _avaliar_pendentes(self, chave):
+        """Avalia `chave` e as fórmulas ainda não avaliadas de que ela depende (pilha explícita)"""
+        pilha = [chave]
+        no_caminho = set()
+        while pilha:
+            atual = pilha[-1]
+            if atual in self.valores:
+                pilha.pop()
+                continue
+            if atual not in no_caminho:
+                no_caminho.add(atual)
+                pendentes = [p for p in self.precedentes[atual] if p not in self.valores]
+                # Dependência circular: a referência de volta vale #CICLO!
+                pilha.extend(p for p in pendentes if p not in no_caminho)
+                continue
+            pilha.pop()
+            no_caminho.discard(atual)
+            self.valores[atual] = self._avaliar_formula(atual)
+
+    def _avaliar_formula(self, chave):
+        self.avaliacoes += 1
+        formula = self.formulas[chave]
+        if formula.arvore is None:
+            return self.gravados.get(chave)
+        try:
+            valor = self._avaliar(formula.arvore)
+        except FormulaNaoSuportada as e:
+            formula.erro = str(e)
+            return self.gravados.get(chave)
+        except (TypeError, ValueError, ArithmeticError):
+            valor = ERRO_VALOR
+        if isinstance(valor, list):   # faixa como resultado: primeira célula
+            valor = valor[0][0] if valor and valor[0] else None
+        return valor
+
+    def _celula(self, aba, linha, coluna):
+        chave = (aba, linha, coluna)
+        if chave in self.formulas:
+            return self.valores.get(chave, ERRO_CICLO)
+        return self.constantes.get(chave)
+
+    def _avaliar(self, no):
+        tipo = no[0]
+        if tipo == 'valor':
+            return no[1]
+        if tipo == 'vazio':
+            return None
+        if tipo == 'celula':
+            return self._celula(*no[1:])
+        if tipo == 'faixa':
+            aba, linha1, coluna1, linha2, coluna2 = no[1:]
+            if aba not in self.dimensoes:
+                return ERRO_REF
+            max_linha, max_coluna = self.dimensoes[aba]
+            return [
+                [self._celula(aba, linha, coluna) for coluna in range(coluna1 or 1, (coluna2 or max_coluna) + 1)]
+                for linha in range(linha1 or 1, (linha2 or max_linha) + 1)
+            ]
+        if tipo == 'neg':
+            valor = _numero(self._escalar(self._avaliar(no[1])))
+            return valor if isinstance(valor, ErroExcel) else -valor
+        if tipo == 'op':
+            return self._operacao(no[1], self._escalar(self._avaliar(no[2])), self._escalar(self._avaliar(no[3])))
+        return self._funcao(no[1], no[2])
+
+    @staticmethod
+    def _escalar(valor):
+        if isinstance(valor, list):
+            return valor[0][0] if valor and valor[0] else None
+        return valor
+
+    @staticmethod
+    def _operacao(operador, a, b):
+        for valor in (a, b):
+            if isinstance(valor, ErroExcel):
+                return valor
+        if operador == '&':
+            return _texto(a) + _texto(b)
+        if operador in _COMPARACOES:
+            return _comparar(operador, a, b)
+
+        a, b = _numero(a), _numero(b)
+        for valor in (a, b):
+            if isinstance(valor, ErroExcel):
+                return valor
+        if operador == '+':
+            return a + b
+        if operador == '-':
+            return a - b
+        if operador == '*':
+            return a * b
+        if operador == '/':
+            return ERRO_DIV0 if b == 0 else a / b
+        return a ** b
+
+    def _funcao(self, nome, argumentos):
+        if nome == 'IF':
+            condicao = _logico(self._escalar(self._avaliar(argumentos[0])))
+            if isinstance(condicao, ErroExcel):
+                return condicao
+            if condicao:
+                return self._avaliar(argumentos[1]) if len(argumentos) > 1 else True
+            return self._avaliar(argumentos[2]) if len(argumentos) > 2 else False
+        if nome == 'IFERROR':
+            valor = self._escalar(self._avaliar(argumentos[0]))
+            return self._avaliar(argumentos[1]) if isinstance(valor, ErroExcel) else valor
+
+        valores = [self._avaliar(argumento) for argumento in argumentos]
+        if nome not in ('SUMIF', 'SUMIFS', 'COUNTIF', 'COUNTIFS', 'VLOOKUP', 'AVERAGE', 'SUM', 'MIN',
+                        'MAX', 'COUNT', 'COUNTA', 'AND', 'OR', 'CONCAT'):
+            valores = [self._escalar(valor) for valor in valores]
+            for valor in valores:
+                if isinstance(valor, ErroExcel):
+                    return valor
+        resultado = FUNCOES[nome](*valores)
+        return resultado
+
+    # -------------------------------------------------------------- saída
+
+    def linhas(self, aba, min_linha=1, max_coluna=None):
+        """Linhas da aba como iter_rows(values_only=True), com as fórmulas avaliadas"""
+        max_linha, colunas = self.dimensoes.get(aba, (0, 0))
+        colunas = max_coluna or colunas
+        for linha in range(min_linha, max_linha + 1):
+            yield tuple(self._saida(self.valor(aba, linha, coluna)) for coluna in range(1, colunas + 1))
+
+    @staticmethod
+    def _saida(valor):
+        # Erros saem como texto (o data_only do openpyxl também devolve '#N/A' etc.)
+        return str(valor) if isinstance(valor, ErroExcel) else valor
+
+    def nao_suportadas(self):
+        """Fórmulas fora do subconjunto avaliado: {'Aba!A1': motivo}"""
+        return {
+            f"{aba}!{get_column_letter(coluna)}{linha}": formula.erro
+            for (aba, linha, coluna), formula in self.formulas.items() if formula.erro
+        }
+
+
+# Um motor por arquivo: a versão seguinte do mesmo caminho só recalcula o que mudou.
+# Cada motor guarda todas as células do arquivo, então só os mais recentes ficam (LRU).
+MAX_MOTORES = int(os.environ.get('IR_FORMULA_ENGINES', 2))
+_motores = OrderedDict()
+_motores_lock = threading.Lock()
+_locks_motores = {}   # caminho -> lock da montagem/recarga do motor
+
+
+def motor_formulas(arquivo_excel):
+    """MotorFormulas do arquivo, atualizado para o conteúdo atual (use com `motor.lock`)"""
+    caminho = os.path.abspath(arquivo_excel)
+    stat = os.stat(caminho)
+
+    # Montar ou recarregar um arquivo não segura os demais (outros anos)
+    with _motores_lock:
+        lock_arquivo = _locks_motores.setdefault(caminho, threading.Lock())
+
+    with lock_arquivo:
+        with _motores_lock:
+            motor, assinatura = _motores.get(caminho, (None, None))
+        if motor is None:
+            motor = MotorFormulas(arquivo_excel)
+        elif assinatura != (stat.st_mtime_ns, stat.st_size):
+            with motor.lock:
+                motor.recarregar()
+
+        with _motores_lock:
+            _motores[caminho] = (motor, (stat.st_mtime_ns, stat.st_size))
+            _motores.move_to_end(caminho)
+            while len(_motores) > max(1, MAX_MOTORES):
+                _motores.popitem(last=False)
+        return motor
+
+
+def verificar():
+    """
+    Autoverificação da detecção: planilhas geradas na hora (openpyxl não grava
+    valores calculados) com e sem fórmulas, com filtro aplicado (`<filters>`,
+    `<filterColumn>`). Retorna a lista de falhas.
+    """
+    import tempfile
+    from openpyxl import Workbook
+    from openpyxl.worksheet.filters import FilterColumn, Filters
+
+    def planilha(caminho, formula, filtro):
+        wb = Workbook()
+        aba = wb.active
+        aba.title = 'UNION'
+        aba.append(['CLIENTE', 'ENTRADA'])
+        aba.append(['A', 10])
+        aba.append(['B', '=B2*2' if formula else 20])
+        if filtro:
+            aba.auto_filter.ref = 'A1:B3'
+            aba.auto_filter.filterColumn.append(FilterColumn(colId=0, filters=Filters(filter=['A'])))
+        wb.save(caminho)
+
+    casos = {
+        (False, False): set(),
+        (False, True): set(),
+        (True, False): {'UNION'},
+        (True, True): {'UNION'},
+    }
+    falhas = []
+    with tempfile.TemporaryDirectory() as diretorio:
+        for (formula, filtro), esperado in casos.items():
+            caminho = os.path.join(diretorio, f'f{int(formula)}_{int(filtro)}.xlsx')
+            planilha(caminho, formula, filtro)
+            try:
+                obtido = abas_sem_valores(caminho, ['UNION'])
+            except Exception as e:
+                obtido = repr(e)
+            if obtido != esperado:
+                falhas.append(f"formula={formula} filtro={filtro}: esperado {esperado}, obtido {obtido}")
+    return falhas
+
+
+def main():
+    """
+    Uso: python Scripts/avaliacao_formulas.py <planilha.xlsx>
+         python Scripts/avaliacao_formulas.py --verificar
+    """
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+
+    if sys.argv[1] == '--verificar':
+        falhas = verificar()
+        print('\n'.join(falhas) or 'OK: detecção de fórmulas sem valor')
+        sys.exit(1 if falhas else 0)
+
+    inicio = time.monotonic()
+    motor = MotorFormulas(sys.argv[1])
+    leitura = time.monotonic() - inicio
+    for aba in motor.abas:
+        for _ in motor.linhas(aba):
+            pass
+    print(json.dumps({
+        'abas_sem_valores': sorted(abas_sem_valores(sys.argv[1], motor.abas)),
+        'formulas': len(motor.formulas),
+        'avaliadas': motor.avaliacoes,
+        'leitura_segundos': round(leitura, 2),
+        'avaliacao_segundos': round(time.monotonic() - inicio - leitura, 2),
+        'nao_suportadas': motor.nao_suportadas(),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
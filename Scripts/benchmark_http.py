@@ -0,0 +1,108 @@
+"""
+Benchmark de Bytes Transferidos
+Simula visitas à página (HTML, CSS, JS, logo) e buscas de autocompletar contra o
+app Flask, com e sem cache HTTP/compressão, e compara os bytes de corpo trafegados.
+
+Uso (na raiz do projeto): python Scripts/benchmark_http.py [visitas] [buscas_por_visita]
+"""
+
+import re
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+CONSULTAS = ['an', 'and', 'andr', 'maria', 'maria da', 'sil', 'jose', '840', '8405']
+
+
+class Navegador:
+    """
+    Cliente com o comportamento relevante de um navegador:
+    - com_cache: guarda ETags, revalida com If-None-Match e não pede de novo
+      o que veio com Cache-Control immutable
+    - comprimir: envia Accept-Encoding
+    """
+
+    def __init__(self, cliente, com_cache, comprimir):
+        self.cliente = cliente
+        self.com_cache = com_cache
+        self.comprimir = comprimir
+        self.etags = {}
+        self.imutaveis = set()
+        self.bytes = 0
+        self.requisicoes = 0
+        self.respostas_304 = 0
+        self.ultimo_html = b''
+
+    def get(self, url):
+        if self.com_cache and url in self.imutaveis:
+            return None
+
+        headers = {}
+        if self.comprimir:
+            headers['Accept-Encoding'] = 'br, gzip'
+        if self.com_cache and url in self.etags:
+            headers['If-None-Match'] = self.etags[url]
+
+        response = self.cliente.get(url, headers=headers)
+        self.requisicoes += 1
+        self.bytes += len(response.data)
+        if response.status_code == 304:
+            self.respostas_304 += 1
+
+        if self.com_cache:
+            if response.headers.get('ETag'):
+                self.etags[url] = response.headers['ETag']
+            if 'immutable' in response.headers.get('Cache-Control', ''):
+                self.imutaveis.add(url)
+        return response
+
+    def visitar(self, buscas):
+        html = self.get('/')
+        if html is not None and html.status_code == 200:
+            self.ultimo_html = self._descomprimir(html.get_data(), html.headers.get('Content-Encoding'))
+        # Ativos referenciados pelo HTML (com ?v=<hash> quando versionados)
+        for alvo in re.findall(rb'(?:src|href)="([\w\-./?=]+)"', self.ultimo_html):
+            self.get('/' + alvo.decode())
+        for consulta in CONSULTAS[:buscas]:
+            self.get(f'/api/buscar?q={consulta}&limite=10')
+
+    @staticmethod
+    def _descomprimir(dados, codificacao):
+        if not codificacao:
+            return dados
+        if codificacao == 'br':
+            import brotli
+            return brotli.decompress(dados)
+        import gzip
+        return gzip.decompress(dados)
+
+
+def main():
+    visitas = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    buscas = int(sys.argv[2]) if len(sys.argv) > 2 else len(CONSULTAS)
+
+    import simple_server
+
+    cliente = simple_server.app.test_client()
+    cenarios = [
+        ('sem cache/compressão', Navegador(cliente, com_cache=False, comprimir=False)),
+        ('só compressão', Navegador(cliente, com_cache=False, comprimir=True)),
+        ('cache + compressão', Navegador(cliente, com_cache=True, comprimir=True)),
+    ]
+
+    print(f"{visitas} visitas, {buscas} buscas por visita")
+    base = None
+    for nome, navegador in cenarios:
+        for _ in range(visitas):
+            navegador.visitar(buscas)
+        base = base or navegador.bytes
+        print(
+            f"{nome:<22} {navegador.bytes:>10,} bytes  {navegador.requisicoes:>4} requisições  "
+            f"{navegador.respostas_304:>4} x 304  ({navegador.bytes / base:.1%} do original)"
+        )
+
+
+if __name__ == "__main__":
+    main()
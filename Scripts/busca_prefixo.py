@@ -0,0 +1,112 @@
+"""
+Busca por Prefixo
+Índice de autocompletar sobre o CPF normalizado e os tokens do nome sem acentos.
+Arrays ordenados + bisect: cada consulta custa O(log n) mais os candidatos encontrados.
+"""
+
+import bisect
+import heapq
+import re
+import unicodedata
+
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+
+_SO_CPF = re.compile(r'[\d.\-/\s]+')
+
+
+def normalizar_texto(texto):
+    """Minúsculas e sem acentos ('João' -> 'joao')"""
+    decomposto = unicodedata.normalize('NFKD', str(texto or ''))
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def tokens(texto):
+    return re.findall(r'[a-z0-9]+', normalizar_texto(texto))
+
+
+def cpf_completo(cpf):
+    """CPF com os 11 dígitos (célula numérica perde os zeros à esquerda)"""
+    return cpf.zfill(11) if cpf.isdigit() else cpf
+
+
+def termos_consulta(consulta):
+    """Termos de busca: CPF parcial com pontuação vira um único termo de dígitos"""
+    consulta = str(consulta or '').strip()
+    if _SO_CPF.fullmatch(consulta):
+        digitos = re.sub(r'\D', '', consulta)
+        return [digitos] if digitos else []
+    return tokens(consulta)
+
+
+class IndicePrefixo:
+    """
+    Chaves ordenadas (CPF e cada token do nome) apontando para o cliente.
+    Indexa a primeira ocorrência de cada CPF, como a busca exata. Os resultados
+    trazem o CPF com 11 dígitos, a forma aceita pela busca exata e pelo PDF.
+    """
+
+    def __init__(self, clientes):
+        self.resultados = []   # {'cpf', 'cliente', 'empreendimento', 'unidade'} por CPF distinto
+        self._nomes = []       # nome normalizado, para priorizar quem começa com a consulta
+        pares = []
+        vistos = set()
+
+        for dados in clientes:
+            cpf = dados['cpf']
+            if cpf in vistos:
+                continue
+            vistos.add(cpf)
+
+            posicao = len(self.resultados)
+            self.resultados.append({
+                'cpf': cpf_completo(cpf),
+                'cliente': dados['cliente'],
+                'empreendimento': dados['empreendimento'],
+                'unidade': dados['unidade']
+            })
+            self._nomes.append(normalizar_texto(dados['cliente']))
+            pares.append((cpf, posicao))
+            if cpf_completo(cpf) != cpf:
+                # Célula numérica perdeu os zeros à esquerda: aceita também o CPF completo
+                pares.append((cpf_completo(cpf), posicao))
+            pares.extend((token, posicao) for token in set(tokens(dados['cliente'])))
+
+        pares.sort()
+        self._chaves = [chave for chave, _ in pares]
+        self._posicoes = [posicao for _, posicao in pares]
+
+    def __len__(self):
+        return len(self.resultados)
+
+    def _faixa(self, prefixo):
+        """Posições dos clientes com alguma chave começando por `prefixo`"""
+        inicio = bisect.bisect_left(self._chaves, prefixo)
+        # Chaves são [a-z0-9]: '\x7f' é maior que qualquer continuação
+        fim = bisect.bisect_left(self._chaves, prefixo + '\x7f', inicio)
+        return self._posicoes[inicio:fim]
+
+    def buscar(self, consulta, limite=LIMITE_PADRAO):
+        """
+        Até `limite` clientes em que cada termo da consulta é prefixo do CPF ou de
+        algum token do nome. Nomes que começam com a consulta vêm primeiro; depois,
+        ordem da planilha.
+        """
+        termos = termos_consulta(consulta)
+        if not termos:
+            return []
+
+        # Interseção começando pela faixa mais estreita
+        faixas = sorted((self._faixa(termo) for termo in termos), key=len)
+        candidatos = set(faixas[0])
+        for faixa in faixas[1:]:
+            candidatos.intersection_update(faixa)
+            if not candidatos:
+                return []
+
+        inicio_nome = ' '.join(termos)
+        melhores = heapq.nsmallest(
+            limite, candidatos,
+            key=lambda posicao: (not self._nomes[posicao].startswith(inicio_nome), posicao)
+        )
+        return [self.resultados[posicao] for posicao in melhores]
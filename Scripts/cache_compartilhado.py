@@ -0,0 +1,271 @@
+"""
+Cache Compartilhado entre Workers
+Camada de cache para valores calculados e PDFs renderizados, visível a todos os
+workers do gunicorn: o que um worker calculou, os outros reaproveitam.
+
+Backends (SHARED_CACHE):
+- sqlite[:caminho]: arquivo SQLite local (WAL), compartilhado pelos processos da máquina
+- redis://host:porta/db: servidor Redis (requer o pacote `redis`)
+- memoria: dict no próprio processo (substituto local, não compartilha entre workers)
+- desligado: sem cache
+
+As chaves incluem a versão da planilha, então uma nova versão nunca lê valores
+antigos; o que sobra é descartado pelo limite de tamanho ou pelo TTL. Falhas do
+backend viram cache miss: o cache nunca derruba uma requisição.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+try:
+    import redis  # opcional: pip install redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CAMINHO_SQLITE_PADRAO = 'output/cache/compartilhado.sqlite3'
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    chave TEXT PRIMARY KEY,
+    valor BLOB NOT NULL,
+    tamanho INTEGER NOT NULL,
+    criado REAL NOT NULL,
+    expira REAL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_criado ON cache (criado);
+"""
+
+
+class CacheCompartilhado:
+    """
+    Interface dos backends: bytes por chave (texto).
+    `obter_json`/`gravar_json` servem para valores calculados.
+    """
+
+    nome = 'desligado'
+
+    def __init__(self):
+        self._lock_metricas = threading.Lock()
+        self._acertos = 0
+        self._faltas = 0
+        self._gravacoes = 0
+        self._erros = 0
+
+    def _ler(self, chave):
+        return None
+
+    def _escrever(self, chave, valor, ttl):
+        pass
+
+    def _contar(self, campo):
+        with self._lock_metricas:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def obter(self, chave):
+        """Bytes gravados para a chave, ou None"""
+        if self.nome == 'desligado':
+            return None
+        try:
+            valor = self._ler(chave)
+        except Exception as e:
+            self._contar('_erros')
+            logger.warning(f"Cache {self.nome} indisponível na leitura: {str(e)}")
+            valor = None
+        self._contar('_acertos' if valor is not None else '_faltas')
+        return valor
+
+    def gravar(self, chave, valor, ttl=None):
+        """Grava bytes para a chave (ttl em segundos, None = até ser descartado)"""
+        if self.nome == 'desligado':
+            return
+        try:
+            self._escrever(chave, bytes(valor), ttl)
+            self._contar('_gravacoes')
+        except Exception as e:
+            self._contar('_erros')
+            logger.warning(f"Cache {self.nome} indisponível na gravação: {str(e)}")
+
+    def obter_json(self, chave):
+        valor = self.obter(chave)
+        return None if valor is None else json.loads(valor)
+
+    def gravar_json(self, chave, dados, ttl=None):
+        self.gravar(chave, json.dumps(dados, ensure_ascii=False).encode('utf-8'), ttl)
+
+    def metricas(self):
+        """Contadores deste worker (o conteúdo é compartilhado, as contagens não)"""
+        with self._lock_metricas:
+            consultas = self._acertos + self._faltas
+            return {
+                'backend': self.nome,
+                'acertos': self._acertos,
+                'faltas': self._faltas,
+                'taxa_acerto': self._acertos / consultas if consultas else 0.0,
+                'gravacoes': self._gravacoes,
+                'erros': self._erros,
+            }
+
+
+class CacheMemoria(CacheCompartilhado):
+    """Substituto local: LRU em memória, visível apenas a este processo"""
+
+    nome = 'memoria'
+
+    def __init__(self, max_bytes):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self._itens = OrderedDict()   # chave -> (valor, expira)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _ler(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            valor, expira = item
+            if expira is not None and expira < time.time():
+                self._remover(chave)
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def _remover(self, chave):
+        valor, _ = self._itens.pop(chave)
+        self._bytes -= len(valor)
+
+    def _escrever(self, chave, valor, ttl):
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+            self._itens[chave] = (valor, time.time() + ttl if ttl else None)
+            self._bytes += len(valor)
+            while self._bytes > self.max_bytes and len(self._itens) > 1:
+                self._remover(next(iter(self._itens)))
+
+
+class CacheSQLite(CacheCompartilhado):
+    """
+    Arquivo SQLite em modo WAL: leituras simultâneas de todos os workers e uma
+    escrita por vez. Acima de `max_bytes`, as entradas mais antigas são descartadas.
+    """
+
+    nome = 'sqlite'
+
+    # Gravações entre verificações do tamanho total
+    VERIFICAR_TAMANHO_A_CADA = 50
+
+    def __init__(self, caminho, max_bytes):
+        super().__init__()
+        self.caminho = Path(caminho)
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._escritas_desde_verificacao = 0
+        # Nenhuma conexão fica aberta aqui: com --preload o cache é criado no
+        # master, e os workers não podem usar conexões abertas antes do fork
+        conexao = sqlite3.connect(self.caminho, timeout=5)
+        try:
+            conexao.executescript(ESQUEMA)
+        finally:
+            conexao.close()
+
+    def _conexao(self):
+        """Conexão desta thread neste processo, aberta no primeiro uso"""
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            # A herdada do processo pai (fork) é abandonada sem fechar
+            conexao = sqlite3.connect(self.caminho, timeout=5, isolation_level=None)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexao, self._local.pid = conexao, pid
+        return self._local.conexao
+
+    def _ler(self, chave):
+        linha = self._conexao().execute(
+            'SELECT valor FROM cache WHERE chave = ? AND (expira IS NULL OR expira >= ?)',
+            (chave, time.time())
+        ).fetchone()
+        return None if linha is None else bytes(linha[0])
+
+    def _escrever(self, chave, valor, ttl):
+        agora = time.time()
+        self._conexao().execute(
+            'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)',
+            (chave, valor, len(valor), agora, agora + ttl if ttl else None)
+        )
+        with self._lock_metricas:
+            self._escritas_desde_verificacao += 1
+            verificar = self._escritas_desde_verificacao >= self.VERIFICAR_TAMANHO_A_CADA
+            if verificar:
+                self._escritas_desde_verificacao = 0
+        if verificar:
+            self._descartar(agora)
+
+    def _descartar(self, agora):
+        """Remove expirados e, acima do limite, os mais antigos"""
+        conexao = self._conexao()
+        conexao.execute('DELETE FROM cache WHERE expira < ?', (agora,))
+        total, = conexao.execute('SELECT COALESCE(SUM(tamanho), 0) FROM cache').fetchone()
+        if total <= self.max_bytes:
+            return
+
+        excesso = total - self.max_bytes
+        removidas = []
+        for chave, tamanho in conexao.execute('SELECT chave, tamanho FROM cache ORDER BY criado'):
+            removidas.append((chave,))
+            excesso -= tamanho
+            if excesso <= 0:
+                break
+        conexao.executemany('DELETE FROM cache WHERE chave = ?', removidas)
+        logger.info(f"Cache compartilhado: {len(removidas)} entradas antigas descartadas")
+
+
+class CacheRedis(CacheCompartilhado):
+    """Servidor Redis (ou compatível); o descarte fica com a política do servidor"""
+
+    nome = 'redis'
+
+    def __init__(self, url):
+        super().__init__()
+        self._cliente = redis.Redis.from_url(url, socket_timeout=1)
+
+    def _ler(self, chave):
+        return self._cliente.get(chave)
+
+    def _escrever(self, chave, valor, ttl):
+        self._cliente.set(chave, valor, ex=int(ttl) if ttl else None)
+
+
+def criar_cache(configuracao, max_bytes):
+    """Backend a partir de SHARED_CACHE ('sqlite[:caminho]', 'redis://...', 'memoria', 'desligado')"""
+    configuracao = (configuracao or 'desligado').strip()
+
+    if configuracao.startswith(('redis://', 'rediss://', 'unix://')):
+        if redis is None:
+            logger.warning("SHARED_CACHE aponta para Redis, mas o pacote redis não está instalado; cache desligado")
+            return CacheCompartilhado()
+        return CacheRedis(configuracao)
+
+    if configuracao == 'sqlite' or configuracao.startswith('sqlite:'):
+        caminho = configuracao.partition(':')[2] or CAMINHO_SQLITE_PADRAO
+        try:
+            return CacheSQLite(caminho, max_bytes)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Cache SQLite indisponível em {caminho} ({e}); cache desligado")
+            return CacheCompartilhado()
+
+    if configuracao == 'memoria':
+        return CacheMemoria(max_bytes)
+
+    if configuracao != 'desligado':
+        logger.warning(f"SHARED_CACHE desconhecido: {configuracao}; cache desligado")
+    return CacheCompartilhado()
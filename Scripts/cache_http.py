@@ -0,0 +1,143 @@
+"""
+Cache HTTP e Compressão
+Validadores (ETag/Last-Modified), respostas 304, cache imutável para arquivos
+estáticos versionados por hash e compressão gzip/brotli de respostas de texto.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from pathlib import Path
+
+try:
+    import brotli  # opcional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Respostas de texto menores que isso não compensam a compressão
+MIN_COMPRESSAO = 512
+
+TIPOS_COMPRIMIVEIS = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson',
+    'image/svg+xml'
+}
+
+# Arquivos com ?v=<hash> correto nunca mudam: o navegador não precisa revalidar
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'no-cache'
+
+
+def escolher_codificacao(accept_encodings):
+    """'br', 'gzip' ou None a partir do Accept-Encoding (werkzeug Accept)"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def comprimir(dados, codificacao):
+    if codificacao == 'br':
+        return brotli.compress(dados, quality=5)
+    return gzip.compress(dados, compresslevel=6, mtime=0)
+
+
+def comprimir_resposta(response, accept_encodings):
+    """
+    Comprime no lugar uma resposta de texto já montada (after_request).
+    Respostas em streaming, já codificadas ou pequenas passam intactas.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in TIPOS_COMPRIMIVEIS):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    codificacao = escolher_codificacao(accept_encodings)
+    if codificacao is None:
+        return response
+
+    dados = response.get_data()
+    if len(dados) < MIN_COMPRESSAO:
+        return response
+
+    response.set_data(comprimir(dados, codificacao))
+    response.headers['Content-Encoding'] = codificacao
+    # A representação comprimida é equivalente, não idêntica: ETag fraco
+    etag, fraco = response.get_etag()
+    if etag and not fraco:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+class Ativo:
+    """Conteúdo de um arquivo estático com hash e variantes comprimidas em memória"""
+
+    def __init__(self, caminho, conteudo, mtime):
+        self.caminho = caminho
+        self.conteudo = conteudo
+        self.mtime = mtime
+        self.hash = hashlib.sha256(conteudo).hexdigest()[:12]
+        self.mimetype = mimetypes.guess_type(str(caminho))[0] or 'application/octet-stream'
+        self.comprimivel = self.mimetype in TIPOS_COMPRIMIVEIS and len(conteudo) >= MIN_COMPRESSAO
+        self._variantes = {}
+
+    def variante(self, codificacao):
+        """Bytes na codificação pedida (None = original), comprimidos uma única vez"""
+        if codificacao is None or not self.comprimivel:
+            return self.conteudo
+        if codificacao not in self._variantes:
+            self._variantes[codificacao] = comprimir(self.conteudo, codificacao)
+        return self._variantes[codificacao]
+
+
+class AtivosEstaticos:
+    """
+    Arquivos estáticos sob `raiz`, recarregados quando o mtime muda.
+    O HTML de entrada é reescrito para referenciar cada ativo como `arquivo?v=<hash>`.
+    """
+
+    def __init__(self, raiz='.'):
+        self.raiz = Path(raiz).resolve()
+        self._ativos = {}
+        self._html = None
+        self._lock = threading.Lock()
+
+    def obter(self, caminho_relativo):
+        """Ativo do arquivo, ou None se não existir / estiver fora da raiz"""
+        caminho = (self.raiz / caminho_relativo).resolve()
+        if self.raiz not in caminho.parents or not caminho.is_file():
+            return None
+
+        mtime = os.stat(caminho).st_mtime_ns
+        ativo = self._ativos.get(caminho)
+        if ativo is None or ativo.mtime != mtime:
+            with self._lock:
+                ativo = self._ativos.get(caminho)
+                if ativo is None or ativo.mtime != mtime:
+                    ativo = Ativo(caminho, caminho.read_bytes(), mtime)
+                    self._ativos[caminho] = ativo
+        return ativo
+
+    def versionar_html(self, ativo_html):
+        """
+        Ativo do HTML com src/href locais apontando para `arquivo?v=<hash>`.
+        Como o hash dos ativos entra no conteúdo, o ETag do HTML muda quando qualquer um muda.
+        """
+        def substituir(match):
+            atributo, alvo = match.group(1), match.group(2)
+            ativo = self.obter(alvo)
+            if ativo is None:
+                return match.group(0)
+            return f'{atributo}="{alvo}?v={ativo.hash}"'
+
+        html = ativo_html.conteudo.decode('utf-8')
+        versionado = re.sub(r'\b(src|href)="([\w\-./]+\.\w+)"', substituir, html).encode('utf-8')
+        # Reaproveita o Ativo (e suas variantes comprimidas) enquanto o resultado não muda
+        if self._html is None or self._html.conteudo != versionado:
+            self._html = Ativo(ativo_html.caminho, versionado, ativo_html.mtime)
+        return self._html
@@ -0,0 +1,108 @@
+"""
+Concorrência na Carga dos Snapshots
+Dispara N requisições simultâneas contra um RegistroSnapshots vazio (carga a frio)
+e confere que a planilha foi lida uma única vez e que todas receberam a mesma fonte.
+Depois mede as consultas com o ano já carregado, que não tomam lock.
+
+Uso: python Scripts/concorrencia_snapshots.py <planilha.xlsx> [--ano 2024] [--threads 32] [--rodadas 3]
+Sai com código 1 se alguma rodada carregar a planilha mais de uma vez.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from snapshot_planilha import ANO_PADRAO, RegistroSnapshots, SnapshotPlanilha
+
+
+class FabricaContada:
+    """SnapshotPlanilha contando as leituras da planilha (e quantas correram juntas)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.leituras = 0
+        self.simultaneas = 0
+        self._em_andamento = 0
+
+    def __call__(self, arquivo_excel, versao, ano):
+        with self.lock:
+            self.leituras += 1
+            self._em_andamento += 1
+            self.simultaneas = max(self.simultaneas, self._em_andamento)
+        try:
+            return SnapshotPlanilha(arquivo_excel, versao, ano)
+        finally:
+            with self.lock:
+                self._em_andamento -= 1
+
+
+def rodada_fria(arquivo_excel, ano, threads):
+    """N threads liberadas juntas sobre um registro vazio"""
+    fabrica = FabricaContada()
+    registro = RegistroSnapshots({ano: arquivo_excel}, fabrica=fabrica)
+    largada = threading.Barrier(threads)
+
+    def requisicao():
+        largada.wait()
+        return registro.obter(ano)
+
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(threads) as executor:
+        snapshots = list(executor.map(lambda _: requisicao(), range(threads)))
+
+    return registro, {
+        'threads': threads,
+        'leituras': fabrica.leituras,
+        'leituras_simultaneas': fabrica.simultaneas,
+        'fontes_distintas': len({id(snapshot) for snapshot in snapshots}),
+        'segundos': round(time.monotonic() - inicio, 2),
+        'cargas': registro.status()['cargas'],
+    }
+
+
+def consultas_quentes(registro, ano, threads, por_thread=20000):
+    """Consultas com o ano carregado (caminho sem lock)"""
+    def consultar(_):
+        for _ in range(por_thread):
+            registro.obter(ano)
+
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(consultar, range(threads)))
+    segundos = time.monotonic() - inicio
+    total = threads * por_thread
+    return {
+        'consultas': total,
+        'por_segundo': round(total / segundos),
+        'microssegundos_por_consulta': round(segundos / total * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Carga a frio concorrente dos snapshots')
+    parser.add_argument('planilha')
+    parser.add_argument('--ano', type=int, default=ANO_PADRAO)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--rodadas', type=int, default=3)
+    args = parser.parse_args()
+
+    rodadas = []
+    registro = None
+    for _ in range(args.rodadas):
+        registro, resultado = rodada_fria(args.planilha, args.ano, args.threads)
+        rodadas.append(resultado)
+
+    ok = all(r['leituras'] == 1 and r['fontes_distintas'] == 1 for r in rodadas)
+    print(json.dumps({
+        'ok': ok,
+        'rodadas': rodadas,
+        'consultas_quentes': consultas_quentes(registro, args.ano, args.threads),
+    }, ensure_ascii=False, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
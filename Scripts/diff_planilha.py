@@ -0,0 +1,95 @@
+"""
+Diff entre Versões da Planilha de IR
+Compara dois snapshots pelas assinaturas de cada cliente (CPF normalizado):
+hash da linha na 'Base de Clientes ' e hash dos totais agregados da UNION.
+Custo linear no número de clientes.
+"""
+
+import json
+import sys
+
+
+class DiferencaPlanilha:
+    """Resultado do diff: clientes adicionados, removidos e alterados"""
+
+    def __init__(self, adicionados, removidos, alterados, inalterados):
+        self.adicionados = adicionados   # CPFs só na versão nova
+        self.removidos = removidos       # CPFs só na versão antiga
+        self.alterados = alterados       # CPF -> ['linha'] / ['agregados'] / ambos
+        self.inalterados = inalterados   # quantidade de CPFs idênticos
+
+    def afetados(self):
+        """CPFs cujos artefatos (PDFs, caches) precisam ser invalidados"""
+        return set(self.adicionados) | set(self.removidos) | set(self.alterados)
+
+    def vazia(self):
+        return not (self.adicionados or self.removidos or self.alterados)
+
+    def resumo(self):
+        return {
+            'adicionados': len(self.adicionados),
+            'removidos': len(self.removidos),
+            'alterados': len(self.alterados),
+            'inalterados': self.inalterados
+        }
+
+    def para_dict(self):
+        return {
+            'resumo': self.resumo(),
+            'adicionados': self.adicionados,
+            'removidos': self.removidos,
+            'alterados': self.alterados
+        }
+
+
+def comparar_assinaturas(antigas, novas):
+    """
+    Compara dois mapas CPF -> (hash_linha, hash_agregados).
+    Aceita listas no lugar de tuplas (assinaturas lidas de JSON).
+    """
+    adicionados = []
+    alterados = {}
+    inalterados = 0
+
+    for cpf, nova in novas.items():
+        antiga = antigas.get(cpf)
+        if antiga is None:
+            adicionados.append(cpf)
+            continue
+
+        mudancas = []
+        if antiga[0] != nova[0]:
+            mudancas.append('linha')
+        if antiga[1] != nova[1]:
+            mudancas.append('agregados')
+
+        if mudancas:
+            alterados[cpf] = mudancas
+        else:
+            inalterados += 1
+
+    removidos = [cpf for cpf in antigas if cpf not in novas]
+    return DiferencaPlanilha(adicionados, removidos, alterados, inalterados)
+
+
+def comparar_snapshots(antigo, novo):
+    """Diff entre dois SnapshotPlanilha"""
+    return comparar_assinaturas(antigo.assinaturas(), novo.assinaturas())
+
+
+def main():
+    """Uso: python Scripts/diff_planilha.py <planilha_antiga.xlsx> <planilha_nova.xlsx>"""
+    if len(sys.argv) != 3:
+        print(main.__doc__)
+        sys.exit(1)
+
+    from snapshot_planilha import SnapshotPlanilha
+
+    antigo = SnapshotPlanilha(sys.argv[1])
+    novo = SnapshotPlanilha(sys.argv[2])
+    diferenca = comparar_snapshots(antigo, novo)
+    print(json.dumps(diferenca.para_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
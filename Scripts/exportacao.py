@@ -0,0 +1,172 @@
+"""
+Exportação dos Dados das Declarações
+Uma linha por CPF com os campos do cliente (buscar_por_cpf) e os totais da
+declaração, gerada em uma passada pela fonte de dados e escrita em streaming
+como CSV, JSONL ou Parquet (se pyarrow estiver instalado).
+"""
+
+import csv
+import io
+import json
+import os
+import sys
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:  # Parquet é opcional
+    pyarrow = None
+
+from snapshot_planilha import ANO_PADRAO, CAMPOS_CLIENTE
+
+COLUNAS = (
+    ['ano', 'cpf']
+    + [campo for campo, _ in CAMPOS_CLIENTE]
+    + ['valor_venda', 'receita_bruta', 'despesas_acessorias']
+)
+COLUNAS_NUMERICAS = ('valor_venda', 'receita_bruta', 'despesas_acessorias')
+
+FORMATOS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Linhas por bloco escrito (e por row group no Parquet)
+LINHAS_POR_BLOCO = 500
+
+
+class FormatoIndisponivel(ValueError):
+    """Formato desconhecido ou sem a dependência opcional instalada"""
+
+
+def linhas_declaracoes(fonte):
+    """Gera um dict por CPF distinto, na ordem da planilha (qualquer FonteDados)"""
+    for cpf in fonte.cpfs():
+        dados = fonte.buscar_cliente(cpf)
+        totais = fonte.totais_cliente(cpf)
+        linha = {'ano': fonte.ano, 'cpf': cpf}
+        for campo, _ in CAMPOS_CLIENTE:
+            linha[campo] = dados[campo]
+        linha['valor_venda'] = float(dados['valor_venda'] or 0)
+        linha['receita_bruta'] = float(totais['receita_bruta'])
+        linha['despesas_acessorias'] = float(totais['despesas_acessorias'])
+        yield linha
+
+
+def _blocos(linhas):
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) == LINHAS_POR_BLOCO:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+def _csv(linhas):
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=COLUNAS, lineterminator='\n')
+    escritor.writeheader()
+    for bloco in _blocos(linhas):
+        escritor.writerows(bloco)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _jsonl(linhas):
+    for bloco in _blocos(linhas):
+        yield ''.join(json.dumps(linha, ensure_ascii=False) + '\n' for linha in bloco).encode('utf-8')
+
+
+class _SaidaIncremental:
+    """Destino do ParquetWriter que guarda os bytes só até serem repassados"""
+
+    def __init__(self):
+        self.partes = []
+        self.posicao = 0
+        self.closed = False
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drenar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def _parquet(linhas):
+    esquema = pyarrow.schema([
+        (coluna, pyarrow.int64() if coluna == 'ano'
+         else pyarrow.float64() if coluna in COLUNAS_NUMERICAS
+         else pyarrow.string())
+        for coluna in COLUNAS
+    ])
+    saida = _SaidaIncremental()
+    escritor = pyarrow_parquet.ParquetWriter(pyarrow.PythonFile(saida, mode='w'), esquema)
+    try:
+        # Um row group por bloco: só o bloco corrente fica em memória
+        for bloco in _blocos(linhas):
+            escritor.write_table(pyarrow.Table.from_pylist(bloco, schema=esquema))
+            yield saida.drenar()
+    finally:
+        escritor.close()
+    yield saida.drenar()
+
+
+def exportar(fonte, formato):
+    """Gerador de blocos de bytes no formato pedido ('csv', 'jsonl' ou 'parquet')"""
+    if formato not in FORMATOS:
+        raise FormatoIndisponivel(f"Formato '{formato}' desconhecido (use {', '.join(FORMATOS)})")
+    if formato == 'parquet' and pyarrow is None:
+        raise FormatoIndisponivel("Exportação Parquet requer o pacote pyarrow")
+
+    escritores = {'csv': _csv, 'jsonl': _jsonl, 'parquet': _parquet}
+    return escritores[formato](linhas_declaracoes(fonte))
+
+
+def main():
+    """Uso: python Scripts/exportacao.py <csv|jsonl|parquet> [arquivo_saida|-] [ano]"""
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import YEARS_CONFIG
+    from snapshot_planilha import SnapshotPlanilha
+
+    formato = sys.argv[1]
+    destino = sys.argv[2] if len(sys.argv) > 2 else '-'
+    ano = int(sys.argv[3]) if len(sys.argv) > 3 else ANO_PADRAO
+
+    snapshot = SnapshotPlanilha(YEARS_CONFIG['WORKBOOKS'][ano], ano=ano)
+    blocos = exportar(snapshot, formato)
+
+    if destino == '-':
+        for bloco in blocos:
+            sys.stdout.buffer.write(bloco)
+    else:
+        with open(destino, 'wb') as arquivo:
+            for bloco in blocos:
+                arquivo.write(bloco)
+        print(f"Exportação {formato} gravada em {destino}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Fonte de Dados do Gerador de IR
+Interface comum às origens de dados consultadas pelo servidor e pelo GeradorIR
+"""
+
+
+class FonteDados:
+    """
+    Origem dos dados de um ano-calendário.
+
+    Implementações:
+    - SnapshotPlanilha (snapshot_planilha.py): planilha inteira em memória
+    - FonteDadosSQLite (fonte_sqlite.py): banco SQLite importado da planilha
+
+    Atributos esperados: `arquivo_excel`, `ano`, `versao` (hash do xlsx de origem)
+    e `abas` (nomes das planilhas do arquivo).
+    """
+
+    arquivo_excel = None
+    ano = None
+    versao = None
+    abas = ()
+
+    def buscar_cliente(self, cpf):
+        """Dados do cliente no formato de BuscadorCliente.buscar_por_cpf, ou None"""
+        raise NotImplementedError
+
+    def totais_cliente(self, cpf):
+        """{'receita_bruta', 'despesas_acessorias'} do cliente, ou None"""
+        raise NotImplementedError
+
+    def lancamentos_cliente(self, cpf, inicio=0, limite=50, total=None):
+        """
+        (quantidade, página) das linhas da UNION somadas nos totais do cliente,
+        em ordem de linha (snapshot_planilha.item_lancamento), ou None
+        """
+        raise NotImplementedError
+
+    def buscar_prefixo(self, consulta, limite=10):
+        """Clientes cujo CPF ou nome começa com a consulta (busca_prefixo.IndicePrefixo)"""
+        raise NotImplementedError
+
+    def cpfs(self):
+        """CPFs distintos na ordem da planilha"""
+        raise NotImplementedError
+
+    def relatorio_validacao(self):
+        """RelatorioValidacao (validacao_base.py) dos CPFs da coluna B"""
+        raise NotImplementedError
+
+    def auditoria(self):
+        """RelatorioAuditoria (auditoria_base.py) da base e da UNION"""
+        raise NotImplementedError
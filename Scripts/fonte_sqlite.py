@@ -0,0 +1,297 @@
+"""
+Fonte de Dados SQLite
+Importa 'Base de Clientes ' e 'UNION - <ano>' para um banco SQLite indexado.
+O xlsx continua sendo a fonte da verdade: cada nova versão gera um novo banco.
+
+A regra do SOMASES (`nome in CLIENTE`) não pode usar índice, então os totais de
+cada nome de cliente e as linhas da UNION somadas neles são gravados na importação
+(já calculados pelo snapshot); consultas e detalhamento vão direto pela chave.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem exclusão entre processos
+    fcntl = None
+
+from auditoria_base import auditar
+from busca_prefixo import IndicePrefixo
+from fonte_dados import FonteDados
+from snapshot_planilha import (
+    ANO_PADRAO, CAMPOS_CLIENTE, TOTAL_DA_CATEGORIA,
+    SnapshotPlanilha, categoria_lancamento, item_lancamento, limpar_cpf, versao_planilha
+)
+from validacao_base import validar_cpfs
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = [campo for campo, _ in CAMPOS_CLIENTE]
+
+# Parte do nome do arquivo: bancos de um esquema anterior são reimportados
+VERSAO_ESQUEMA = 2
+
+ESQUEMA = f"""
+CREATE TABLE meta (chave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE clientes (
+    posicao INTEGER PRIMARY KEY,
+    linha INTEGER NOT NULL,
+    cpf TEXT NOT NULL,
+    nome_lower TEXT NOT NULL,
+    {', '.join(f'{campo} TEXT' for campo in CAMPOS)},
+    valor_venda REAL
+);
+CREATE INDEX idx_clientes_cpf ON clientes (cpf, posicao);
+CREATE INDEX idx_clientes_nome ON clientes (nome_lower);
+CREATE TABLE lancamentos (
+    linha INTEGER PRIMARY KEY,
+    cliente TEXT,
+    entrada,
+    divisao TEXT,
+    categoria TEXT
+);
+CREATE TABLE totais_nome (
+    nome_lower TEXT PRIMARY KEY,
+    receita_bruta REAL NOT NULL,
+    despesas_acessorias REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE lancamentos_nome (
+    nome_lower TEXT NOT NULL,
+    linha INTEGER NOT NULL,
+    categoria TEXT NOT NULL,
+    PRIMARY KEY (nome_lower, linha)
+) WITHOUT ROWID;
+"""
+
+
+def importar_planilha(arquivo_excel, caminho_db, ano=ANO_PADRAO, versao=None):
+    """Cria `caminho_db` a partir da planilha (gravação atômica)"""
+    inicio = time.monotonic()
+    snapshot = SnapshotPlanilha(arquivo_excel, versao, ano)
+
+    caminho_db = Path(caminho_db)
+    temporario = caminho_db.with_suffix('.tmp')
+    temporario.unlink(missing_ok=True)
+
+    conexao = sqlite3.connect(temporario)
+    try:
+        conexao.executescript(ESQUEMA)
+        conexao.executemany('INSERT INTO meta VALUES (?, ?)', [
+            ('arquivo_excel', str(arquivo_excel)),
+            ('ano', str(ano)),
+            ('versao', snapshot.versao),
+            ('abas', json.dumps(snapshot.abas, ensure_ascii=False)),
+            ('linhas_sem_cpf', json.dumps(snapshot.linhas_sem_cpf)),
+            ('importado_em', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ])
+        conexao.executemany(
+            f"INSERT INTO clientes VALUES ({', '.join('?' * (len(CAMPOS) + 5))})",
+            (
+                (posicao, linha, dados['cpf'], dados['cliente'].lower(),
+                 *(dados[campo] for campo in CAMPOS), dados['valor_venda'])
+                for posicao, (linha, dados) in enumerate(zip(snapshot.linhas_clientes, snapshot.clientes))
+            )
+        )
+        conexao.executemany(
+            'INSERT INTO lancamentos VALUES (?, ?, ?, ?, ?)',
+            (
+                (linha, cliente, entrada, divisao, categoria_lancamento(cliente, entrada, divisao))
+                for linha, cliente, entrada, divisao in snapshot.lancamentos
+            )
+        )
+        # Totais e linhas somadas por nome de cliente, como o snapshot calculou
+        totais_nome = {}
+        for dados, totais in zip(snapshot.clientes, snapshot.totais):
+            totais_nome.setdefault(dados.cliente.lower(), totais)
+        conexao.executemany(
+            'INSERT INTO totais_nome VALUES (?, ?, ?)',
+            (
+                (nome, totais['receita_bruta'], totais['despesas_acessorias'])
+                for nome, totais in totais_nome.items()
+            )
+        )
+        conexao.executemany(
+            'INSERT INTO lancamentos_nome VALUES (?, ?, ?)',
+            (
+                (nome, snapshot.lancamentos[posicao][0], categoria_lancamento(*snapshot.lancamentos[posicao][1:]))
+                for nome, posicoes in snapshot.posicoes_nome.items()
+                for posicao in posicoes
+            )
+        )
+        conexao.commit()
+    finally:
+        conexao.close()
+
+    os.replace(temporario, caminho_db)
+    logger.info(f"Planilha importada para {caminho_db} em {time.monotonic() - inicio:.2f}s")
+    return caminho_db
+
+
+class FonteDadosSQLite(FonteDados):
+    """
+    Consultas indexadas sobre o banco importado.
+    Cada thread usa sua própria conexão somente leitura.
+    """
+
+    def __init__(self, caminho_db):
+        self.caminho_db = Path(caminho_db)
+        self._local = threading.local()
+
+        meta = dict(self._conexao().execute('SELECT chave, valor FROM meta'))
+        self.arquivo_excel = meta['arquivo_excel']
+        self.ano = int(meta['ano'])
+        self.versao = meta['versao']
+        self.abas = json.loads(meta['abas'])
+        self._linhas_sem_cpf = json.loads(meta.get('linhas_sem_cpf', '[]'))
+        self._validacao = None
+        self._auditoria = None
+        self._indice_prefixo = None
+        self._lock_indice = threading.Lock()
+
+    @classmethod
+    def abrir(cls, arquivo_excel, versao=None, ano=ANO_PADRAO, diretorio='output/sqlite'):
+        """
+        Banco da versão atual da planilha, importando se ainda não existir.
+        Um único processo importa por vez; bancos de versões antigas são removidos.
+        """
+        versao = versao or versao_planilha(arquivo_excel)
+        diretorio = Path(diretorio)
+        diretorio.mkdir(parents=True, exist_ok=True)
+        caminho_db = diretorio / f"ir_{ano}_{versao}_e{VERSAO_ESQUEMA}.sqlite3"
+
+        if not caminho_db.exists():
+            with open(diretorio / f".importacao_{ano}.lock", 'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                # Outro worker pode ter importado enquanto aguardávamos o lock
+                if not caminho_db.exists():
+                    importar_planilha(arquivo_excel, caminho_db, ano, versao)
+                    for antigo in diretorio.glob(f"ir_{ano}_*.sqlite3"):
+                        if antigo != caminho_db:
+                            antigo.unlink(missing_ok=True)
+
+        return cls(caminho_db)
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(f"file:{self.caminho_db}?mode=ro", uri=True)
+            conexao.row_factory = sqlite3.Row
+            self._local.conexao = conexao
+        return conexao
+
+    def _linha_cliente(self, cpf):
+        # Primeira ocorrência do CPF, como o PROCV; o CPF completo também encontra
+        # a célula numérica gravada sem os zeros à esquerda (como no snapshot)
+        cpf = limpar_cpf(cpf)
+        for forma in dict.fromkeys((cpf, cpf.lstrip('0') or cpf)):
+            linha = self._conexao().execute(
+                'SELECT * FROM clientes WHERE cpf = ? ORDER BY posicao LIMIT 1', (forma,)
+            ).fetchone()
+            if linha is not None:
+                return linha
+        return None
+
+    def buscar_cliente(self, cpf):
+        linha = self._linha_cliente(cpf)
+        if linha is None:
+            return None
+        dados = {'cpf': linha['cpf']}
+        for campo in CAMPOS:
+            dados[campo] = linha[campo]
+        dados['valor_venda'] = linha['valor_venda']
+        return dados
+
+    def totais_cliente(self, cpf):
+        linha = self._linha_cliente(cpf)
+        if linha is None:
+            return None
+        totais = self._conexao().execute(
+            'SELECT receita_bruta, despesas_acessorias FROM totais_nome WHERE nome_lower = ?',
+            (linha['nome_lower'],)
+        ).fetchone()
+        if totais is None:
+            return {'receita_bruta': 0.0, 'despesas_acessorias': 0.0}
+        return dict(totais)
+
+    def lancamentos_cliente(self, cpf, inicio=0, limite=50, total=None):
+        linha = self._linha_cliente(cpf)
+        if linha is None:
+            return None
+        categorias = [
+            categoria for categoria, chave in TOTAL_DA_CATEGORIA.items() if total in (None, chave)
+        ]
+        filtro = 'n.nome_lower = ? AND n.categoria IN ({})'.format(', '.join('?' * len(categorias)))
+        parametros = (linha['nome_lower'], *categorias)
+        conexao = self._conexao()
+        quantidade, = conexao.execute(
+            f'SELECT COUNT(*) FROM lancamentos_nome n WHERE {filtro}', parametros
+        ).fetchone()
+        itens = [
+            item_lancamento(*lancamento)
+            for lancamento in conexao.execute(
+                'SELECT l.linha, l.cliente, l.entrada, l.divisao, l.categoria '
+                'FROM lancamentos_nome n JOIN lancamentos l ON l.linha = n.linha '
+                f'WHERE {filtro} ORDER BY n.linha LIMIT ? OFFSET ?',
+                (*parametros, limite, inicio)
+            )
+        ]
+        return quantidade, itens
+
+    def buscar_prefixo(self, consulta, limite=10):
+        # Índice em memória montado na primeira busca (uma leitura da tabela clientes)
+        if self._indice_prefixo is None:
+            with self._lock_indice:
+                if self._indice_prefixo is None:
+                    self._indice_prefixo = IndicePrefixo(self._conexao().execute(
+                        'SELECT cpf, cliente, empreendimento, unidade FROM clientes ORDER BY posicao'
+                    ))
+        return self._indice_prefixo.buscar(consulta, limite)
+
+    def cpfs(self):
+        return [cpf for (cpf,) in self._conexao().execute(
+            'SELECT cpf FROM clientes GROUP BY cpf ORDER BY MIN(posicao)'
+        )]
+
+    def relatorio_validacao(self):
+        if self._validacao is None:
+            self._validacao = validar_cpfs(
+                self._conexao().execute('SELECT linha, cpf FROM clientes ORDER BY posicao'),
+                self._linhas_sem_cpf
+            )
+        return self._validacao
+
+    def auditoria(self):
+        if self._auditoria is None:
+            clientes = (
+                (linha['linha'], linha)
+                for linha in self._conexao().execute('SELECT * FROM clientes ORDER BY posicao')
+            )
+            self._auditoria = auditar(clientes, self._conexao().execute(
+                'SELECT linha, cliente, entrada, divisao FROM lancamentos ORDER BY linha'
+            ))
+        return self._auditoria
+
+
+def main():
+    """Uso: python Scripts/fonte_sqlite.py <planilha.xlsx> [ano] [diretorio]"""
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ano = int(sys.argv[2]) if len(sys.argv) > 2 else ANO_PADRAO
+    diretorio = sys.argv[3] if len(sys.argv) > 3 else 'output/sqlite'
+    fonte = FonteDadosSQLite.abrir(sys.argv[1], ano=ano, diretorio=diretorio)
+    print(f"Banco pronto: {fonte.caminho_db} (versão {fonte.versao})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+"""
+Geração em Lote das Declarações, Dividida em Shards
+Cada nó gera apenas os CPFs do seu shard `i/n` (hash estável do CPF, i de 0 a n-1)
+e grava um manifesto; a mesclagem junta os manifestos de todos os nós e confere
+que cada CPF da 'Base de Clientes ' foi coberto exatamente uma vez.
+
+    # em cada nó (i = 0..3), com a mesma planilha
+    python Scripts/geracao_lote.py gerar --shard 0/4 --destino output/lote --processos 2
+    # com os manifest_*.json reunidos em um diretório
+    python Scripts/geracao_lote.py mesclar output/lote/manifest_*.json
+    # localmente, um processo por nó
+    python Scripts/geracao_lote.py simular --nos 4 --destino output/lote
+
+Um shard interrompido (processo reiniciado) é retomado do manifesto parcial ao
+rodar o mesmo comando de novo; só os CPFs ainda sem PDF são gerados.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem exclusão entre processos
+    fcntl = None
+
+from snapshot_planilha import ANO_PADRAO, SnapshotPlanilha, _contexto_processos, versao_planilha
+
+logger = logging.getLogger(__name__)
+
+# O manifesto é regravado (checkpoint) a cada tantos CPFs ou segundos
+CHECKPOINT_CPFS = 25
+CHECKPOINT_SEGUNDOS = 2.0
+
+
+class LoteEmAndamento(RuntimeError):
+    """O mesmo shard já está sendo gerado por outro processo"""
+
+
+def ler_shard(texto):
+    """'i/n' -> (i, n), com 0 <= i < n"""
+    try:
+        indice, total = (int(parte) for parte in texto.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard inválido: {texto!r} (use i/n, por exemplo 0/4)")
+    if total < 1 or not 0 <= indice < total:
+        raise ValueError(f"Shard inválido: {texto!r} (i deve estar entre 0 e n-1)")
+    return indice, total
+
+
+def shard_do_cpf(cpf, total):
+    """Shard do CPF: estável entre máquinas e execuções (não usa hash() do Python)"""
+    return int.from_bytes(hashlib.sha256(cpf.encode('ascii')).digest()[:8], 'big') % total
+
+
+def nome_manifesto(indice, total):
+    return f"manifest_{indice}-de-{total}.json"
+
+
+# Gerador de cada processo do pool (só nos filhos; montado no inicializador)
+_gerador = None
+
+
+def _iniciar_processo(arquivo_excel, ano, versao, perfil, deterministico, gerador=None):
+    """`gerador`: o do lote, repassado sem cópia quando o pool usa fork"""
+    global _gerador
+    if gerador is None:
+        from gerador_ir_refatorado import GeradorIR
+        gerador = GeradorIR(SnapshotPlanilha(arquivo_excel, versao, ano), perfil=perfil,
+                            deterministico=deterministico)
+    _gerador = gerador
+
+
+def _gerar_um(cpf, diretorio, data_emissao, gerador=None):
+    """(cpf, item do manifesto ou None, erro ou None); sem `gerador`, usa o do processo do pool"""
+    destino = Path(diretorio) / f"{cpf}.pdf"
+    temporario = destino.with_suffix('.tmp')
+    try:
+        sucesso, resultado = (gerador or _gerador).gerar_declaracao(
+            cpf, caminho_saida=temporario, data_emissao=data_emissao
+        )
+    except Exception as e:
+        return cpf, None, f"Erro ao gerar PDF: {str(e)}"
+    if not sucesso:
+        return cpf, None, resultado
+
+    os.replace(temporario, destino)
+    conteudo = destino.read_bytes()
+    return cpf, {
+        'arquivo': destino.name,
+        'bytes': len(conteudo),
+        'sha256': hashlib.sha256(conteudo).hexdigest(),
+    }, None
+
+
+class ProgressoLote:
+    """Contagens do lote e vazão/ETA calculadas sobre a execução corrente"""
+
+    def __init__(self, total, retomados=0):
+        self.total = total
+        self.retomados = retomados     # declarações já prontas de uma execução anterior
+        self.renderizados = 0
+        self.falhas = 0
+        self.inicio = time.monotonic()
+
+    def registrar(self, sucesso):
+        if sucesso:
+            self.renderizados += 1
+        else:
+            self.falhas += 1
+
+    def para_dict(self):
+        processados = self.renderizados + self.falhas
+        restantes = self.total - self.retomados - processados
+        decorrido = time.monotonic() - self.inicio
+        por_segundo = processados / decorrido if decorrido > 0 else 0.0
+        return {
+            'total': self.total,
+            'renderizados': self.retomados + self.renderizados,
+            'retomados': self.retomados,
+            'falhas': self.falhas,
+            'restantes': restantes,
+            'por_segundo': round(por_segundo, 2),
+            'eta_segundos': round(restantes / por_segundo, 1) if por_segundo else None,
+            'decorrido_segundos': round(decorrido, 1),
+        }
+
+
+class GeracaoLote:
+    """
+    Geração das declarações de um shard em `diretorio`.
+
+    O manifesto é gravado periodicamente durante a execução (`concluido: false`) e
+    serve de checkpoint: uma nova execução do mesmo shard, versão e data de emissão
+    pula os CPFs cujo PDF já está no manifesto e no disco (falhas são tentadas de novo).
+    """
+
+    def __init__(self, arquivo_excel, diretorio, ano=ANO_PADRAO, shard=(0, 1),
+                 perfil=None, deterministico=None, data_emissao=None):
+        self.arquivo_excel = arquivo_excel
+        self.diretorio = Path(diretorio)
+        self.ano = ano
+        self.indice, self.total = shard
+        self.perfil = perfil
+        self.deterministico = deterministico
+        # Fixada no início (ou herdada de um checkpoint interrompido): um lote que
+        # atravessa a meia-noite ou é retomado no dia seguinte não mistura datas
+        if data_emissao is None:
+            anterior = self.ler_manifesto()
+            if anterior and not anterior.get('concluido', True):
+                data_emissao = date.fromisoformat(anterior['data_emissao'])
+        self.data_emissao = data_emissao or date.today()
+
+    @property
+    def caminho_manifesto(self):
+        return self.diretorio / nome_manifesto(self.indice, self.total)
+
+    def ler_manifesto(self):
+        """Manifesto (final ou checkpoint) do shard, ou None"""
+        try:
+            with open(self.caminho_manifesto, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _lock_exclusivo(self):
+        """Lock não bloqueante para que só um processo gere este shard por vez"""
+        arquivo = open(self.diretorio / f".lote_{self.indice}-de-{self.total}.lock", 'a')
+        if fcntl is None:
+            return arquivo
+        try:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            arquivo.close()
+            return None
+        return arquivo
+
+    def em_andamento(self):
+        """True se algum processo está gerando este shard agora"""
+        if fcntl is None or not self.diretorio.exists():
+            return False
+        lock = self._lock_exclusivo()
+        if lock is None:
+            return True
+        lock.close()
+        return False
+
+    def cpfs(self, snapshot):
+        """CPFs distintos da base que pertencem a este shard, na ordem da planilha"""
+        return [cpf for cpf in snapshot.cpfs() if shard_do_cpf(cpf, self.total) == self.indice]
+
+    def _ja_gerados(self, versao):
+        """Declarações prontas do checkpoint compatível com esta execução"""
+        anterior = self.ler_manifesto()
+        if not anterior or anterior['versao'] != versao or anterior['ano'] != self.ano:
+            return {}
+        if anterior['data_emissao'] != self.data_emissao.isoformat():
+            return {}
+        return {
+            cpf: item for cpf, item in anterior['declaracoes'].items()
+            if (self.diretorio / item['arquivo']).exists()
+        }
+
+    def executar(self, processos=1, progresso=None, snapshot=None):
+        """
+        Gera o shard e grava o manifesto; retorna o manifesto.
+        `progresso(dict)` é chamado a cada checkpoint e ao final.
+        `snapshot`: fonte de dados já carregada (a do servidor), usada se for da
+        versão atual da planilha; senão a planilha é lida de novo.
+        Levanta LoteEmAndamento se outro processo já gera este shard.
+        """
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        lock = self._lock_exclusivo()
+        if lock is None:
+            raise LoteEmAndamento(f"Shard {self.indice}/{self.total} já em geração em {self.diretorio}")
+
+        try:
+            versao = versao_planilha(self.arquivo_excel)
+            if snapshot is None or snapshot.versao != versao or snapshot.ano != self.ano:
+                snapshot = SnapshotPlanilha(self.arquivo_excel, versao, self.ano)
+            todos = self.cpfs(snapshot)
+            declaracoes = self._ja_gerados(versao)
+            cpfs = [cpf for cpf in todos if cpf not in declaracoes]
+            logger.info(
+                f"Shard {self.indice}/{self.total}: {len(todos)} de {len(snapshot.cpfs())} CPFs "
+                f"({len(declaracoes)} retomados do manifesto)"
+            )
+
+            # Gerador deste lote, passado explicitamente: lotes de anos diferentes
+            # rodam em threads do mesmo worker e não podem dividir um global
+            from gerador_ir_refatorado import GeradorIR
+            gerador = GeradorIR(snapshot, perfil=self.perfil, deterministico=self.deterministico)
+            argumentos = (str(self.diretorio), self.data_emissao)
+
+            estado = _EstadoExecucao(self, versao, todos, declaracoes, progresso)
+            if processos > 1:
+                contexto = _contexto_processos()
+                # Com fork os filhos recebem o gerador pronto sem cópia; conexões
+                # SQLite não atravessam fork, então só o snapshot em memória vai junto
+                herdado = (gerador if contexto.get_start_method() == 'fork'
+                           and isinstance(snapshot, SnapshotPlanilha) else None)
+                with ProcessPoolExecutor(
+                    processos, mp_context=contexto, initializer=_iniciar_processo,
+                    initargs=(self.arquivo_excel, self.ano, versao, self.perfil, self.deterministico, herdado)
+                ) as executor:
+                    estado.consumir(executor.map(
+                        _gerar_um, cpfs, *([a] * len(cpfs) for a in argumentos), chunksize=16
+                    ))
+            else:
+                estado.consumir(_gerar_um(cpf, *argumentos, gerador) for cpf in cpfs)
+
+            manifesto = estado.checkpoint(concluido=True)
+        finally:
+            lock.close()
+
+        logger.info(
+            f"Shard {self.indice}/{self.total} concluído em {manifesto['segundos']}s: "
+            f"{len(manifesto['declaracoes'])} declarações, {len(manifesto['falhas'])} falhas"
+        )
+        return manifesto
+
+    def _gravar_manifesto(self, manifesto):
+        """Grava o manifesto de forma atômica"""
+        temporario = self.caminho_manifesto.with_suffix('.tmp')
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f, ensure_ascii=False)
+        os.replace(temporario, self.caminho_manifesto)
+
+
+class _EstadoExecucao:
+    """Resultados de uma execução de GeracaoLote, com checkpoints do manifesto"""
+
+    def __init__(self, lote, versao, cpfs, declaracoes, progresso):
+        self.lote = lote
+        self.versao = versao
+        self.cpfs = cpfs
+        self.declaracoes = declaracoes
+        self.falhas = {}
+        self.contagem = ProgressoLote(len(cpfs), len(declaracoes))
+        self.progresso = progresso
+        self.inicio = time.monotonic()
+        self.ultimo_checkpoint = self.inicio
+
+    def consumir(self, resultados):
+        self.checkpoint()
+        desde_checkpoint = 0
+        for cpf, item, erro in resultados:
+            if item is None:
+                self.falhas[cpf] = erro
+            else:
+                self.declaracoes[cpf] = item
+            self.contagem.registrar(item is not None)
+
+            desde_checkpoint += 1
+            if (desde_checkpoint >= CHECKPOINT_CPFS
+                    or time.monotonic() - self.ultimo_checkpoint >= CHECKPOINT_SEGUNDOS):
+                self.checkpoint()
+                desde_checkpoint = 0
+
+    def checkpoint(self, concluido=False):
+        self.ultimo_checkpoint = time.monotonic()
+        manifesto = {
+            'ano': self.lote.ano,
+            'versao': self.versao,
+            'shard': [self.lote.indice, self.lote.total],
+            'data_emissao': self.lote.data_emissao.isoformat(),
+            'gerado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'segundos': round(self.ultimo_checkpoint - self.inicio, 2),
+            'concluido': concluido,
+            'total_cpfs': len(self.cpfs),
+            'progresso': self.contagem.para_dict(),
+            'declaracoes': self.declaracoes,
+            'falhas': self.falhas,
+        }
+        self.lote._gravar_manifesto(manifesto)
+        if self.progresso is not None:
+            self.progresso(dict(manifesto['progresso'], concluido=concluido))
+        return manifesto
+
+
+class RelatorioMescla:
+    """Cobertura dos manifestos de todos os shards frente à base"""
+
+    def __init__(self):
+        self.versao = None
+        self.ano = None
+        self.total_shards = None
+        self.shards_ausentes = []
+        self.shards_repetidos = []
+        self.inconsistencias = []     # versão, ano, n ou data de emissão divergentes
+        self.faltando = []            # CPFs da base sem manifesto
+        self.duplicados = {}          # CPF -> shards que o cobriram
+        self.fora_da_base = []        # CPFs em manifestos mas não na base
+        self.fora_do_shard = []       # CPFs cobertos por um shard que não é o seu
+        self.declaracoes = {}         # CPF -> item do manifesto
+        self.falhas = {}              # CPF -> erro
+
+    def completo(self):
+        return not (self.shards_ausentes or self.shards_repetidos or self.inconsistencias
+                    or self.faltando or self.duplicados or self.fora_da_base or self.fora_do_shard)
+
+    def resumo(self):
+        return {
+            'completo': self.completo(),
+            'versao': self.versao,
+            'ano': self.ano,
+            'shards': self.total_shards,
+            'shards_ausentes': self.shards_ausentes,
+            'shards_repetidos': self.shards_repetidos,
+            'inconsistencias': len(self.inconsistencias),
+            'declaracoes': len(self.declaracoes),
+            'falhas': len(self.falhas),
+            'faltando': len(self.faltando),
+            'duplicados': len(self.duplicados),
+            'fora_da_base': len(self.fora_da_base),
+            'fora_do_shard': len(self.fora_do_shard),
+        }
+
+    def para_dict(self):
+        return {
+            'resumo': self.resumo(),
+            'inconsistencias': self.inconsistencias,
+            'faltando': self.faltando,
+            'duplicados': self.duplicados,
+            'fora_da_base': self.fora_da_base,
+            'fora_do_shard': self.fora_do_shard,
+            'falhas': self.falhas,
+        }
+
+    def manifesto(self):
+        """Manifesto único do lote (só faz sentido quando completo)"""
+        return {
+            'ano': self.ano,
+            'versao': self.versao,
+            'shards': self.total_shards,
+            'declaracoes': self.declaracoes,
+            'falhas': self.falhas,
+        }
+
+
+def mesclar(manifestos, cpfs_base, versao_base=None):
+    """
+    Confere e junta os manifestos dos shards (dicts lidos de JSON).
+    `cpfs_base`: todos os CPFs distintos da 'Base de Clientes '.
+    """
+    relatorio = RelatorioMescla()
+    if not manifestos:
+        relatorio.inconsistencias.append('Nenhum manifesto informado')
+        relatorio.faltando = list(cpfs_base)
+        return relatorio
+
+    primeiro = manifestos[0]
+    relatorio.versao = versao_base or primeiro['versao']
+    relatorio.ano = primeiro['ano']
+    relatorio.total_shards = primeiro['shard'][1]
+
+    shards_por_cpf = {}
+    vistos = set()
+    for manifesto in manifestos:
+        indice, total = manifesto['shard']
+        for campo, esperado in (('versao', relatorio.versao), ('ano', relatorio.ano),
+                                ('data_emissao', primeiro['data_emissao'])):
+            if manifesto[campo] != esperado:
+                relatorio.inconsistencias.append(
+                    f"Shard {indice}/{total}: {campo} {manifesto[campo]} (esperado {esperado})"
+                )
+        if not manifesto.get('concluido', True):
+            relatorio.inconsistencias.append(f"Shard {indice}/{total}: geração não concluída")
+        if total != relatorio.total_shards:
+            relatorio.inconsistencias.append(
+                f"Shard {indice}/{total}: dividido em {total} (esperado {relatorio.total_shards})"
+            )
+            continue
+        if indice in vistos:
+            relatorio.shards_repetidos.append(indice)
+        vistos.add(indice)
+
+        for cpf in list(manifesto['declaracoes']) + list(manifesto['falhas']):
+            shards_por_cpf.setdefault(cpf, []).append(indice)
+            if shard_do_cpf(cpf, total) != indice:
+                relatorio.fora_do_shard.append(cpf)
+        relatorio.declaracoes.update(manifesto['declaracoes'])
+        relatorio.falhas.update(manifesto['falhas'])
+
+    relatorio.shards_ausentes = sorted(set(range(relatorio.total_shards)) - vistos)
+    relatorio.shards_repetidos.sort()
+
+    base = set(cpfs_base)
+    relatorio.faltando = [cpf for cpf in cpfs_base if cpf not in shards_por_cpf]
+    relatorio.duplicados = {cpf: shards for cpf, shards in shards_por_cpf.items() if len(shards) > 1}
+    relatorio.fora_da_base = [cpf for cpf in shards_por_cpf if cpf not in base]
+    return relatorio
+
+
+def _mesclar_arquivos(caminhos, arquivo_excel, ano, saida=None):
+    manifestos = []
+    for caminho in caminhos:
+        with open(caminho, encoding='utf-8') as f:
+            manifestos.append(json.load(f))
+
+    versao = versao_planilha(arquivo_excel)
+    snapshot = SnapshotPlanilha(arquivo_excel, versao, ano)
+    relatorio = mesclar(manifestos, snapshot.cpfs(), versao)
+
+    print(json.dumps(relatorio.para_dict(), ensure_ascii=False, indent=2))
+    if relatorio.completo() and saida:
+        with open(saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio.manifesto(), f, ensure_ascii=False)
+        print(f"Manifesto do lote gravado em {saida}")
+    return relatorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Geração das declarações em shards')
+    parser.add_argument('--ano', type=int, default=ANO_PADRAO)
+    parser.add_argument('--planilha', help='padrão: planilha do ano em config.py')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    gerar = comandos.add_parser('gerar', help='gera os PDFs de um shard')
+    gerar.add_argument('--shard', default='0/1', help='i/n (i de 0 a n-1)')
+    gerar.add_argument('--destino', default='output/lote')
+    gerar.add_argument('--processos', type=int, default=1)
+    gerar.add_argument('--data-emissao', help='AAAA-MM-DD (padrão: a do checkpoint interrompido, ou hoje)')
+    gerar.add_argument('--progresso', action='store_true', help='uma linha JSON de progresso por checkpoint')
+
+    mesclar_cmd = comandos.add_parser('mesclar', help='confere a cobertura dos manifestos')
+    mesclar_cmd.add_argument('manifestos', nargs='+')
+    mesclar_cmd.add_argument('--saida', help='grava o manifesto do lote se a cobertura estiver completa')
+
+    simular = comandos.add_parser('simular', help='um processo por nó nesta máquina, depois a mesclagem')
+    simular.add_argument('--nos', type=int, default=3)
+    simular.add_argument('--destino', default='output/lote')
+
+    args = parser.parse_args()
+
+    from config import YEARS_CONFIG
+    arquivo_excel = args.planilha or YEARS_CONFIG['WORKBOOKS'][args.ano]
+
+    if args.comando == 'gerar':
+        data_emissao = date.fromisoformat(args.data_emissao) if args.data_emissao else None
+        progresso = (lambda dados: print(json.dumps(dados), flush=True)) if args.progresso else None
+        try:
+            manifesto = GeracaoLote(arquivo_excel, args.destino, args.ano, ler_shard(args.shard),
+                                    data_emissao=data_emissao).executar(args.processos, progresso)
+        except LoteEmAndamento as e:
+            sys.exit(str(e))
+        print(f"Shard {args.shard}: {len(manifesto['declaracoes'])} declarações, "
+              f"{len(manifesto['falhas'])} falhas em {manifesto['segundos']}s")
+        return
+
+    if args.comando == 'simular':
+        # Mesma data de emissão em todos os "nós", como numa execução coordenada real
+        data_emissao = date.today().isoformat()
+        nos = [
+            subprocess.Popen([
+                sys.executable, os.path.abspath(__file__), '--ano', str(args.ano), '--planilha', arquivo_excel,
+                'gerar', '--shard', f'{indice}/{args.nos}', '--destino', args.destino,
+                '--data-emissao', data_emissao,
+            ])
+            for indice in range(args.nos)
+        ]
+        if any(no.wait() != 0 for no in nos):
+            sys.exit("Algum nó terminou com erro")
+        caminhos = [str(Path(args.destino) / nome_manifesto(indice, args.nos)) for indice in range(args.nos)]
+        saida = str(Path(args.destino) / 'manifest.json')
+    else:
+        caminhos = [caminho for padrao in args.manifestos for caminho in sorted(glob.glob(padrao))]
+        saida = args.saida
+
+    relatorio = _mesclar_arquivos(caminhos, arquivo_excel, args.ano, saida)
+    sys.exit(0 if relatorio.completo() else 1)
+
+
+if __name__ == "__main__":
+    main()
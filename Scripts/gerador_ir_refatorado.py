@@ -5,10 +5,15 @@ Implementa exatamente as fórmulas Excel fornecidas
 
 import openpyxl
 from openpyxl import load_workbook
+import hashlib
+import io
+import json
 import os
 import re
 import logging
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
 from pathlib import Path
 import sys
 from reportlab.lib.pagesizes import A4
@@ -17,6 +22,12 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab import rl_config
+from PIL import Image as PILImage
+
+from snapshot_planilha import ANO_PADRAO, aba_union, converter_valor_venda
+from validacao_base import motivo_invalido
+from log_estruturado import adicionar_arquivo
 
 # Adicionar o diretório pai ao path para importar config
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
@@ -34,22 +45,27 @@ except ImportError:
         },
         'TEST': {
             'TEST_CPF': '91446260968'
+        },
+        'YEARS': {
+            'DEFAULT_YEAR': ANO_PADRAO,
+            'WORKBOOKS': {ANO_PADRAO: 'IR 2024 - NÃO ALTERAR.xlsx'},
+            'MAX_LOADED_YEARS': 2
+        },
+        'PDF': {
+            'PROFILE': 'padrao',
+            'LOGO_DPI': 150,
+            'DETERMINISTIC': False
         }
     }
 
 def setup_logging():
-    """Configura logging"""
+    """
+    Configura logging (escrita em thread de fundo; ver log_estruturado.py).
+    O arquivo do gerador recebe só os registros deste módulo, também quando o
+    servidor já instalou o pipeline.
+    """
     log_dir = Path('logs')
-    log_dir.mkdir(exist_ok=True)
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_dir / 'gerador_ir_refatorado.log'),
-            logging.StreamHandler()
-        ]
-    )
+    adicionar_arquivo(log_dir / 'gerador_ir_refatorado.log', logger=__name__)
     return logging.getLogger(__name__)
 
 logger = setup_logging()
@@ -69,33 +85,20 @@ class ValidadorCPF:
         """Valida CPF com algoritmo oficial"""
         cpf_limpo = ValidadorCPF.limpar_cpf(cpf)
         
-        if len(cpf_limpo) != 11:
+        motivo = motivo_invalido(cpf_limpo)
+        if motivo == 'tamanho':
             return False, "CPF deve ter 11 dígitos"
-        
-        if len(set(cpf_limpo)) == 1:
+        if motivo is not None:
             return False, "CPF inválido"
         
-        try:
-            soma = sum(int(cpf_limpo[i]) * (10 - i) for i in range(9))
-            resto = soma % 11
-            digito1 = 0 if resto < 2 else 11 - resto
-            
-            soma = sum(int(cpf_limpo[i]) * (11 - i) for i in range(10))
-            resto = soma % 11
-            digito2 = 0 if resto < 2 else 11 - resto
-            
-            if int(cpf_limpo[9]) == digito1 and int(cpf_limpo[10]) == digito2:
-                return True, cpf_limpo
-            else:
-                return False, "CPF inválido"
-        except (ValueError, IndexError):
-            return False, "CPF inválido"
+        return True, cpf_limpo
 
 class BuscadorCliente:
     """Classe para busca de dados do cliente - IMPLEMENTA FÓRMULAS EXCEL"""
     
-    def __init__(self, arquivo_excel):
+    def __init__(self, arquivo_excel, snapshot=None):
         self.arquivo_excel = arquivo_excel
+        self.snapshot = snapshot
     
     def buscar_por_cpf(self, cpf_busca):
         """
@@ -107,6 +110,14 @@ class BuscadorCliente:
             logger.error(f"CPF inválido: {cpf_busca}")
             return None
         
+        if self.snapshot is not None:
+            dados = self.snapshot.buscar_cliente(cpf_clean)
+            if dados:
+                logger.info(f"Cliente encontrado: {dados['cliente']} - Empreendimento: {dados['empreendimento']}")
+            else:
+                logger.warning(f"CPF não encontrado: {cpf_clean}")
+            return dados
+        
         try:
             wb = load_workbook(self.arquivo_excel, data_only=True)
             
@@ -155,25 +166,23 @@ class BuscadorCliente:
     
     def _converter_valor_venda(self, valor):
         """Converte o valor da venda para float, tratando casos especiais"""
-        if valor is None:
-            return 0
-        
-        valor_str = str(valor).strip()
-        
-        # Se for "Verificar" ou similar, retorna 0
-        if valor_str.lower() in ['verificar', 'verificar ', 'n/a', '', 'verificar']:
-            return 0
-        
-        try:
-            return float(valor_str)
-        except (ValueError, TypeError):
-            return 0
+        return converter_valor_venda(valor)
 
 class CalculadorFinanceiro:
     """Classe para cálculos financeiros - IMPLEMENTA FÓRMULAS EXCEL"""
     
-    def __init__(self, arquivo_excel):
+    def __init__(self, arquivo_excel, snapshot=None, ano=ANO_PADRAO):
         self.arquivo_excel = arquivo_excel
+        self.snapshot = snapshot
+        self.ano = ano
+    
+    def _total_snapshot(self, cpf_cliente, campo):
+        """Total pré-calculado no snapshot (mesma regra do SOMASES)"""
+        totais = self.snapshot.totais_cliente(cpf_cliente)
+        if totais is None:
+            logger.warning(f"Nome do cliente não encontrado para CPF: {cpf_cliente}")
+            return 0
+        return totais[campo]
     
     def calcular_receita_bruta(self, cpf_cliente):
         """
@@ -182,11 +191,16 @@ class CalculadorFinanceiro:
         P:P = DIVISÃO - 1º NÍVEL (coluna 4) 
         E:E = CLIENTE (coluna 2)
         """
+        if self.snapshot is not None:
+            total = self._total_snapshot(cpf_cliente, 'receita_bruta')
+            logger.info(f"Receita bruta total: R$ {total:,.2f}")
+            return total
+        
         try:
             wb = load_workbook(self.arquivo_excel, data_only=True)
             
-            if 'UNION - 2024' not in wb.sheetnames:
-                logger.error("Planilha 'UNION - 2024' não encontrada")
+            if aba_union(self.ano) not in wb.sheetnames:
+                logger.error(f"Planilha '{aba_union(self.ano)}' não encontrada")
                 wb.close()
                 return 0
             
@@ -218,8 +232,8 @@ class CalculadorFinanceiro:
             
             logger.info(f"Buscando dados para cliente: {nome_cliente}")
             
-            # Agora buscar na UNION - 2024 pelo nome do cliente
-            ws = wb['UNION - 2024']
+            # Agora buscar na UNION do ano pelo nome do cliente
+            ws = wb[aba_union(self.ano)]
             total = 0
             
             # Buscar por nome do cliente na coluna B e tipo "RECEITA BRUTA" na coluna D
@@ -232,7 +246,8 @@ class CalculadorFinanceiro:
                     tipo_col_d and "RECEITA BRUTA" in str(tipo_col_d).upper() and
                     valor_col_c and isinstance(valor_col_c, (int, float))):
                     total += float(valor_col_c)
-                    logger.debug(f"Receita bruta encontrada: R$ {valor_col_c:,.2f} - Cliente: {cliente_col_b}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"Receita bruta encontrada: R$ {valor_col_c:,.2f} - Cliente: {cliente_col_b}")
             
             wb.close()
             logger.info(f"Receita bruta total: R$ {total:,.2f}")
@@ -249,11 +264,16 @@ class CalculadorFinanceiro:
         P:P = DIVISÃO - 1º NÍVEL (coluna 4)
         E:E = CLIENTE (coluna 2)
         """
+        if self.snapshot is not None:
+            total = self._total_snapshot(cpf_cliente, 'despesas_acessorias')
+            logger.info(f"Despesas acessórias total: R$ {total:,.2f}")
+            return total
+        
         try:
             wb = load_workbook(self.arquivo_excel, data_only=True)
             
-            if 'UNION - 2024' not in wb.sheetnames:
-                logger.error("Planilha 'UNION - 2024' não encontrada")
+            if aba_union(self.ano) not in wb.sheetnames:
+                logger.error(f"Planilha '{aba_union(self.ano)}' não encontrada")
                 wb.close()
                 return 0
             
@@ -283,8 +303,8 @@ class CalculadorFinanceiro:
                 wb.close()
                 return 0
             
-            # Agora buscar na UNION - 2024 pelo nome do cliente
-            ws = wb['UNION - 2024']
+            # Agora buscar na UNION do ano pelo nome do cliente
+            ws = wb[aba_union(self.ano)]
             total = 0
             
             # Buscar por nome do cliente na coluna B e tipo "ATIVO CIRCULANTE" na coluna D
@@ -297,7 +317,8 @@ class CalculadorFinanceiro:
                     tipo_col_d and "ATIVO CIRCULANTE" in str(tipo_col_d).upper() and
                     valor_col_c and isinstance(valor_col_c, (int, float))):
                     total += float(valor_col_c)
-                    logger.debug(f"Despesa acessória encontrada: R$ {valor_col_c:,.2f} - Cliente: {cliente_col_b}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"Despesa acessória encontrada: R$ {valor_col_c:,.2f} - Cliente: {cliente_col_b}")
             
             wb.close()
             logger.info(f"Despesas acessórias total: R$ {total:,.2f}")
@@ -314,11 +335,100 @@ class CalculadorFinanceiro:
         """
         return self.calcular_receita_bruta(cpf_cliente)  # Mesma lógica da receita bruta
 
+PERFIL_PADRAO = 'padrao'
+PERFIL_OTIMIZADO = 'otimizado'
+
+EMPRESA_EMISSORA = "Hyperion Empreendimentos e Incorporações SA"
+
+MESES_PT = (
+    'janeiro', 'fevereiro', 'março', 'abril', 'maio', 'junho',
+    'julho', 'agosto', 'setembro', 'outubro', 'novembro', 'dezembro'
+)
+
+class _FiltrosStreams:
+    """
+    `rl_config.useA85` vale para o processo inteiro e é lido durante o build().
+    Cada build declara o valor que precisa: builds com o mesmo valor rodam juntos,
+    um valor diferente espera os anteriores terminarem; sem builds ativos, volta o
+    valor padrão do ReportLab. Assim a saída não depende do perfil que rodou antes.
+    """
+
+    def __init__(self):
+        self._condicao = threading.Condition()
+        self._padrao = rl_config.useA85
+        self._ativos = 0
+        self._atual = self._padrao
+
+    @contextmanager
+    def usar(self, use_a85):
+        with self._condicao:
+            self._condicao.wait_for(lambda: self._ativos == 0 or self._atual == use_a85)
+            self._atual = rl_config.useA85 = use_a85
+            self._ativos += 1
+        try:
+            yield
+        finally:
+            with self._condicao:
+                self._ativos -= 1
+                if self._ativos == 0:
+                    self._atual = rl_config.useA85 = self._padrao
+                    self._condicao.notify_all()
+
+
+_filtros_streams = _FiltrosStreams()
+
+def formatar_data_emissao(data):
+    """'05 de março de 2025' (independente do locale do sistema)"""
+    return f"{data.day:02d} de {MESES_PT[data.month - 1]} de {data.year}"
+
+_logos_otimizados = {}
+_lock_logos = threading.Lock()
+
+def logo_otimizado(caminho, largura, altura, dpi):
+    """
+    PNG do logo reduzido ao tamanho impresso (`largura` x `altura` em pontos) em `dpi`,
+    sobre fundo branco (sem máscara de transparência). Gerado uma vez por processo.
+    """
+    chave = (caminho, os.path.getmtime(caminho), largura, altura, dpi)
+    with _lock_logos:
+        if chave not in _logos_otimizados:
+            imagem = PILImage.open(caminho)
+            imagem.load()
+            # Nunca amplia: imagens já menores que o tamanho impresso ficam como estão
+            alvo = (min(imagem.width, round(largura / inch * dpi)),
+                    min(imagem.height, round(altura / inch * dpi)))
+            
+            imagem = imagem.convert('RGBA')
+            fundo = PILImage.new('RGB', imagem.size, 'white')
+            fundo.paste(imagem, mask=imagem.getchannel('A'))
+            if fundo.size != alvo:
+                fundo = fundo.resize(alvo, PILImage.LANCZOS)
+            
+            buffer = io.BytesIO()
+            fundo.save(buffer, 'PNG', optimize=True)
+            _logos_otimizados[chave] = buffer.getvalue()
+        return _logos_otimizados[chave]
+
 class GeradorPDF:
     """Classe para geração de PDF - MANTIDA COMO ESTAVA"""
     
-    def __init__(self):
+    def __init__(self, ano=ANO_PADRAO, perfil=None, deterministico=None):
         self.config = config
+        self.ano = ano
+        self.perfil = perfil or config.get('PDF', {}).get('PROFILE', PERFIL_PADRAO)
+        if deterministico is None:
+            deterministico = config.get('PDF', {}).get('DETERMINISTIC', False)
+        self.deterministico = deterministico
+        # Perfil otimizado: streams binários, sem ASCII85 (~20% menores e válidos
+        # para arquivo e HTTP); o padrão mantém o valor do ReportLab
+        self.use_a85 = 0 if self.perfil == PERFIL_OTIMIZADO else _filtros_streams._padrao
+    
+    def _logo(self, caminho, largura, altura):
+        """Logo no tamanho impresso; no perfil otimizado, já reduzido para esse tamanho"""
+        if self.perfil == PERFIL_OTIMIZADO:
+            dpi = self.config.get('PDF', {}).get('LOGO_DPI', 150)
+            return Image(io.BytesIO(logo_otimizado(caminho, largura, altura, dpi)), width=largura, height=altura)
+        return Image(caminho, width=largura, height=altura)
     
     def _criar_estilos(self):
         """Cria estilos para o PDF"""
@@ -369,18 +479,18 @@ class GeradorPDF:
                 logger.warning(f"Logo da Hype não encontrado: {logo_hype_path}")
                 logo_hype = None
             else:
-                logo_hype = Image(logo_hype_path, width=1.2*inch, height=0.8*inch)
+                logo_hype = self._logo(logo_hype_path, 1.2*inch, 0.8*inch)
             
             if not os.path.exists(logo_ministerio_path):
                 logger.warning(f"Logo do Ministério não encontrado: {logo_ministerio_path}")
                 logo_ministerio = None
             else:
-                logo_ministerio = Image(logo_ministerio_path, width=0.5*inch, height=0.5*inch)
+                logo_ministerio = self._logo(logo_ministerio_path, 0.5*inch, 0.5*inch)
             
             # Criar texto central
             texto_central = Paragraph(
-                """<para align=center>
-                <b>ANO-CALENDÁRIO DE 2024<br/>
+                f"""<para align=center>
+                <b>ANO-CALENDÁRIO DE {self.ano}<br/>
                 IMPOSTO DE RENDA - PESSOA FÍSICA</b>
                 </para>""",
                 ParagraphStyle(
@@ -477,7 +587,7 @@ class GeradorPDF:
         except Exception as e:
             logger.error(f"Erro ao criar cabeçalho: {str(e)}")
             return Paragraph(
-                "<para align=center><b>ANO-CALENDÁRIO DE 2024<br/>IMPOSTO DE RENDA - PESSOA FÍSICA</b></para>",
+                f"<para align=center><b>ANO-CALENDÁRIO DE {self.ano}<br/>IMPOSTO DE RENDA - PESSOA FÍSICA</b></para>",
                 ParagraphStyle(
                     'SimpleHeader',
                     fontName='Helvetica-Bold',
@@ -592,7 +702,7 @@ class GeradorPDF:
         despesas_acessorias = valores_calculados.get('despesas_acessorias', 0)
         
         pagamentos_data = [
-            ['ESPECIFICAÇÃO', 'VALORES PAGOS EM 2024'],
+            ['ESPECIFICAÇÃO', f'VALORES PAGOS EM {self.ano}'],
             ['RECEITA', f"R$ {receita_bruta:,.2f}"],
             ['DESPESAS ACESSÓRIAS', f"R$ {despesas_acessorias:,.2f}"]
         ]
@@ -609,15 +719,50 @@ class GeradorPDF:
         ]))
         return pagamentos_table
     
-    def gerar_declaracao(self, cpf, dados_cliente, valores_calculados):
-        """Gera PDF da declaração de IR"""
+    def impressao_conteudo(self, cpf, dados_cliente, valores_calculados, data_emissao):
+        """Hash de tudo que determina o conteúdo do PDF (modo determinístico)"""
+        conteudo = json.dumps(
+            [self.ano, self.perfil, cpf, dados_cliente, valores_calculados, data_emissao.isoformat()],
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+    
+    def gerar_declaracao(self, cpf, dados_cliente, valores_calculados, caminho_saida=None, data_emissao=None):
+        """
+        Gera PDF da declaração de IR (em `caminho_saida`, se informado).
+        `data_emissao` (date) é a data do "Emitido em"; padrão: hoje.
+        """
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            nome_pdf = f"Declaracao_IR_{cpf}_{timestamp}.pdf"
+            data_emissao = data_emissao or date.today()
+            
+            metadados = {}
+            if self.perfil == PERFIL_OTIMIZADO:
+                metadados['pageCompression'] = 1
+            if self.deterministico:
+                # Datas fixas (invariant) e ID do documento derivado do conteúdo: o
+                # ReportLab calcula o ID a partir de título/autor/assunto/palavras-chave
+                impressao = self.impressao_conteudo(cpf, dados_cliente, valores_calculados, data_emissao)
+                metadados.update({
+                    'invariant': 1,
+                    'title': f"Declaração IR {self.ano} - {cpf}",
+                    'author': EMPRESA_EMISSORA,
+                    'subject': impressao,
+                    'creator': 'Gerador de IR'
+                })
+            
+            if caminho_saida:
+                nome_pdf = str(caminho_saida)
+            elif self.deterministico:
+                nome_pdf = f"Declaracao_IR_{cpf}_{metadados['subject'][:12]}.pdf"
+            else:
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                nome_pdf = f"Declaracao_IR_{cpf}_{timestamp}.pdf"
             
+            # Apenas fontes padrão (Helvetica), que não são embutidas no arquivo
             doc = SimpleDocTemplate(nome_pdf, pagesize=A4, 
                                   leftMargin=0.3*inch, rightMargin=0.8*inch,
-                                  topMargin=0.8*inch, bottomMargin=0.8*inch)
+                                  topMargin=0.8*inch, bottomMargin=0.8*inch,
+                                  **metadados)
             story = []
             
             title_style, section_style, normal_style = self._criar_estilos()
@@ -650,18 +795,7 @@ class GeradorPDF:
             # Footer
             story.append(HRFlowable(width="100%", thickness=0.5, color=colors.HexColor('#D9D9D9'), spaceAfter=10))
             
-            data_emissao = datetime.now().strftime('%d de %B de %Y')
-            meses_pt = {
-                'January': 'janeiro', 'February': 'fevereiro', 'March': 'março',
-                'April': 'abril', 'May': 'maio', 'June': 'junho',
-                'July': 'julho', 'August': 'agosto', 'September': 'setembro',
-                'October': 'outubro', 'November': 'novembro', 'December': 'dezembro'
-            }
-            
-            for mes_en, mes_pt in meses_pt.items():
-                data_emissao = data_emissao.replace(mes_en, mes_pt)
-            
-            story.append(Paragraph(f"Emitido em {data_emissao}", normal_style))
+            story.append(Paragraph(f"Emitido em {formatar_data_emissao(data_emissao)}", normal_style))
             story.append(Spacer(1, 15))
             
             # Linha de assinatura centralizada
@@ -677,9 +811,10 @@ class GeradorPDF:
                 textColor=colors.black,
                 leading=12
             )
-            story.append(Paragraph("Hyperion Empreendimentos e Incorporações SA", empresa_style))
+            story.append(Paragraph(EMPRESA_EMISSORA, empresa_style))
             
-            doc.build(story)
+            with _filtros_streams.usar(self.use_a85):
+                doc.build(story)
             
             logger.info(f"PDF gerado com sucesso: {nome_pdf}")
             return nome_pdf
@@ -693,14 +828,20 @@ class GeradorPDF:
 class GeradorIR:
     """Classe principal do gerador de IR - VERSÃO SIMPLIFICADA"""
     
-    def __init__(self):
+    def __init__(self, snapshot=None, ano=None, perfil=None, deterministico=None):
         self.config = config
-        self.arquivo_excel = config['FILES']['EXCEL_FILE']
-        self.buscador = BuscadorCliente(self.arquivo_excel)
-        self.calculador = CalculadorFinanceiro(self.arquivo_excel)
-        self.gerador_pdf = GeradorPDF()
+        self.ano = ano or (snapshot.ano if snapshot is not None else config['YEARS']['DEFAULT_YEAR'])
+        if snapshot is not None:
+            self.arquivo_excel = snapshot.arquivo_excel
+        else:
+            self.arquivo_excel = config['YEARS']['WORKBOOKS'][self.ano]
+        # Com snapshot (qualquer FonteDados: memória ou SQLite), buscas e somas usam
+        # consultas indexadas em vez de reabrir o Excel
+        self.buscador = BuscadorCliente(self.arquivo_excel, snapshot)
+        self.calculador = CalculadorFinanceiro(self.arquivo_excel, snapshot, self.ano)
+        self.gerador_pdf = GeradorPDF(self.ano, perfil, deterministico)
     
-    def gerar_declaracao(self, cpf):
+    def gerar_declaracao(self, cpf, caminho_saida=None, data_emissao=None):
         """Função principal para gerar declaração de IR"""
         logger.info(f"Iniciando geração de declaração para CPF: {cpf}")
         
@@ -730,7 +871,9 @@ class GeradorIR:
         logger.info(f"Valores calculados - Receita: R$ {receita_bruta:,.2f}, Despesas: R$ {despesas_acessorias:,.2f}")
         
         # Gerar PDF
-        nome_pdf = self.gerador_pdf.gerar_declaracao(cpf_clean, dados_cliente, valores_calculados)
+        nome_pdf = self.gerador_pdf.gerar_declaracao(
+            cpf_clean, dados_cliente, valores_calculados, caminho_saida, data_emissao
+        )
         
         if nome_pdf:
             logger.info(f"Declaração gerada com sucesso: {nome_pdf}")
@@ -0,0 +1,204 @@
+"""
+Logging Estruturado
+Handlers reais (console/arquivo) rodam em uma thread de fundo alimentada por fila,
+então a escrita de log nunca bloqueia a thread da requisição.
+Cada registro sai como uma linha JSON com o request_id da requisição corrente.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+
+# Contexto da requisição corrente (definido pelo servidor a cada requisição)
+_request_id = contextvars.ContextVar('request_id', default=None)
+_amostrada = contextvars.ContextVar('amostrada', default=True)
+
+# Atributos padrão de LogRecord - o que sobrar é tratado como campo extra
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'request_id'}
+
+_listener = None
+_handler_fila = None
+_formatador = None
+_arquivos = set()
+_lock = threading.Lock()
+
+
+def debug_ativo():
+    """Diagnósticos de laços internos (por linha/lançamento) só com IR_LOG_DEBUG=1"""
+    return os.environ.get('IR_LOG_DEBUG', '0') == '1'
+
+
+def taxa_amostragem():
+    """Fração das requisições cujos logs INFO/DEBUG são emitidos (LOG_SAMPLE_RATE)"""
+    try:
+        return min(1.0, max(0.0, float(os.environ.get('LOG_SAMPLE_RATE', 1))))
+    except ValueError:
+        return 1.0
+
+
+def iniciar_contexto(request_id=None, amostrar=None):
+    """
+    Marca o início de uma requisição: define o request_id e sorteia se os logs
+    informativos dela serão emitidos. Retorna (request_id, tokens) para encerrar_contexto.
+    """
+    request_id = request_id or uuid.uuid4().hex[:16]
+    if amostrar is None:
+        amostrar = random.random() < taxa_amostragem()
+    tokens = (_request_id.set(request_id), _amostrada.set(amostrar))
+    return request_id, tokens
+
+
+def encerrar_contexto(tokens):
+    _request_id.reset(tokens[0])
+    _amostrada.reset(tokens[1])
+
+
+def request_id_atual():
+    return _request_id.get()
+
+
+class FiltroContexto(logging.Filter):
+    """
+    Executado na thread de origem: anexa o request_id e descarta INFO/DEBUG
+    de requisições fora da amostra (WARNING ou acima sempre passam)
+    """
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return record.levelno >= logging.WARNING or _amostrada.get()
+
+
+class FormatadorJSON(logging.Formatter):
+    """Uma linha JSON por registro"""
+
+    def format(self, record):
+        dados = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensagem': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO:
+                dados[chave] = valor
+        if record.exc_info:
+            dados['excecao'] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class FormatadorTexto(logging.Formatter):
+    """Formato legível original, com o request_id quando houver"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(levelname)s - %(message)s')
+
+    def format(self, record):
+        texto = super().format(record)
+        request_id = getattr(record, 'request_id', None)
+        return f"{texto} [{request_id}]" if request_id else texto
+
+
+def configurar_logging(arquivo=None, formato=None):
+    """
+    Instala o pipeline no logger raiz (uma vez por processo; chamadas seguintes são ignoradas).
+
+    - formato: 'json' (padrão, LOG_FORMAT) ou 'texto'
+    - arquivo: caminho opcional de arquivo de log, escrito pela thread de fundo
+    - nível: DEBUG com IR_LOG_DEBUG=1, senão INFO
+    """
+    global _listener, _handler_fila, _formatador
+
+    with _lock:
+        if _listener is not None:
+            return
+
+        formato = formato or os.environ.get('LOG_FORMAT', 'json')
+        formatador = _formatador = FormatadorJSON() if formato == 'json' else FormatadorTexto()
+
+        destinos = [logging.StreamHandler()]
+        if arquivo:
+            Path(arquivo).parent.mkdir(parents=True, exist_ok=True)
+            destinos.append(logging.FileHandler(arquivo))
+            _arquivos.add(str(Path(arquivo).resolve()))
+        for handler in destinos:
+            handler.setFormatter(formatador)
+
+        fila = queue.SimpleQueue()
+        handler_fila = _handler_fila = QueueHandler(fila)
+        handler_fila.addFilter(FiltroContexto())
+
+        raiz = logging.getLogger()
+        for antigo in list(raiz.handlers):
+            raiz.removeHandler(antigo)
+        raiz.addHandler(handler_fila)
+        raiz.setLevel(logging.DEBUG if debug_ativo() else logging.INFO)
+
+        _listener = QueueListener(fila, *destinos, respect_handler_level=True)
+        _listener.start()
+        atexit.register(parar_logging)
+
+
+def adicionar_arquivo(arquivo, logger=None):
+    """
+    Acrescenta um arquivo de log ao pipeline já instalado (instala, se preciso).
+    Com `logger`, o arquivo recebe só os registros desse logger e dos filhos;
+    um mesmo arquivo é acrescentado uma única vez.
+    """
+    configurar_logging()
+
+    with _lock:
+        caminho = str(Path(arquivo).resolve())
+        if _listener is None or caminho in _arquivos:
+            return
+        Path(arquivo).parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.FileHandler(arquivo)
+        handler.setFormatter(_formatador)
+        if logger:
+            handler.addFilter(logging.Filter(logger))
+        # A thread de fundo lê `handlers` a cada registro: trocar a tupla basta
+        _listener.handlers = _listener.handlers + (handler,)
+        _arquivos.add(caminho)
+
+
+def parar_logging():
+    """Esvazia a fila e encerra a thread de escrita"""
+    global _listener
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            _arquivos.clear()
+
+
+def _reiniciar_apos_fork():
+    """
+    No processo filho (workers do gunicorn com --preload, pools com fork) a thread
+    de escrita não existe: sem ela a fila só cresce e nada é gravado. O filho
+    recebe uma fila nova (a herdada pode ter registros que o pai ainda vai escrever)
+    e a sua própria thread.
+    """
+    global _lock
+
+    _lock = threading.Lock()
+    if _listener is None:
+        return
+    fila = queue.SimpleQueue()
+    _handler_fila.queue = fila
+    _listener.queue = fila
+    _listener._thread = None
+    _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_apos_fork)
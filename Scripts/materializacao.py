@@ -0,0 +1,261 @@
+"""
+Materialização Antecipada das Declarações
+Após cada nova versão da planilha, pré-gera o PDF de todos os clientes em disco.
+Só clientes cuja linha da 'Base de Clientes ' ou totais da UNION mudaram são regerados;
+a troca do dia (data do "Emitido em") ou do perfil de PDF regera todos.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem exclusão entre processos
+    fcntl = None
+
+from diff_planilha import comparar_assinaturas
+from snapshot_planilha import ANO_PADRAO, SnapshotPlanilha, versao_planilha
+
+logger = logging.getLogger(__name__)
+
+
+def _perfil_configurado():
+    """PDF_PROFILE do config.py (o mesmo que o GeradorPDF usa sem perfil explícito)"""
+    try:
+        from config import PDF_CONFIG
+        return PDF_CONFIG['PROFILE']
+    except ImportError:
+        return 'padrao'
+
+
+class MaterializadorDeclaracoes:
+    """
+    Armazena as declarações em `diretorio` como `{cpf}_{digital}.pdf`.
+
+    O digital cobre a linha do cliente, seus totais, o perfil de PDF e a data de
+    emissão, então um PDF existente com o mesmo nome continua válido entre versões
+    da planilha, mas não de um dia para o outro. O `manifest.json` aponta, para a
+    versão, o perfil e o dia atuais, qual arquivo serve cada CPF.
+
+    `obter_snapshot()` devolve o snapshot da versão atual (ex.: o do
+    RegistroSnapshots do servidor, para não ler a planilha de novo); padrão:
+    um SnapshotPlanilha próprio.
+    """
+
+    MANIFESTO = 'manifest.json'
+
+    def __init__(self, arquivo_excel, diretorio, ano=ANO_PADRAO, perfil=None, obter_snapshot=None):
+        self.arquivo_excel = arquivo_excel
+        self.ano = ano
+        self.perfil = perfil or _perfil_configurado()
+        self.obter_snapshot = obter_snapshot or (
+            lambda: SnapshotPlanilha(arquivo_excel, versao_planilha(arquivo_excel), ano)
+        )
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self._manifesto_cache = (None, None)
+        self._thread = None
+        self._parar = threading.Event()
+        self.ultimo_resumo = None
+
+    # ------------------------------------------------------------------ leitura
+
+    def _ler_manifesto(self):
+        """Manifesto atual (relido apenas quando o arquivo muda)"""
+        caminho = self.diretorio / self.MANIFESTO
+        try:
+            mtime = caminho.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        cache_mtime, manifesto = self._manifesto_cache
+        if cache_mtime != mtime:
+            with open(caminho, encoding='utf-8') as f:
+                manifesto = json.load(f)
+            self._manifesto_cache = (mtime, manifesto)
+        return manifesto
+
+    def _atual(self, manifesto, versao):
+        """O manifesto é da versão, do perfil e do dia de emissão atuais?"""
+        return bool(manifesto) and (
+            manifesto.get('versao') == versao
+            and manifesto.get('perfil') == self.perfil
+            and manifesto.get('data_emissao') == date.today().isoformat()
+        )
+
+    def caminho_pdf(self, cpf):
+        """PDF pré-gerado para o CPF na versão atual da planilha, ou None"""
+        manifesto = self._ler_manifesto()
+        if not self._atual(manifesto, versao_planilha(self.arquivo_excel)):
+            return None
+
+        digital = manifesto['clientes'].get(cpf)
+        if not digital:
+            return None
+
+        caminho = self.diretorio / f"{cpf}_{digital}.pdf"
+        return caminho if caminho.exists() else None
+
+    # ------------------------------------------------------------------ geração
+
+    def _lock_exclusivo(self):
+        """Lock não bloqueante para que apenas um processo materialize por vez"""
+        arquivo = open(self.diretorio / '.materializacao.lock', 'a')
+        if fcntl is None:
+            return arquivo
+        try:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            arquivo.close()
+            return None
+        return arquivo
+
+    def sincronizar(self):
+        """
+        Pré-gera as declarações da versão atual da planilha, se ainda não estiverem prontas.
+        Retorna um resumo da execução, ou None se nada precisou ser feito.
+        """
+        versao = versao_planilha(self.arquivo_excel)
+        if self._atual(self._ler_manifesto(), versao):
+            return None
+
+        lock = self._lock_exclusivo()
+        if lock is None:
+            logger.info("Materialização em andamento em outro processo")
+            return None
+
+        try:
+            # Outro processo pode ter concluído enquanto aguardávamos
+            if self._atual(self._ler_manifesto(), versao):
+                return None
+            return self._materializar()
+        finally:
+            lock.close()
+
+    @staticmethod
+    def _digital(snapshot, cpf, perfil, data_emissao):
+        """Impressão digital do cliente + perfil + data: o que muda o conteúdo do PDF"""
+        conteudo = f"{snapshot.impressao_digital(cpf)}:{perfil}:{data_emissao.isoformat()}"
+        return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()[:16]
+
+    def _materializar(self):
+        # Import tardio: o gerador (reportlab) é opcional para quem só consulta o manifesto
+        from gerador_ir_refatorado import GeradorIR
+
+        inicio = time.monotonic()
+        snapshot = self.obter_snapshot()
+        versao = snapshot.versao
+        # Data fixada no início: uma execução que cruza a meia-noite não mistura dias
+        data_emissao = date.today()
+        perfil = self.perfil
+        gerador = GeradorIR(snapshot, perfil=perfil)
+        logger.info(f"Materializando declarações de {self.ano}, versão {versao} ({perfil}, {data_emissao})...")
+
+        anterior = self._ler_manifesto() or {}
+        assinaturas = snapshot.assinaturas()
+        diferenca = comparar_assinaturas(anterior.get('assinaturas', {}), assinaturas)
+        afetados = diferenca.afetados()
+        logger.info(f"Diferenças desde a versão {anterior.get('versao')}: {diferenca.resumo()}")
+
+        clientes = {}
+        falhas = {}
+        renderizados = 0
+        for cpf in assinaturas:
+            digital = self._digital(snapshot, cpf, perfil, data_emissao)
+            destino = self.diretorio / f"{cpf}_{digital}.pdf"
+            # Inalterados reaproveitam o PDF; arquivos ausentes são regerados de qualquer forma
+            if cpf in afetados or not destino.exists():
+                temporario = destino.with_suffix('.tmp')
+                sucesso, resultado = gerador.gerar_declaracao(
+                    cpf, caminho_saida=temporario, data_emissao=data_emissao
+                )
+                if not sucesso:
+                    falhas[cpf] = resultado
+                    continue
+                os.replace(temporario, destino)
+                renderizados += 1
+            clientes[cpf] = digital
+
+        self._gravar_manifesto({
+            'versao': versao,
+            'perfil': perfil,
+            'data_emissao': data_emissao.isoformat(),
+            'gerado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'versao_anterior': anterior.get('versao'),
+            'diferenca': diferenca.resumo(),
+            'clientes': clientes,
+            'falhas': falhas,
+            'assinaturas': assinaturas
+        })
+        removidos = self._remover_obsoletos(clientes)
+
+        resumo = {
+            'versao': versao,
+            'clientes': len(clientes),
+            'renderizados': renderizados,
+            'reaproveitados': len(clientes) - renderizados,
+            'falhas': len(falhas),
+            'removidos': removidos,
+            'diferenca': diferenca.resumo(),
+            'segundos': round(time.monotonic() - inicio, 2)
+        }
+        self.ultimo_resumo = resumo
+        logger.info(f"Materialização concluída: {resumo}")
+        return resumo
+
+    def _gravar_manifesto(self, manifesto):
+        """Grava o manifesto de forma atômica"""
+        caminho = self.diretorio / self.MANIFESTO
+        temporario = caminho.with_suffix('.tmp')
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+
+    def _remover_obsoletos(self, clientes):
+        """Apaga PDFs que não pertencem mais à versão atual"""
+        validos = {f"{cpf}_{digital}.pdf" for cpf, digital in clientes.items()}
+        removidos = 0
+        for arquivo in self.diretorio.glob('*.pdf'):
+            if arquivo.name not in validos:
+                arquivo.unlink(missing_ok=True)
+                removidos += 1
+        return removidos
+
+    # ------------------------------------------------------------ monitoramento
+
+    def iniciar(self, intervalo=60):
+        """Monitora a planilha em segundo plano e materializa cada nova versão"""
+        if self._thread is not None:
+            return
+
+        def monitorar():
+            while not self._parar.is_set():
+                try:
+                    self.sincronizar()
+                except Exception as e:
+                    logger.error(f"Erro na materialização: {str(e)}")
+                self._parar.wait(intervalo)
+
+        self._thread = threading.Thread(target=monitorar, name=f'materializacao-{self.ano}', daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def status(self):
+        """Estado atual para métricas"""
+        manifesto = self._ler_manifesto() or {}
+        return {
+            'ano': self.ano,
+            'versao_materializada': manifesto.get('versao'),
+            'versao_atual': versao_planilha(self.arquivo_excel),
+            'clientes': len(manifesto.get('clientes', {})),
+            'falhas': len(manifesto.get('falhas', {})),
+            'ultimo_resumo': self.ultimo_resumo
+        }
@@ -0,0 +1,87 @@
+"""
+Memória dos Registros de Clientes
+Compara o custo de manter a 'Base de Clientes ' em memória como um dict por
+cliente (formato anterior) e como RegistroCliente (__slots__ + textos repetidos
+internados), extrapolando as linhas reais da planilha para 100 mil clientes.
+
+Uso (na raiz do projeto): python Scripts/memoria_clientes.py [quantidade] [ano]
+"""
+
+import gc
+import os
+import sys
+import tracemalloc
+
+from openpyxl import load_workbook
+
+from snapshot_planilha import (
+    ABA_CLIENTES, ANO_PADRAO, CAMPOS_CLIENTE, RegistroCliente, _celula, converter_valor_venda, limpar_cpf
+)
+
+
+def linhas_base(arquivo_excel):
+    """Linhas com CPF da 'Base de Clientes ', como o openpyxl as entrega"""
+    wb = load_workbook(arquivo_excel, read_only=True, data_only=True)
+    try:
+        linhas = list(wb[ABA_CLIENTES].iter_rows(min_row=2, max_col=13, values_only=True))
+    finally:
+        wb.close()
+    return [linha for linha in linhas if limpar_cpf(_celula(linha, 1))]
+
+
+def linhas_sinteticas(linhas, quantidade):
+    """
+    `quantidade` linhas reaproveitando as reais em ciclo; CPF e nome ficam únicos
+    (campos repetidos, como empreendimento e cidade, mantêm a distribuição real)
+    """
+    for indice in range(quantidade):
+        linha = list(linhas[indice % len(linhas)])
+        linha[0] = f"{linha[0]} {indice}"
+        linha[1] = f"{indice:011d}"
+        yield tuple(linha)
+
+
+def como_dict(cpf, linha):
+    """Formato anterior: um dict por cliente"""
+    dados = {'cpf': cpf}
+    for campo, indice in CAMPOS_CLIENTE:
+        dados[campo] = str(_celula(linha, indice) or '')
+    dados['valor_venda'] = converter_valor_venda(_celula(linha, 12))
+    return dados
+
+
+def medir(fabrica, linhas):
+    """Bytes alocados para manter os registros vivos (tracemalloc)"""
+    gc.collect()
+    tracemalloc.start()
+    registros = [fabrica(limpar_cpf(linha[1]), linha) for linha in linhas]
+    atual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del registros
+    return atual
+
+
+def main():
+    quantidade = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    ano = int(sys.argv[2]) if len(sys.argv) > 2 else ANO_PADRAO
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import YEARS_CONFIG
+
+    reais = linhas_base(YEARS_CONFIG['WORKBOOKS'][ano])
+    # As linhas de entrada são compartilhadas e ficam fora da medição
+    linhas = list(linhas_sinteticas(reais, quantidade))
+
+    resultados = {
+        'dict por cliente': medir(como_dict, linhas),
+        'RegistroCliente': medir(RegistroCliente, linhas),
+    }
+    base = resultados['dict por cliente']
+    print(f"{quantidade:,} clientes (a partir de {len(reais)} linhas reais)")
+    for nome, total in resultados.items():
+        print(f"{nome:<18} {total / 2**20:>8.1f} MiB  {total / quantidade:>6.0f} bytes/cliente  "
+              f"({total / base:.0%})")
+
+
+if __name__ == "__main__":
+    main()
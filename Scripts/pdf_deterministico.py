@@ -0,0 +1,64 @@
+"""
+Verificação do Modo Determinístico de PDF
+Gera a mesma declaração duas vezes neste processo e uma vez em outro processo,
+com a mesma data de emissão, e confere que os bytes são idênticos; com outra
+data de emissão, o arquivo (e o ID do documento) deve mudar.
+
+Uso (na raiz do projeto): python Scripts/pdf_deterministico.py [cpf] [AAAA-MM-DD]
+Sai com código 1 se alguma verificação falhar.
+"""
+
+import hashlib
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+from gerador_ir_refatorado import GeradorIR, config
+
+
+def gerar(cpf, data_emissao, destino):
+    """sha256 do PDF gerado em modo determinístico"""
+    sucesso, resultado = GeradorIR(deterministico=True).gerar_declaracao(
+        cpf, caminho_saida=destino, data_emissao=data_emissao
+    )
+    if not sucesso:
+        raise SystemExit(f"Falha ao gerar declaração: {resultado}")
+    return hashlib.sha256(Path(destino).read_bytes()).hexdigest()
+
+
+def main():
+    cpf = sys.argv[1] if len(sys.argv) > 1 else config['TEST']['TEST_CPF']
+    data_emissao = date.fromisoformat(sys.argv[2]) if len(sys.argv) > 2 else date(2025, 3, 1)
+
+    # Modo interno: chamado pelo próprio script em outro processo
+    if len(sys.argv) > 3:
+        print(gerar(cpf, data_emissao, sys.argv[3]))
+        return
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        diretorio = Path(diretorio)
+        primeiro = gerar(cpf, data_emissao, diretorio / 'a.pdf')
+        segundo = gerar(cpf, data_emissao, diretorio / 'b.pdf')
+        outro_processo = subprocess.run(
+            [sys.executable, __file__, cpf, data_emissao.isoformat(), str(diretorio / 'c.pdf')],
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        outra_data = gerar(cpf, data_emissao + timedelta(days=1), diretorio / 'd.pdf')
+
+    verificacoes = [
+        ('mesmo processo', primeiro == segundo),
+        ('outro processo', primeiro == outro_processo),
+        ('outra data de emissão muda o arquivo', primeiro != outra_data),
+    ]
+    for descricao, ok in verificacoes:
+        print(f"{'OK   ' if ok else 'FALHA'} {descricao}")
+    print(f"sha256: {primeiro}")
+
+    if not all(ok for _, ok in verificacoes):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
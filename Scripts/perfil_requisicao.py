@@ -0,0 +1,60 @@
+"""
+Profiling sob Demanda por Requisição
+Envolve uma requisição específica em cProfile e grava o resultado (formato pstats)
+em um arquivo nomeado pelo request_id. Ativado apenas quando o servidor permite
+(PROFILE_REQUESTS=1) e a requisição pede; as demais não passam por aqui.
+
+Leitura do arquivo: python -m pstats logs/profiles/<request_id>.prof
+"""
+
+import cProfile
+import logging
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# A partir do Python 3.12 só um cProfile pode estar ativo por processo:
+# enquanto uma requisição é perfilada, pedidos simultâneos seguem sem profiling
+_lock = threading.Lock()
+
+
+class PerfilRequisicao:
+    """Profiling de uma requisição, da entrada até a resposta montada"""
+
+    def __init__(self, request_id, diretorio):
+        self.request_id = request_id
+        self.diretorio = Path(diretorio)
+        self.inicio = time.monotonic()
+        self._perfil = cProfile.Profile()
+
+    @classmethod
+    def iniciar(cls, request_id, diretorio):
+        """Perfil já ativo, ou None se outra requisição estiver sendo perfilada"""
+        if not _lock.acquire(blocking=False):
+            logger.warning(f"Profiling ignorado para {request_id}: outra requisição já está sendo perfilada")
+            return None
+        perfil = cls(request_id, diretorio)
+        try:
+            perfil._perfil.enable()
+        except Exception:
+            _lock.release()
+            raise
+        return perfil
+
+    def encerrar(self):
+        """Para o profiling e grava `<request_id>.prof`; retorna o caminho"""
+        try:
+            self._perfil.disable()
+        finally:
+            _lock.release()
+
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        caminho = self.diretorio / f"{self.request_id}.prof"
+        self._perfil.dump_stats(caminho)
+        logger.info(
+            f"Profile gravado em {caminho} ({(time.monotonic() - self.inicio) * 1000:.1f}ms)",
+            extra={'profile': str(caminho)}
+        )
+        return caminho
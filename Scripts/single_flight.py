@@ -0,0 +1,150 @@
+"""
+Single-flight - Deduplicação de trabalhos idênticos em andamento
+Enquanto uma chave está sendo processada, chamadas iguais aguardam e recebem o mesmo resultado
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas deduplicação entre threads
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Chamada:
+    """Trabalho em andamento para uma chave"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.aguardando = 0
+
+
+class SingleFlight:
+    """
+    Deduplica chamadas concorrentes pela chave.
+
+    - Entre threads do mesmo processo: a primeira chamada (líder) executa a função,
+      as demais aguardam o evento e recebem o mesmo resultado (ou a mesma exceção).
+    - Entre processos (workers): se `diretorio_locks` for informado, o líder ainda
+      obtém um lock de arquivo exclusivo por chave. Um worker que chega depois fica
+      bloqueado até o primeiro terminar; a função deve então consultar o armazenamento
+      compartilhado onde o primeiro worker gravou o resultado.
+    """
+
+    def __init__(self, diretorio_locks=None):
+        self._chamadas = {}
+        self._lock = threading.Lock()
+        self.diretorio_locks = None
+        if diretorio_locks and fcntl is not None:
+            self.diretorio_locks = Path(diretorio_locks)
+            self.diretorio_locks.mkdir(parents=True, exist_ok=True)
+        self._lideradas = 0
+        self._compartilhadas = 0
+
+    @contextmanager
+    def _lock_processos(self, chave):
+        """Lock de arquivo por chave (no-op sem diretório compartilhado)"""
+        if self.diretorio_locks is None:
+            yield
+            return
+
+        caminho = self.diretorio_locks / f"{chave}.lock"
+        while True:
+            f = open(caminho, 'a')
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                # limpar_locks pode ter apagado o arquivo enquanto esperávamos: o lock
+                # obtido é de um inode órfão, e quem abrir o caminho agora não o veria
+                if os.fstat(f.fileno()).st_ino == os.stat(caminho).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()
+
+        with f:
+            # mtime = último uso da chave (referência para limpar_locks)
+            os.utime(f.fileno())
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def executar(self, chave, funcao):
+        """
+        Executa `funcao()` uma única vez por chave em andamento.
+        Retorna (resultado, compartilhado) - compartilhado=True quando a chamada
+        apenas aguardou o resultado de outra.
+        """
+        with self._lock:
+            chamada = self._chamadas.get(chave)
+            if chamada is not None:
+                chamada.aguardando += 1
+                self._compartilhadas += 1
+                lider = False
+            else:
+                chamada = _Chamada()
+                self._chamadas[chave] = chamada
+                self._lideradas += 1
+                lider = True
+
+        if not lider:
+            logger.info(f"Aguardando processamento em andamento: {chave}")
+            chamada.evento.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado, True
+
+        try:
+            with self._lock_processos(chave):
+                chamada.resultado = funcao()
+        except BaseException as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._chamadas[chave]
+            chamada.evento.set()
+
+        return chamada.resultado, False
+
+    def limpar_locks(self, idade_maxima):
+        """
+        Remove arquivos de lock sem uso há mais de `idade_maxima` segundos (um por
+        chave já processada). Só apaga o que consegue travar sem esperar, ou seja,
+        que nenhum processo está usando. Retorna quantos foram removidos.
+        """
+        if self.diretorio_locks is None:
+            return 0
+
+        limite = time.time() - idade_maxima
+        removidos = 0
+        for caminho in self.diretorio_locks.glob('*.lock'):
+            try:
+                if caminho.stat().st_mtime > limite:
+                    continue
+                with open(caminho, 'a') as f:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    caminho.unlink()
+                    removidos += 1
+            except (BlockingIOError, FileNotFoundError):
+                continue
+        return removidos
+
+    def metricas(self):
+        """Contadores de chamadas lideradas/compartilhadas"""
+        with self._lock:
+            return {
+                'em_andamento': len(self._chamadas),
+                'lideradas': self._lideradas,
+                'compartilhadas': self._compartilhadas,
+                'entre_processos': self.diretorio_locks is not None
+            }
@@ -0,0 +1,599 @@
+"""
+Snapshot da Planilha de IR
+Carrega 'Base de Clientes ' e 'UNION - <ano>' uma única vez em memória e
+pré-calcula os totais de cada cliente (mesmas regras do CalculadorFinanceiro)
+"""
+
+import hashlib
+import heapq
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import itertools
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from xml.etree import ElementTree
+
+from openpyxl import load_workbook
+
+from avaliacao_formulas import abas_sem_valores, motor_formulas
+from busca_prefixo import IndicePrefixo
+from fonte_dados import FonteDados
+from single_flight import SingleFlight
+from validacao_base import validar_cpfs
+
+logger = logging.getLogger(__name__)
+
+ABA_CLIENTES = 'Base de Clientes '
+ANO_PADRAO = 2024
+
+
+def aba_union(ano):
+    """Nome da aba de lançamentos do ano-calendário"""
+    return f'UNION - {ano}'
+
+# Campos do cliente na ordem das colunas A..M da 'Base de Clientes '
+# (coluna B - CPF - é tratada à parte; K = Estado e L = Cidade)
+CAMPOS_CLIENTE = (
+    ('cliente', 0),
+    ('empreendimento', 2),
+    ('sigla', 3),
+    ('unidade', 4),
+    ('nome_social', 5),
+    ('cnpj_empreendimento', 6),
+    ('endereco', 7),
+    ('numero', 8),
+    ('bairro', 9),
+    ('cidade', 11),
+    ('estado', 10),
+)
+
+# Campos que se repetem entre clientes (mesmo empreendimento, cidade...): uma única
+# cópia de cada texto é mantida em memória (sys.intern)
+CAMPOS_REPETIDOS = frozenset((
+    'empreendimento', 'sigla', 'nome_social', 'cnpj_empreendimento',
+    'endereco', 'numero', 'bairro', 'cidade', 'estado'
+))
+
+# Colunas lidas de cada aba (A..M na base, A..D na UNION)
+COLUNAS_CLIENTES = 13
+COLUNAS_UNION = 4
+
+# Leitura das duas abas em processos separados: '1', '0' ou 'auto' (com mais de um núcleo)
+CARGA_PARALELA = os.environ.get('IR_PARALLEL_LOAD', 'auto')
+
+# Avaliação das fórmulas sem valor calculado gravado: 'auto' (só quando faltam) ou '0'
+AVALIAR_FORMULAS = os.environ.get('IR_EVALUATE_FORMULAS', 'auto')
+
+# Categorias da coluna D (DIVISÃO - 1º NÍVEL) somadas na declaração
+CATEGORIA_RECEITA = 'RECEITA BRUTA'
+CATEGORIA_DESPESAS = 'ATIVO CIRCULANTE'
+
+
+# Total da declaração alimentado por cada categoria
+TOTAL_DA_CATEGORIA = {
+    CATEGORIA_RECEITA: 'receita_bruta',
+    CATEGORIA_DESPESAS: 'despesas_acessorias',
+}
+
+
+def item_lancamento(linha, cliente, entrada, divisao, categoria):
+    """Linha da UNION somada em um total, no formato do detalhamento por cliente"""
+    return {
+        'linha': linha,
+        'total': TOTAL_DA_CATEGORIA[categoria],
+        'divisao': str(divisao),
+        'entrada': float(entrada),
+        'cliente': str(cliente),
+    }
+
+
+def categoria_lancamento(cliente, entrada, divisao):
+    """
+    Categoria somada pelo SOMASES (CATEGORIA_RECEITA / CATEGORIA_DESPESAS),
+    ou None se o lançamento não entra em nenhum total
+    """
+    if not cliente or not divisao or not entrada or not isinstance(entrada, (int, float)):
+        return None
+    divisao = str(divisao).upper()
+    if CATEGORIA_RECEITA in divisao:
+        return CATEGORIA_RECEITA
+    if CATEGORIA_DESPESAS in divisao:
+        return CATEGORIA_DESPESAS
+    return None
+
+# Cache da versão por (caminho, mtime, tamanho) para não recalcular o hash a cada requisição
+_versoes = {}
+_versoes_lock = threading.Lock()
+_locks_arquivos = {}   # caminho -> lock do cálculo do hash
+
+
+def versao_planilha(caminho):
+    """
+    Retorna a versão dos dados (hash SHA-256 do conteúdo, 16 caracteres).
+    Só relê o arquivo quando mtime ou tamanho mudam.
+    """
+    stat = os.stat(caminho)
+    chave = (os.path.abspath(caminho), stat.st_mtime_ns, stat.st_size)
+
+    versao = _versoes.get(chave)
+    if versao is not None:
+        return versao
+
+    # Requisições simultâneas do mesmo arquivo novo calculam o hash uma vez só;
+    # arquivos diferentes (outros anos) não esperam um pelo outro
+    with _versoes_lock:
+        lock_arquivo = _locks_arquivos.setdefault(chave[0], threading.Lock())
+
+    with lock_arquivo:
+        versao = _versoes.get(chave)
+        if versao is not None:
+            return versao
+
+        sha = hashlib.sha256()
+        with open(caminho, 'rb') as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(bloco)
+        versao = sha.hexdigest()[:16]
+
+        with _versoes_lock:
+            # Mantém apenas a versão mais recente de cada arquivo
+            for antiga in [k for k in _versoes if k[0] == chave[0]]:
+                del _versoes[antiga]
+            _versoes[chave] = versao
+    return versao
+
+
+def limpar_cpf(cpf):
+    """Remove caracteres não numéricos do CPF"""
+    if not cpf:
+        return ""
+    return re.sub(r'[^\d]', '', str(cpf))
+
+
+def converter_valor_venda(valor):
+    """Converte o valor da venda para float, tratando casos especiais"""
+    if valor is None:
+        return 0
+
+    valor_str = str(valor).strip()
+
+    # Se for "Verificar" ou similar, retorna 0
+    if valor_str.lower() in ['verificar', 'n/a', '']:
+        return 0
+
+    try:
+        return float(valor_str)
+    except (ValueError, TypeError):
+        return 0
+
+
+def _celula(linha, indice):
+    """Valor da coluna `indice` (0-based) - linhas em read-only podem vir truncadas"""
+    return linha[indice] if indice < len(linha) else None
+
+
+def _ler_aba(arquivo_excel, aba, max_col):
+    """
+    Executado em um processo filho: (nomes das abas, linhas 2.. da aba nas colunas
+    1..max_col), com linhas = None se a aba não existir
+    """
+    wb = load_workbook(arquivo_excel, read_only=True, data_only=True)
+    try:
+        if aba not in wb.sheetnames:
+            return list(wb.sheetnames), None
+        return list(wb.sheetnames), list(wb[aba].iter_rows(min_row=2, max_col=max_col, values_only=True))
+    finally:
+        wb.close()
+
+
+def _carga_paralela_ativa():
+    if CARGA_PARALELA == 'auto':
+        return (os.cpu_count() or 1) > 1
+    return CARGA_PARALELA == '1'
+
+
+def _contexto_processos():
+    """
+    fork onde existir: o filho já nasce com openpyxl carregado e não reexecuta o
+    módulo principal (spawn/forkserver reimportariam o servidor inteiro a cada carga).
+    O filho só lê a planilha e devolve as linhas; os locks de logging e de import são
+    reinicializados pelo próprio Python após o fork.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+
+class RegistroCliente:
+    """
+    Linha da 'Base de Clientes ' em memória: atributos fixos (__slots__) em vez de um
+    dict por cliente. `para_dict()` devolve o dict de BuscadorCliente.buscar_por_cpf.
+    """
+
+    __slots__ = ('cpf',) + tuple(campo for campo, _ in CAMPOS_CLIENTE) + ('valor_venda',)
+
+    def __init__(self, cpf, linha):
+        self.cpf = cpf
+        for campo, indice in CAMPOS_CLIENTE:
+            valor = str(_celula(linha, indice) or '')
+            setattr(self, campo, sys.intern(valor) if campo in CAMPOS_REPETIDOS else valor)
+        self.valor_venda = converter_valor_venda(_celula(linha, 12))
+
+    def __getitem__(self, campo):
+        return getattr(self, campo)
+
+    def para_dict(self):
+        """Dict novo, com as chaves na mesma ordem de sempre (cpf, campos, valor_venda)"""
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+
+class SnapshotPlanilha(FonteDados):
+    """
+    Visão imutável da planilha em memória.
+
+    Substitui as varreduras célula a célula por índices:
+    - CPF normalizado -> posição do cliente (primeira ocorrência, como o PROCV)
+    - nome (minúsculo) na UNION -> lançamentos daquele nome
+    - totais de RECEITA BRUTA / ATIVO CIRCULANTE por cliente, com a mesma regra
+      `nome_cliente in CLIENTE` (substring, sem diferenciar maiúsculas) do SOMASES
+    - nome do cliente -> posições dos lançamentos somados (detalhamento dos totais)
+    """
+
+    def __init__(self, arquivo_excel, versao=None, ano=ANO_PADRAO):
+        self.arquivo_excel = arquivo_excel
+        self.ano = ano
+        self.versao = versao or versao_planilha(arquivo_excel)
+        self.carregado_em = time.time()
+
+        self.clientes = []          # RegistroCliente por linha (para_dict() = buscar_por_cpf)
+        self.linhas_clientes = []   # número da linha de cada cliente na planilha
+        self.indice_cpf = {}        # CPF normalizado -> posição em self.clientes
+        self.linhas_sem_cpf = []    # linhas com cliente mas sem CPF na coluna B
+        self.lancamentos = []       # (linha, cliente, entrada, divisao) da UNION
+        self.totais = []            # {'receita_bruta', 'despesas_acessorias'} por cliente
+        self.posicoes_nome = {}     # nome (minúsculo) -> posições em self.lancamentos somadas
+        self._auditoria = None
+
+        inicio = time.monotonic()
+        if self._abas_com_formulas_pendentes():
+            self._ler_avaliando_formulas()
+        elif not (_carga_paralela_ativa() and self._ler_em_paralelo()):
+            self._ler_em_sequencia()
+        leitura = time.monotonic() - inicio
+
+        self._calcular_totais()
+        self.indice_prefixo = IndicePrefixo(self.clientes)
+        self.validacao = validar_cpfs(
+            zip(self.linhas_clientes, (dados.cpf for dados in self.clientes)),
+            self.linhas_sem_cpf
+        )
+        logger.info(
+            f"Snapshot {ano}/{self.versao} carregado em {time.monotonic() - inicio:.2f}s "
+            f"(leitura {leitura:.2f}s): "
+            f"{len(self.clientes)} clientes, {len(self.lancamentos)} lançamentos"
+        )
+
+        resumo = self.validacao.resumo()
+        if resumo['invalidos'] or resumo['cpfs_duplicados'] or resumo['sem_cpf']:
+            logger.warning(
+                f"Validação da base {ano}: {resumo['invalidos']} CPFs inválidos "
+                f"({resumo['zeros_a_esquerda_perdidos']} com zeros à esquerda perdidos), "
+                f"{resumo['cpfs_duplicados']} duplicados, {resumo['sem_cpf']} linhas sem CPF"
+            )
+
+    def _ler_em_sequencia(self):
+        """As duas abas, uma após a outra, lidas em streaming neste processo"""
+        wb = load_workbook(self.arquivo_excel, read_only=True, data_only=True)
+        try:
+            self.abas = list(wb.sheetnames)
+            for aba, max_col, carregar in self._abas_necessarias():
+                if aba in wb.sheetnames:
+                    carregar(wb[aba].iter_rows(min_row=2, max_col=max_col, values_only=True))
+                else:
+                    logger.error(f"Planilha '{aba}' não encontrada")
+        finally:
+            wb.close()
+
+    def _ler_em_paralelo(self):
+        """
+        Cada aba é lida em um processo (só as colunas necessárias) e os índices são
+        montados aqui. Retorna False se não for possível criar os processos.
+        """
+        abas = self._abas_necessarias()
+        try:
+            with ProcessPoolExecutor(len(abas), mp_context=_contexto_processos()) as executor:
+                futuros = [
+                    executor.submit(_ler_aba, self.arquivo_excel, aba, max_col)
+                    for aba, max_col, _ in abas
+                ]
+                resultados = [futuro.result() for futuro in futuros]
+        except (OSError, BrokenProcessPool) as e:
+            logger.warning(f"Leitura paralela indisponível ({e}); lendo as abas em sequência")
+            return False
+
+        self.abas = resultados[0][0]
+        for (aba, _, carregar), (_, linhas) in zip(abas, resultados):
+            if linhas is None:
+                logger.error(f"Planilha '{aba}' não encontrada")
+            else:
+                carregar(linhas)
+        return True
+
+    def _abas_com_formulas_pendentes(self):
+        """
+        Abas necessárias com fórmulas salvas sem valor calculado (arquivo gerado fora
+        do Excel): lidas com data_only, viriam como None e zerariam os totais
+        """
+        if AVALIAR_FORMULAS == '0':
+            return set()
+        try:
+            return abas_sem_valores(self.arquivo_excel, [aba for aba, _, _ in self._abas_necessarias()])
+        except (KeyError, OSError, ValueError, ElementTree.ParseError) as e:
+            logger.warning(f"Não foi possível verificar as fórmulas de {self.arquivo_excel}: {str(e)}")
+            return set()
+
+    def _ler_avaliando_formulas(self):
+        """As duas abas com as fórmulas avaliadas (só o que mudou desde a última versão)"""
+        motor = motor_formulas(self.arquivo_excel)
+        with motor.lock:
+            recalculadas = motor.avaliacoes
+            self.abas = list(motor.abas)
+            for aba, max_col, carregar in self._abas_necessarias():
+                if aba in motor.dimensoes:
+                    carregar(motor.linhas(aba, min_linha=2, max_coluna=max_col))
+                else:
+                    logger.error(f"Planilha '{aba}' não encontrada")
+            recalculadas = motor.avaliacoes - recalculadas
+            nao_suportadas = motor.nao_suportadas()
+        logger.info(f"Fórmulas avaliadas na carga de {self.arquivo_excel}: {recalculadas} recalculadas")
+        if nao_suportadas:
+            logger.warning(
+                f"{len(nao_suportadas)} fórmulas não suportadas mantêm o valor gravado no arquivo "
+                f"(ex.: {next(iter(nao_suportadas.items()))})"
+            )
+
+    def _abas_necessarias(self):
+        return (
+            (ABA_CLIENTES, COLUNAS_CLIENTES, self._carregar_clientes),
+            (aba_union(self.ano), COLUNAS_UNION, self._carregar_union),
+        )
+
+    def _carregar_clientes(self, linhas):
+        """Linhas da 'Base de Clientes ' (colunas A..M) a partir da linha 2"""
+        for numero_linha, linha in enumerate(linhas, start=2):
+            cpf = limpar_cpf(_celula(linha, 1))
+            if not cpf:
+                if _celula(linha, 0):
+                    self.linhas_sem_cpf.append(numero_linha)
+                continue
+
+            self.indice_cpf.setdefault(cpf, len(self.clientes))
+            self.clientes.append(RegistroCliente(cpf, linha))
+            self.linhas_clientes.append(numero_linha)
+
+    def _carregar_union(self, linhas):
+        """CLIENTE (B), ENTRADA (C) e DIVISÃO - 1º NÍVEL (D) da UNION a partir da linha 2"""
+        for numero_linha, linha in enumerate(linhas, start=2):
+            self.lancamentos.append((numero_linha, _celula(linha, 1), _celula(linha, 2), _celula(linha, 3)))
+
+    def _calcular_totais(self):
+        """
+        Totais por cliente em uma passada por nome distinto.
+        Os lançamentos de cada categoria são agrupados pelo nome (minúsculo) da UNION;
+        cada nome de cliente é comparado uma vez com cada nome distinto da UNION.
+        As somas seguem a ordem das linhas, como no laço original.
+        """
+        por_nome = {}
+        for posicao, (_, cliente, entrada, divisao) in enumerate(self.lancamentos):
+            categoria = categoria_lancamento(cliente, entrada, divisao)
+            if categoria is None:
+                continue
+            grupos = por_nome.setdefault(str(cliente).lower(), ([], []))
+            grupos[0 if categoria == CATEGORIA_RECEITA else 1].append((posicao, float(entrada)))
+
+        nomes_union = list(por_nome)
+        cache_nomes = {}
+        for dados in self.clientes:
+            nome = dados.cliente.lower()
+            if nome not in cache_nomes:
+                if not nome:
+                    cache_nomes[nome] = {'receita_bruta': 0.0, 'despesas_acessorias': 0.0}
+                    self.posicoes_nome[nome] = []
+                else:
+                    casados = [por_nome[n] for n in nomes_union if nome in n]
+                    cache_nomes[nome] = {
+                        'receita_bruta': self._somar([g[0] for g in casados]),
+                        'despesas_acessorias': self._somar([g[1] for g in casados])
+                    }
+                    self.posicoes_nome[nome] = [
+                        posicao for posicao, _ in heapq.merge(*(lista for g in casados for lista in g))
+                    ]
+            self.totais.append(cache_nomes[nome])
+
+    @staticmethod
+    def _somar(listas):
+        """Soma lançamentos de várias listas na ordem original das linhas"""
+        total = 0.0
+        for _, valor in heapq.merge(*listas):
+            total += valor
+        return total
+
+    def _posicao(self, cpf):
+        cpf = limpar_cpf(cpf)
+        posicao = self.indice_cpf.get(cpf)
+        if posicao is None and cpf.startswith('0'):
+            # CPF completo de uma célula numérica, gravada sem os zeros à esquerda
+            posicao = self.indice_cpf.get(cpf.lstrip('0'))
+        return posicao
+
+    def buscar_cliente(self, cpf):
+        """Dados do cliente (cópia) ou None"""
+        posicao = self._posicao(cpf)
+        if posicao is None:
+            return None
+        return self.clientes[posicao].para_dict()
+
+    def totais_cliente(self, cpf):
+        """{'receita_bruta', 'despesas_acessorias'} do cliente ou None"""
+        posicao = self._posicao(cpf)
+        if posicao is None:
+            return None
+        return dict(self.totais[posicao])
+
+    def lancamentos_cliente(self, cpf, inicio=0, limite=50, total=None):
+        """
+        (quantidade, página) das linhas da UNION somadas nos totais do cliente, na
+        ordem da planilha, ou None. `total` ('receita_bruta'/'despesas_acessorias') filtra.
+        """
+        posicao = self._posicao(cpf)
+        if posicao is None:
+            return None
+        posicoes = self.posicoes_nome[self.clientes[posicao].cliente.lower()]
+
+        itens = []
+        quantidade = 0
+        for posicao_lancamento in posicoes:
+            lancamento = self.lancamentos[posicao_lancamento]
+            categoria = categoria_lancamento(*lancamento[1:])
+            if total is not None and TOTAL_DA_CATEGORIA[categoria] != total:
+                continue
+            if inicio <= quantidade < inicio + limite:
+                itens.append(item_lancamento(*lancamento, categoria))
+            quantidade += 1
+        return quantidade, itens
+
+    @staticmethod
+    def _hash(valor):
+        return hashlib.sha1(repr(valor).encode('utf-8')).hexdigest()[:16]
+
+    def assinatura(self, cpf):
+        """(hash da linha na 'Base de Clientes ', hash dos totais na UNION) ou None"""
+        posicao = self._posicao(cpf)
+        if posicao is None:
+            return None
+        return (
+            self._hash(sorted(self.clientes[posicao].para_dict().items())),
+            self._hash(sorted(self.totais[posicao].items()))
+        )
+
+    def assinaturas(self):
+        """CPF -> assinatura para todos os clientes (entrada do diff entre versões)"""
+        return {cpf: self.assinatura(cpf) for cpf in self.indice_cpf}
+
+    def impressao_digital(self, cpf):
+        """Hash de tudo que vai para a declaração do cliente (linha da base + totais)"""
+        assinatura = self.assinatura(cpf)
+        if assinatura is None:
+            return None
+        return self._hash(assinatura)
+
+    def buscar_prefixo(self, consulta, limite=10):
+        return self.indice_prefixo.buscar(consulta, limite)
+
+    def cpfs(self):
+        """CPFs distintos na ordem da planilha"""
+        return list(self.indice_cpf)
+
+    def relatorio_validacao(self):
+        """Validação dos CPFs feita na construção do snapshot"""
+        return self.validacao
+
+    def auditoria(self):
+        """Auditoria da base e da UNION, feita na primeira chamada"""
+        if self._auditoria is None:
+            from auditoria_base import auditar   # auditoria_base importa este módulo
+            self._auditoria = auditar(zip(self.linhas_clientes, self.clientes), self.lancamentos)
+        return self._auditoria
+
+
+class AnoIndisponivel(KeyError):
+    """Ano-calendário sem planilha configurada"""
+
+
+class RegistroSnapshots:
+    """
+    Fontes de dados por ano-calendário, carregadas sob demanda.
+
+    Mantém no máximo `max_carregados` anos abertos; o ano usado há mais
+    tempo é descartado primeiro (LRU). Uma nova versão do arquivo de um ano
+    substitui a fonte na próxima consulta.
+
+    Concorrência (threaded=True / threads do gunicorn):
+    - consulta de um ano já carregado não toma lock (leitura de dict + contador de uso);
+    - carga: uma única por ano/versão (SingleFlight); as demais requisições aguardam
+      e recebem a mesma fonte. Cargas de anos diferentes não bloqueiam uma à outra.
+
+    `fabrica(arquivo_excel, versao, ano)` cria a FonteDados de cada ano
+    (padrão: SnapshotPlanilha em memória; ver FonteDadosSQLite.abrir).
+    """
+
+    def __init__(self, planilhas, max_carregados=2, fabrica=None):
+        self.planilhas = dict(planilhas)   # ano -> caminho do xlsx
+        self.max_carregados = max(1, max_carregados)
+        self.fabrica = fabrica or SnapshotPlanilha
+        self._carregados = {}              # ano -> SnapshotPlanilha (trocado só sob _lock)
+        self._usos = {}                    # ano -> ordem do último uso (LRU)
+        self._relogio = itertools.count()
+        self._lock = threading.Lock()
+        self._cargas = SingleFlight()
+        self.carregamentos = 0
+        self.descartes = 0
+
+    def anos(self):
+        return sorted(self.planilhas)
+
+    def arquivo(self, ano):
+        try:
+            return self.planilhas[ano]
+        except KeyError:
+            raise AnoIndisponivel(ano) from None
+
+    def obter(self, ano):
+        """Snapshot do ano (carrega se necessário)"""
+        arquivo = self.arquivo(ano)
+        versao = versao_planilha(arquivo)
+
+        snapshot = self._carregados.get(ano)
+        if snapshot is None or snapshot.versao != versao:
+            snapshot, _ = self._cargas.executar(f"{ano}:{versao}", lambda: self._carregar(ano, arquivo, versao))
+        self._usos[ano] = next(self._relogio)
+        return snapshot
+
+    def _carregar(self, ano, arquivo, versao):
+        """Executado por uma única thread por ano/versão"""
+        # Outra carga pode ter terminado entre a consulta sem lock e o SingleFlight
+        snapshot = self._carregados.get(ano)
+        if snapshot is not None and snapshot.versao == versao:
+            return snapshot
+
+        snapshot = self.fabrica(arquivo, versao, ano)
+        with self._lock:
+            self.carregamentos += 1
+            self._carregados[ano] = snapshot
+            self._usos[ano] = next(self._relogio)
+
+            while len(self._carregados) > self.max_carregados:
+                descartado = min(self._carregados, key=lambda a: self._usos.get(a, -1))
+                del self._carregados[descartado]
+                self.descartes += 1
+                logger.info(f"Snapshot de {descartado} descartado (LRU)")
+
+        return snapshot
+
+    def status(self):
+        with self._lock:
+            return {
+                'fonte': getattr(self.fabrica, '__qualname__', str(self.fabrica)),
+                'anos': self.anos(),
+                'carregados': {ano: s.versao for ano, s in self._carregados.items()},
+                'max_carregados': self.max_carregados,
+                'carregamentos': self.carregamentos,
+                'descartes': self.descartes,
+                'cargas': self._cargas.metricas()
+            }
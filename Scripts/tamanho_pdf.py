@@ -0,0 +1,54 @@
+"""
+Tamanho das Declarações por Perfil de PDF
+Gera as mesmas declarações nos perfis 'padrao' e 'otimizado' e compara a média
+de bytes por arquivo.
+
+Uso (na raiz do projeto): python Scripts/tamanho_pdf.py [quantidade] [ano]
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+from gerador_ir_refatorado import PERFIL_OTIMIZADO, PERFIL_PADRAO, GeradorIR
+from snapshot_planilha import ANO_PADRAO, SnapshotPlanilha
+from validacao_base import motivo_invalido
+
+
+def medir(snapshot, cpfs, perfil, diretorio):
+    """Total de bytes e quantidade de declarações geradas no perfil"""
+    gerador = GeradorIR(snapshot, perfil=perfil)
+    total = gerados = 0
+    for cpf in cpfs:
+        destino = Path(diretorio) / f"{perfil}_{cpf}.pdf"
+        sucesso, _ = gerador.gerar_declaracao(cpf, caminho_saida=destino)
+        if sucesso:
+            total += destino.stat().st_size
+            gerados += 1
+    return total, gerados
+
+
+def main():
+    quantidade = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    ano = int(sys.argv[2]) if len(sys.argv) > 2 else ANO_PADRAO
+
+    from config import YEARS_CONFIG
+
+    snapshot = SnapshotPlanilha(YEARS_CONFIG['WORKBOOKS'][ano], ano=ano)
+    # Só CPFs válidos: os demais são recusados antes de gerar o PDF
+    cpfs = [cpf for cpf in snapshot.cpfs() if motivo_invalido(cpf) is None][:quantidade]
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        medias = {}
+        for perfil in (PERFIL_PADRAO, PERFIL_OTIMIZADO):
+            total, gerados = medir(snapshot, cpfs, perfil, diretorio)
+            medias[perfil] = total / gerados if gerados else 0
+            print(f"{perfil:<10} {gerados:>5} declarações  média {medias[perfil]:>9,.0f} bytes")
+
+    if medias[PERFIL_PADRAO]:
+        reducao = 1 - medias[PERFIL_OTIMIZADO] / medias[PERFIL_PADRAO]
+        print(f"Redução por declaração: {reducao:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Teste de Carga Local
+Simula o tráfego da temporada de IR contra o servidor: consultas de CPF, geração
+de PDF, CPFs inválidos e arquivos estáticos, em proporções configuráveis.
+Reporta vazão, latência p50/p95/p99 e taxa de erro por endpoint.
+
+Só usa a biblioteca padrão. Pode subir o próprio servidor (qualquer configuração
+de workers) e encerrá-lo ao final:
+
+    python Scripts/teste_carga.py --duracao 60 --concorrencia 16 \\
+        --servidor "gunicorn --workers 4 --timeout 300 -b 127.0.0.1:5055 simple_server:app" \\
+        --url http://127.0.0.1:5055
+"""
+
+import argparse
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validacao_base import digitos_verificadores, motivo_invalido
+
+MIX_PADRAO = 'busca=60,pdf=10,invalido=15,estatico=15'
+ESTATICOS = ['/', '/styles.css', '/script.js', '/Imagens/Imagem2.png']
+CPFS_INVALIDOS = ['123', '11111111111', '12345678900', 'abc.def.ghi-jk', '529.982.247-20']
+
+# Status que não contam como erro (404 = CPF fora da base; a validação da API só
+# confere o formato, então CPFs de 11 dígitos com DV errado também chegam a 404)
+ESPERADOS = {'busca': {200, 404}, 'pdf': {200, 404}, 'invalido': {400, 404}, 'estatico': {200}}
+
+
+def cpfs_planilha(ano):
+    """CPFs válidos da planilha do ano"""
+    from config import YEARS_CONFIG
+    from snapshot_planilha import SnapshotPlanilha
+
+    snapshot = SnapshotPlanilha(YEARS_CONFIG['WORKBOOKS'][ano], ano=ano)
+    return [cpf for cpf in snapshot.cpfs() if motivo_invalido(cpf) is None]
+
+
+def cpfs_sinteticos(quantidade, semente=42):
+    """CPFs com dígitos verificadores corretos (em geral ausentes da base: 404)"""
+    aleatorio = random.Random(semente)
+    cpfs = []
+    for _ in range(quantidade):
+        digitos = [aleatorio.randint(0, 9) for _ in range(9)]
+        cpfs.append(''.join(map(str, digitos + list(digitos_verificadores(digitos)))))
+    return cpfs
+
+
+def ler_mix(texto):
+    mix = {}
+    for item in texto.split(','):
+        nome, peso = item.split('=')
+        mix[nome.strip()] = float(peso)
+    desconhecidos = set(mix) - {'busca', 'pdf', 'invalido', 'estatico'}
+    if desconhecidos:
+        raise SystemExit(f"Operações desconhecidas no mix: {', '.join(sorted(desconhecidos))}")
+    return mix
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por posição mais próxima"""
+    if not valores_ordenados:
+        return 0.0
+    indice = max(0, min(len(valores_ordenados) - 1, round(p / 100 * len(valores_ordenados)) - 1))
+    return valores_ordenados[indice]
+
+
+class TesteCarga:
+    def __init__(self, url, cpfs, mix, ano, timeout):
+        self.url = url.rstrip('/')
+        self.cpfs = cpfs
+        self.operacoes = list(mix)
+        self.pesos = [mix[nome] for nome in self.operacoes]
+        self.ano = ano
+        self.timeout = timeout
+        self.latencias = defaultdict(list)   # endpoint -> [segundos]
+        self.status = defaultdict(Counter)   # endpoint -> {status: quantidade}
+        self._lock = threading.Lock()
+
+    def _post(self, caminho, dados):
+        corpo = json.dumps(dados).encode('utf-8')
+        return urllib.request.Request(
+            self.url + caminho, data=corpo, headers={'Content-Type': 'application/json'}
+        )
+
+    def _requisicao(self, aleatorio):
+        """(endpoint para o relatório, urllib Request)"""
+        operacao = aleatorio.choices(self.operacoes, self.pesos)[0]
+        if operacao == 'busca':
+            cpf = aleatorio.choice(self.cpfs)
+            return 'busca', self._post('/api/buscar-e-gerar-pdf', {'cpf': cpf, 'ano': self.ano})
+        if operacao == 'pdf':
+            cpf = aleatorio.choice(self.cpfs)
+            return 'pdf', self._post('/api/gerar-pdf', {'cpf': cpf, 'ano': self.ano})
+        if operacao == 'invalido':
+            cpf = aleatorio.choice(CPFS_INVALIDOS)
+            return 'invalido', self._post('/api/buscar-e-gerar-pdf', {'cpf': cpf})
+        caminho = aleatorio.choice(ESTATICOS)
+        return 'estatico', urllib.request.Request(self.url + caminho)
+
+    def _executar(self, endpoint, requisicao):
+        inicio = time.perf_counter()
+        try:
+            with urllib.request.urlopen(requisicao, timeout=self.timeout) as resposta:
+                resposta.read()
+                status = resposta.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except Exception as e:
+            status = type(e).__name__
+        duracao = time.perf_counter() - inicio
+
+        with self._lock:
+            self.latencias[endpoint].append(duracao)
+            self.status[endpoint][status] += 1
+
+    def _usuario(self, semente, fim):
+        aleatorio = random.Random(semente)
+        while time.monotonic() < fim:
+            endpoint, requisicao = self._requisicao(aleatorio)
+            self._executar(endpoint, requisicao)
+
+    def rodar(self, duracao, concorrencia):
+        inicio = time.monotonic()
+        fim = inicio + duracao
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            for indice in range(concorrencia):
+                executor.submit(self._usuario, indice, fim)
+        self.duracao = time.monotonic() - inicio
+
+    def relatorio(self):
+        linhas = []
+        cabecalho = f"{'endpoint':<10} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>7}  status"
+        linhas.append(cabecalho)
+        linhas.append('-' * len(cabecalho))
+
+        total = erros_total = 0
+        for endpoint in sorted(self.latencias):
+            tempos = sorted(self.latencias[endpoint])
+            contagem = self.status[endpoint]
+            erros = sum(n for status, n in contagem.items() if status not in ESPERADOS[endpoint])
+            total += len(tempos)
+            erros_total += erros
+            linhas.append(
+                f"{endpoint:<10} {len(tempos):>7} {len(tempos) / self.duracao:>8.1f} "
+                f"{percentil(tempos, 50) * 1000:>8.1f} {percentil(tempos, 95) * 1000:>8.1f} "
+                f"{percentil(tempos, 99) * 1000:>8.1f} {erros / len(tempos):>7.1%}  "
+                + ' '.join(f"{status}:{n}" for status, n in sorted(contagem.items(), key=str))
+            )
+
+        linhas.append('-' * len(cabecalho))
+        linhas.append(
+            f"{'total':<10} {total:>7} {total / self.duracao:>8.1f} "
+            f"{'':>8} {'':>8} {'':>8} {(erros_total / total if total else 0):>7.1%}"
+        )
+        return '\n'.join(linhas)
+
+
+def aguardar_servidor(url, timeout):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            with urllib.request.urlopen(url.rstrip('/') + '/api/health', timeout=5) as resposta:
+                if resposta.status == 200:
+                    return
+        except Exception:
+            time.sleep(0.5)
+    raise SystemExit(f"Servidor não respondeu em {timeout}s: {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga local do Gerador de IR')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--duracao', type=float, default=30, help='segundos de carga')
+    parser.add_argument('--concorrencia', type=int, default=8, help='usuários simultâneos')
+    parser.add_argument('--mix', default=MIX_PADRAO, help=f'pesos por operação (padrão: {MIX_PADRAO})')
+    parser.add_argument('--cpfs', choices=['planilha', 'sintetico'], default='planilha')
+    parser.add_argument('--ano', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=330, help='timeout por requisição (s)')
+    parser.add_argument('--servidor', help='comando que sobe o servidor (encerrado ao final)')
+    args = parser.parse_args()
+
+    from config import YEARS_CONFIG
+    ano = args.ano or YEARS_CONFIG['DEFAULT_YEAR']
+    cpfs = cpfs_planilha(ano) if args.cpfs == 'planilha' else cpfs_sinteticos(1000)
+    mix = ler_mix(args.mix)
+
+    servidor = None
+    if args.servidor:
+        servidor = subprocess.Popen(shlex.split(args.servidor))
+    try:
+        aguardar_servidor(args.url, 120)
+        print(f"{args.url}: {args.concorrencia} usuários por {args.duracao:.0f}s, mix {args.mix}, "
+              f"{len(cpfs)} CPFs ({args.cpfs})")
+        teste = TesteCarga(args.url, cpfs, mix, ano, args.timeout)
+        teste.rodar(args.duracao, args.concorrencia)
+        print(teste.relatorio())
+    finally:
+        if servidor is not None:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
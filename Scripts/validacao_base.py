@@ -0,0 +1,131 @@
+"""
+Validação da Base de Clientes
+Verifica todos os CPFs da coluna B de uma vez: dígitos verificadores,
+entradas malformadas e CPFs duplicados (índice por hash), em tempo linear.
+"""
+
+import json
+import sys
+
+# Pesos sobre os 9 primeiros dígitos (1º DV: 10..2; 2º DV: 11..3, e o 1º DV pesa 2)
+_PESOS_1 = tuple(range(10, 1, -1))
+_PESOS_2 = tuple(range(11, 2, -1))
+
+MOTIVOS = {
+    'tamanho': 'CPF deve ter 11 dígitos',
+    'digitos_repetidos': 'CPF com todos os dígitos iguais',
+    'digito_verificador': 'Dígito verificador inválido',
+}
+
+
+def digitos_verificadores(digitos):
+    """Dígitos verificadores (d1, d2) a partir dos 9 primeiros dígitos (inteiros)"""
+    resto = sum(d * p for d, p in zip(digitos, _PESOS_1)) % 11
+    d1 = 0 if resto < 2 else 11 - resto
+    resto = (sum(d * p for d, p in zip(digitos, _PESOS_2)) + d1 * 2) % 11
+    d2 = 0 if resto < 2 else 11 - resto
+    return d1, d2
+
+
+def motivo_invalido(cpf_limpo):
+    """None se o CPF (somente dígitos) é válido, senão a chave do motivo em MOTIVOS"""
+    if len(cpf_limpo) != 11:
+        return 'tamanho'
+    if cpf_limpo == cpf_limpo[0] * 11:
+        return 'digitos_repetidos'
+    digitos = [ord(c) - 48 for c in cpf_limpo]
+    if digitos_verificadores(digitos) != (digitos[9], digitos[10]):
+        return 'digito_verificador'
+    return None
+
+
+def _sugestao(cpf_limpo):
+    """Correção provável para entradas malformadas comuns na planilha"""
+    if len(cpf_limpo) < 11 and motivo_invalido(cpf_limpo.zfill(11)) is None:
+        # Célula numérica: o Excel descarta zeros à esquerda
+        return cpf_limpo.zfill(11)
+    if len(cpf_limpo) == 14:
+        return 'possível CNPJ'
+    return None
+
+
+class RelatorioValidacao:
+    """Resultado da validação de todos os CPFs de uma base"""
+
+    def __init__(self):
+        self.total_linhas = 0
+        self.validos = 0
+        self.invalidos = []        # {'linha', 'cpf', 'motivo', 'sugestao'}
+        self.sem_cpf = []          # linhas com cliente mas sem dígitos na coluna B
+        self.duplicados = {}       # CPF -> [linhas]
+
+    def resumo(self):
+        por_motivo = {motivo: 0 for motivo in MOTIVOS}
+        zeros_a_esquerda = 0
+        for item in self.invalidos:
+            por_motivo[item['motivo']] += 1
+            if item['sugestao'] and item['sugestao'] != 'possível CNPJ':
+                zeros_a_esquerda += 1
+        return {
+            'total_linhas': self.total_linhas,
+            'validos': self.validos,
+            'invalidos': len(self.invalidos),
+            'por_motivo': por_motivo,
+            'zeros_a_esquerda_perdidos': zeros_a_esquerda,
+            'sem_cpf': len(self.sem_cpf),
+            'cpfs_duplicados': len(self.duplicados),
+            'linhas_duplicadas': sum(len(linhas) for linhas in self.duplicados.values())
+        }
+
+    def para_dict(self):
+        return {
+            'resumo': self.resumo(),
+            'invalidos': self.invalidos,
+            'sem_cpf': self.sem_cpf,
+            'duplicados': [{'cpf': cpf, 'linhas': linhas} for cpf, linhas in self.duplicados.items()]
+        }
+
+
+def validar_cpfs(linhas_cpf, linhas_sem_cpf=()):
+    """
+    Valida pares (linha, CPF normalizado) em uma passada.
+    Duplicados são detectados por um dicionário CPF -> linhas.
+    """
+    relatorio = RelatorioValidacao()
+    relatorio.sem_cpf = list(linhas_sem_cpf)
+    linhas_por_cpf = {}
+
+    for linha, cpf in linhas_cpf:
+        relatorio.total_linhas += 1
+        linhas_por_cpf.setdefault(cpf, []).append(linha)
+
+        motivo = motivo_invalido(cpf)
+        if motivo is None:
+            relatorio.validos += 1
+        else:
+            relatorio.invalidos.append({
+                'linha': linha,
+                'cpf': cpf,
+                'motivo': motivo,
+                'sugestao': _sugestao(cpf)
+            })
+
+    relatorio.duplicados = {cpf: linhas for cpf, linhas in linhas_por_cpf.items() if len(linhas) > 1}
+    return relatorio
+
+
+def main():
+    """Uso: python Scripts/validacao_base.py <planilha.xlsx> [ano]"""
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+
+    from snapshot_planilha import ANO_PADRAO, SnapshotPlanilha
+
+    ano = int(sys.argv[2]) if len(sys.argv) > 2 else ANO_PADRAO
+    snapshot = SnapshotPlanilha(sys.argv[1], ano=ano)
+    print(json.dumps(snapshot.relatorio_validacao().para_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
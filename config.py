@@ -12,6 +12,37 @@ FILES_CONFIG = {
     'OUTPUT_DIR': 'output'
 }
 
+# Planilhas por ano-calendário
+# IR_WORKBOOKS="2023=IR 2023.xlsx;2024=IR 2024 - NÃO ALTERAR.xlsx" substitui a lista
+YEARS_CONFIG = {
+    'DEFAULT_YEAR': int(os.environ.get('IR_DEFAULT_YEAR', 2024)),
+    'WORKBOOKS': {
+        2024: FILES_CONFIG['EXCEL_FILE']
+    },
+    'MAX_LOADED_YEARS': int(os.environ.get('IR_MAX_LOADED_YEARS', 2))
+}
+
+def _parse_workbooks(valor):
+    """Converte 'ANO=arquivo;ANO=arquivo' em {ano: arquivo}"""
+    planilhas = {}
+    for item in valor.split(';'):
+        if '=' in item:
+            ano, arquivo = item.split('=', 1)
+            planilhas[int(ano.strip())] = arquivo.strip()
+    return planilhas
+
+if os.environ.get('IR_WORKBOOKS'):
+    YEARS_CONFIG['WORKBOOKS'] = _parse_workbooks(os.environ['IR_WORKBOOKS'])
+
+# Perfil de saída do PDF: 'padrao' (logos originais) ou 'otimizado'
+# (logos reduzidos ao tamanho impresso em PDF_LOGO_DPI, streams binários)
+# PDF_DETERMINISTIC=1: mesmos dados + mesma data de emissão = mesmos bytes
+PDF_CONFIG = {
+    'PROFILE': os.environ.get('PDF_PROFILE', 'padrao'),
+    'LOGO_DPI': int(os.environ.get('PDF_LOGO_DPI', 150)),
+    'DETERMINISTIC': os.environ.get('PDF_DETERMINISTIC', '0') == '1'
+}
+
 # Configurações de teste
 TEST_CONFIG = {
     'TEST_CPF': '91446260968',  # CPF de teste
@@ -42,12 +73,15 @@ def get_config():
         'FILES': FILES_CONFIG,
         'TEST': TEST_CONFIG,
         'SYSTEM': SYSTEM_CONFIG,
-        'VALIDATION': VALIDATION_CONFIG
+        'VALIDATION': VALIDATION_CONFIG,
+        'YEARS': YEARS_CONFIG,
+        'PDF': PDF_CONFIG
     }
 
-def get_excel_file_path():
-    """Retorna caminho completo do arquivo Excel"""
-    return os.path.join(os.getcwd(), FILES_CONFIG['EXCEL_FILE'])
+def get_excel_file_path(ano=None):
+    """Retorna caminho completo do arquivo Excel (do ano padrão, se não informado)"""
+    ano = ano or YEARS_CONFIG['DEFAULT_YEAR']
+    return os.path.join(os.getcwd(), YEARS_CONFIG['WORKBOOKS'][ano])
 
 def ensure_directories():
     """Garante que os diretórios necessários existam"""
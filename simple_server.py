@@ -4,26 +4,32 @@ Servidor Flask Simples - Gerador de IR
 Versão limpa e funcional
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, abort, g, request, jsonify, make_response, send_file, stream_with_context
 from flask_cors import CORS
-import openpyxl
-from openpyxl import load_workbook
+import hashlib
+import hmac
+import io
 import os
 import re
+import shutil
+import sys
+import time
 import logging
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from functools import wraps
 from pathlib import Path
-# Configurar logging primeiro
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+
+sys.path.append('Scripts')
+from log_estruturado import configurar_logging, encerrar_contexto, iniciar_contexto
+
+# Configurar logging primeiro (fila + thread de escrita, JSON com request_id)
+configurar_logging()
 logger = logging.getLogger(__name__)
 
 # Import do gerador de PDF (opcional para funcionalidade básica)
 try:
-    import sys
-    sys.path.append('Scripts')
     from gerador_ir_refatorado import GeradorIR
     PDF_GENERATOR_AVAILABLE = True
     logger.info("✅ Gerador de PDF importado com sucesso")
@@ -31,32 +37,89 @@ except ImportError as e:
     logger.warning(f"❌ Gerador de PDF não disponível: {e}")
     PDF_GENERATOR_AVAILABLE = False
 
+from materializacao import MaterializadorDeclaracoes
+from single_flight import SingleFlight
+from snapshot_planilha import RegistroSnapshots, versao_planilha
+from config import PDF_CONFIG, YEARS_CONFIG
+from fonte_sqlite import FonteDadosSQLite
+from busca_prefixo import LIMITE_MAXIMO, LIMITE_PADRAO
+from exportacao import FORMATOS, FormatoIndisponivel, exportar
+from geracao_lote import GeracaoLote, LoteEmAndamento
+from perfil_requisicao import PerfilRequisicao
+from cache_compartilhado import criar_cache
+from cache_http import (
+    CACHE_IMUTAVEL, CACHE_REVALIDAR, AtivosEstaticos, comprimir_resposta, escolher_codificacao
+)
+
 # Inicializar Flask
 app = Flask(__name__)
 CORS(app)
 
 # Configurações
-EXCEL_FILE = 'IR 2024 - NÃO ALTERAR.xlsx'
+DEFAULT_YEAR = YEARS_CONFIG['DEFAULT_YEAR']
+EXCEL_FILE = YEARS_CONFIG['WORKBOOKS'].get(DEFAULT_YEAR)
+if EXCEL_FILE is None:
+    # Requisições sem `ano` usam DEFAULT_YEAR e responderiam "ano indisponível"
+    logger.error(
+        f"IR_DEFAULT_YEAR={DEFAULT_YEAR} não tem planilha em IR_WORKBOOKS "
+        f"(anos configurados: {sorted(YEARS_CONFIG['WORKBOOKS'])})"
+    )
 HOST = os.environ.get('HOST', '0.0.0.0')
 PORT = int(os.environ.get('PORT', 10000))
 
+# Controle de admissão da geração de PDF (por worker)
+PDF_MAX_CONCURRENT = int(os.environ.get('PDF_MAX_CONCURRENT', 2))
+PDF_MAX_QUEUE = int(os.environ.get('PDF_MAX_QUEUE', 8))
+PDF_QUEUE_TIMEOUT = float(os.environ.get('PDF_QUEUE_TIMEOUT', 30))
+
+# Deduplicação de gerações idênticas (mesmo CPF e versão da planilha)
+PDF_FLIGHT_DIR = os.environ.get('PDF_FLIGHT_DIR', 'output/pdf_flight')
+PDF_FLIGHT_TTL = float(os.environ.get('PDF_FLIGHT_TTL', 60))
+
+# Materialização antecipada: pré-gera todas as declarações a cada nova planilha
+EAGER_MATERIALIZATION = os.environ.get('EAGER_MATERIALIZATION', '0') == '1'
+MATERIALIZATION_DIR = os.environ.get('MATERIALIZATION_DIR', 'output/declaracoes')
+MATERIALIZATION_INTERVAL = float(os.environ.get('MATERIALIZATION_INTERVAL', 60))
+
+# Origem dos dados: 'memoria' (snapshot do xlsx) ou 'sqlite' (banco importado do xlsx)
+DATA_SOURCE = os.environ.get('IR_DATA_SOURCE', 'memoria')
+SQLITE_DIR = os.environ.get('IR_SQLITE_DIR', 'output/sqlite')
+
+# Consulta em lote
+BULK_MAX_CPFS = int(os.environ.get('BULK_MAX_CPFS', 5000))
+
+# Detalhamento dos lançamentos por cliente
+LANCAMENTOS_MAX_POR_PAGINA = 500
+
+# Geração em lote pelo servidor: um diretório por ano e versão da planilha
+BATCH_DIR = os.environ.get('BATCH_DIR', 'output/lotes')
+BATCH_PROCESSES = int(os.environ.get('BATCH_PROCESSES', 1))
+# Conexões de progresso curtas: com workers síncronos do gunicorn, cada conexão aberta
+# ocupa um worker inteiro; o EventSource reconecta sozinho (retry + Last-Event-ID)
+BATCH_STREAM_MAX = float(os.environ.get('BATCH_STREAM_MAX', 15))
+BATCH_PROGRESS_INTERVAL = 1.0
+
+# Cache compartilhado entre workers (consultas e PDFs), opcional:
+# sqlite[:caminho], redis://..., memoria, desligado
+SHARED_CACHE = os.environ.get('SHARED_CACHE', 'desligado')
+SHARED_CACHE_MAX_MB = float(os.environ.get('SHARED_CACHE_MAX_MB', 256))
+SHARED_CACHE_TTL = float(os.environ.get('SHARED_CACHE_TTL', 86400))
+
+# Profiling sob demanda: com PROFILE_REQUESTS=1, requisições com o cabeçalho
+# X-Profile (igual a PROFILE_TOKEN, se definido) são perfiladas em PROFILE_DIR
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '0') == '1'
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'logs/profiles')
+
 class ExcelProcessor:
-    """Processador simples do Excel"""
+    """Processador do Excel - consultas servidas pelo snapshot em memória de cada ano"""
     
-    def __init__(self, file_path):
-        self.file_path = Path(file_path)
-        self._workbook = None
+    def __init__(self, registro):
+        self.registro = registro
     
-    def _load_workbook(self):
-        """Carrega o workbook"""
-        if self._workbook is None:
-            if not self.file_path.exists():
-                raise FileNotFoundError(f"Arquivo não encontrado: {self.file_path}")
-            
-            logger.info(f"Carregando Excel: {self.file_path}")
-            self._workbook = load_workbook(self.file_path, data_only=True)
-        
-        return self._workbook
+    def _load_snapshot(self, ano=None):
+        """Snapshot do ano-calendário (carregado sob demanda, LRU)"""
+        return self.registro.obter(ano or DEFAULT_YEAR)
     
     def _normalize_cpf(self, cpf):
         """Normaliza CPF removendo caracteres especiais"""
@@ -66,131 +129,341 @@ class ExcelProcessor:
         cpf_clean = re.sub(r'[^\d]', '', str(cpf))
         return cpf_clean
     
-    def search_client(self, cpf):
+    def search_client(self, cpf, ano=None):
         """Busca cliente por CPF"""
         try:
-            wb = self._load_workbook()
-            
-            if 'Base de Clientes ' not in wb.sheetnames:
-                logger.error("Planilha 'Base de Clientes ' não encontrada")
-                return None
-            
-            ws = wb['Base de Clientes ']
+            snapshot = self._load_snapshot(ano)
             cpf_clean = self._normalize_cpf(cpf)
             
             logger.info(f"Buscando CPF normalizado: {cpf_clean}")
             
-            # Buscar por CPF na coluna B (2) - onde estão os CPFs
-            for row in range(2, ws.max_row + 1):
-                cpf_cell = ws.cell(row=row, column=2).value  # Coluna B
-                if cpf_cell:
-                    cpf_cell_clean = self._normalize_cpf(cpf_cell)
-                    
-                    # Comparar CPFs normalizados
-                    if cpf_clean == cpf_cell_clean:
-                        nome = ws.cell(row=row, column=1).value  # Coluna A - Nome
-                        empreendimento = ws.cell(row=row, column=3).value or 'N/A'  # Coluna C
-                        
-                        cliente = {
-                            'cpf': cpf_clean,
-                            'nome': nome,
-                            'empreendimento': empreendimento
-                        }
-                        
-                        logger.info(f"Cliente encontrado: {nome} (CPF: {cpf_clean})")
-                        return cliente
+            dados = snapshot.buscar_cliente(cpf_clean)
+            if not dados:
+                logger.warning(f"CPF não encontrado: {cpf_clean}")
+                return None
             
-            # Se não encontrou, mostrar alguns CPFs para debug
-            logger.warning(f"CPF não encontrado: {cpf_clean}")
-            logger.info("Primeiros CPFs na planilha:")
-            for row in range(2, min(7, ws.max_row + 1)):
-                cpf_cell = ws.cell(row=row, column=4).value  # Coluna D
-                if cpf_cell:
-                    cpf_cell_clean = self._normalize_cpf(cpf_cell)
-                    logger.info(f"  Linha {row}: {cpf_cell} -> {cpf_cell_clean}")
+            cliente = self._format_client(cpf_clean, dados)
             
-            return None
+            logger.info(f"Cliente encontrado: {cliente['nome']} (CPF: {cpf_clean})")
+            return cliente
             
         except Exception as e:
             logger.error(f"Erro ao buscar cliente: {str(e)}")
             return None
     
-    def calculate_values(self, cpf):
+    def _format_client(self, cpf_clean, dados):
+        """Cliente no formato da API a partir da linha do snapshot"""
+        return {
+            'cpf': cpf_clean,
+            'nome': dados['cliente'],
+            'empreendimento': dados['empreendimento'] or 'N/A'
+        }
+    
+    def _format_values(self, totais):
+        """Valores no formato da API a partir dos totais do snapshot"""
+        valores = {
+            'receita_bruta': 0.0,
+            'despesas_acessorias': 0.0,
+            'saldo_union': 0.0,
+            'saldo_paggo_dunning': 0.0
+        }
+        if totais is not None:
+            valores['receita_bruta'] = totais['receita_bruta']
+            valores['despesas_acessorias'] = totais['despesas_acessorias']
+            valores['saldo_union'] = valores['receita_bruta']
+        # Planilha ERP não existe mais - saldo_paggo_dunning fica 0
+        return valores
+    
+    def calculate_values(self, cpf, ano=None):
         """Calcula valores financeiros"""
+        valores = self._format_values(None)
+        
         try:
-            wb = self._load_workbook()
-            logger.info(f"Planilhas disponíveis: {wb.sheetnames}")
+            snapshot = self._load_snapshot(ano)
             
-            # Primeiro, buscar o nome do cliente pelo CPF
-            cliente = self.search_client(cpf)
-            if not cliente:
+            # Totais da UNION pré-calculados no snapshot (SOMASES por nome do cliente)
+            totais = snapshot.totais_cliente(self._normalize_cpf(cpf))
+            if totais is None:
                 logger.error(f"Cliente não encontrado para CPF: {cpf}")
-                return {
-                    'receita_bruta': 0.0,
-                    'despesas_acessorias': 0.0,
-                    'saldo_union': 0.0,
-                    'saldo_paggo_dunning': 0.0
-                }
-            
-            nome_cliente = cliente['nome']
-            logger.info(f"Buscando valores para cliente: {nome_cliente}")
-            
-            valores = {
-                'receita_bruta': 0.0,
-                'despesas_acessorias': 0.0,
-                'saldo_union': 0.0,
-                'saldo_paggo_dunning': 0.0
-            }
+                return valores
             
-            # Calcular valores da planilha UNION
-            if 'UNION - 2024' in wb.sheetnames:
-                ws_union = wb['UNION - 2024']
-                logger.info(f"Planilha UNION encontrada, linhas: {ws_union.max_row}")
-                valores['receita_bruta'] = self._sum_by_criteria(ws_union, nome_cliente, "RECEITA BRUTA")
-                valores['despesas_acessorias'] = self._sum_by_criteria(ws_union, nome_cliente, "ATIVO CIRCULANTE")
-                valores['saldo_union'] = valores['receita_bruta']
-                logger.info(f"Receita bruta calculada: {valores['receita_bruta']}")
-                logger.info(f"Despesas acessórias calculadas: {valores['despesas_acessorias']}")
-            else:
-                logger.warning("Planilha 'UNION - 2024' não encontrada")
+            valores = self._format_values(totais)
             
-            # Planilha ERP não existe mais - manter valor como 0
-            valores['saldo_paggo_dunning'] = 0.0
-            logger.info("Planilha ERP não existe mais - saldo_paggo_dunning = 0.0")
-            
-            logger.info(f"Valores calculados para cliente {nome_cliente}: {valores}")
+            logger.info(f"Valores calculados para CPF {cpf} ({snapshot.ano}): {valores}")
             return valores
             
         except Exception as e:
             logger.error(f"Erro ao calcular valores: {str(e)}")
             return valores
-    
-    def _sum_by_criteria(self, ws, nome_cliente, tipo):
-        """Soma valores por critérios"""
-        total = 0.0
-        matches = 0
-        
-        logger.info(f"Buscando cliente '{nome_cliente}' com tipo '{tipo}' em {ws.max_row} linhas")
-        
-        for row in range(2, ws.max_row + 1):
-            nome_col = ws.cell(row=row, column=2).value  # Coluna B - Nome do cliente
-            tipo_col = ws.cell(row=row, column=4).value  # Coluna D - Tipo
-            valor_col = ws.cell(row=row, column=3).value  # Coluna C - Valor
-            
-            if (nome_col and nome_cliente.lower() in str(nome_col).lower() and
-                tipo_col and tipo in str(tipo_col) and
-                valor_col and isinstance(valor_col, (int, float))):
-                total += float(valor_col)
-                matches += 1
-                logger.info(f"Match encontrado na linha {row}: Nome={nome_col}, Tipo={tipo_col}, Valor={valor_col}")
-        
-        logger.info(f"Total encontrado para {tipo}: {total} (matches: {matches})")
-        return total
-    
 
 
+class AdmissionRejected(Exception):
+    """Requisição recusada pelo controle de admissão"""
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limita renderizações simultâneas e mantém uma fila de espera limitada.
+    Excedentes recebem resposta rápida (429/503) com Retry-After.
+    """
+
+    # Limites (segundos) do histograma de tempo de espera na fila
+    WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._max_waiting = 0
+        self._admitted = 0
+        self._rejected_queue_full = 0
+        self._rejected_timeout = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_buckets = [0] * (len(self.WAIT_BUCKETS) + 1)
+        self._service_count = 0
+        self._service_total = 0.0
+
+    def _retry_after(self):
+        """Estimativa (segundos) de quando haverá vaga, pelo tempo médio de renderização"""
+        avg = self._service_total / self._service_count if self._service_count else 5.0
+        rounds = (self._waiting + self._active) / self.max_concurrent
+        return max(1, int(round(avg * max(rounds, 1))))
+
+    def _record_wait(self, waited):
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        for i, limit in enumerate(self.WAIT_BUCKETS):
+            if waited <= limit:
+                self._wait_buckets[i] += 1
+                break
+        else:
+            self._wait_buckets[-1] += 1
+
+    def acquire(self):
+        """Obtém uma vaga ou levanta AdmissionRejected"""
+        start = time.monotonic()
+        with self._cond:
+            if self._active < self.max_concurrent and self._waiting == 0:
+                self._active += 1
+                self._admitted += 1
+                self._record_wait(0.0)
+                return
+
+            if self._waiting >= self.max_queue:
+                self._rejected_queue_full += 1
+                raise AdmissionRejected(
+                    429, 'Muitas gerações de PDF em andamento, tente novamente em instantes',
+                    self._retry_after()
+                )
+
+            self._waiting += 1
+            self._max_waiting = max(self._max_waiting, self._waiting)
+            try:
+                deadline = start + self.queue_timeout
+                while self._active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected_timeout += 1
+                        raise AdmissionRejected(
+                            503, 'Tempo de espera na fila de geração de PDF esgotado',
+                            self._retry_after()
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            self._active += 1
+            self._admitted += 1
+            self._record_wait(time.monotonic() - start)
+
+    def release(self, service_time=None):
+        """Libera a vaga e registra o tempo de renderização"""
+        with self._cond:
+            self._active -= 1
+            if service_time is not None:
+                self._service_count += 1
+                self._service_total += service_time
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        """Context manager: `with controller.slot(): ...`"""
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def metrics(self):
+        """Retorna snapshot das métricas de fila"""
+        with self._cond:
+            waits = sum(self._wait_buckets)
+            buckets = {f'le_{limit}': count for limit, count in zip(self.WAIT_BUCKETS, self._wait_buckets)}
+            buckets['le_inf'] = self._wait_buckets[-1]
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'active': self._active,
+                'queue_depth': self._waiting,
+                'max_queue_depth': self._max_waiting,
+                'admitted': self._admitted,
+                'rejected_queue_full': self._rejected_queue_full,
+                'rejected_timeout': self._rejected_timeout,
+                'wait_avg_seconds': self._wait_total / waits if waits else 0.0,
+                'wait_max_seconds': self._wait_max,
+                'wait_histogram': buckets,
+                'render_avg_seconds': self._service_total / self._service_count if self._service_count else 0.0,
+            }
+
+
+def overload_response(error):
+    """Resposta rápida para requisições recusadas pelo controle de admissão"""
+    response = jsonify({
+        'success': False,
+        'message': error.message,
+        'retry_after': error.retry_after
+    })
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def sqlite_source(arquivo_excel, versao, ano):
+    """Fonte SQLite da versão atual da planilha (importa se necessário)"""
+    return FonteDadosSQLite.abrir(arquivo_excel, versao, ano, SQLITE_DIR)
+
+# Fontes de dados por ano-calendário (carregadas sob demanda, LRU)
+registro_snapshots = RegistroSnapshots(
+    YEARS_CONFIG['WORKBOOKS'],
+    YEARS_CONFIG['MAX_LOADED_YEARS'],
+    sqlite_source if DATA_SOURCE == 'sqlite' else None
+)
+
 # Instância do processador
-excel_processor = ExcelProcessor(EXCEL_FILE)
+excel_processor = ExcelProcessor(registro_snapshots)
+
+# index.html, styles.css, script.js e Imagens/ (hash e variantes comprimidas em memória)
+static_assets = AtivosEstaticos(Path(__file__).resolve().parent)
+
+# Controle de admissão da geração de PDF
+pdf_admission = AdmissionController(PDF_MAX_CONCURRENT, PDF_MAX_QUEUE, PDF_QUEUE_TIMEOUT)
+
+# Single-flight entre threads e, via locks em PDF_FLIGHT_DIR, entre workers
+# (o diretório guarda os PDFs gerados mesmo sem locks entre processos)
+Path(PDF_FLIGHT_DIR).mkdir(parents=True, exist_ok=True)
+pdf_flight = SingleFlight(Path(PDF_FLIGHT_DIR) / 'locks')
+
+# Consultas e PDFs já calculados por qualquer worker
+shared_cache = criar_cache(SHARED_CACHE, int(SHARED_CACHE_MAX_MB * 2**20))
+
+# Declarações pré-geradas (opcional), um diretório por ano
+materializadores = {}
+if EAGER_MATERIALIZATION and PDF_GENERATOR_AVAILABLE:
+    for ano_materializado in registro_snapshots.anos():
+        materializador = MaterializadorDeclaracoes(
+            registro_snapshots.arquivo(ano_materializado),
+            Path(MATERIALIZATION_DIR) / str(ano_materializado),
+            ano_materializado,
+            perfil=PDF_CONFIG['PROFILE'],
+            # A fonte SQLite não tem as assinaturas: o materializador lê o próprio snapshot
+            obter_snapshot=(
+                None if DATA_SOURCE == 'sqlite'
+                else lambda ano=ano_materializado: registro_snapshots.obter(ano)
+            )
+        )
+        materializador.iniciar(MATERIALIZATION_INTERVAL)
+        materializadores[ano_materializado] = materializador
+    logger.info(f"Materialização antecipada ativa em {MATERIALIZATION_DIR}")
+
+
+class PDFGenerationError(Exception):
+    """Falha do GeradorIR ao produzir o PDF"""
+
+
+def render_pdf(cpf_clean, ano):
+    """
+    Gera o PDF do CPF e retorna (bytes, compartilhado).
+    Requisições idênticas em andamento (mesmo CPF, ano e versão da planilha)
+    aguardam a primeira e recebem os mesmos bytes.
+    """
+    versao = versao_planilha(registro_snapshots.arquivo(ano))
+    chave = f"{ano}_{cpf_clean}_{versao}"
+    destino = Path(PDF_FLIGHT_DIR) / f"{chave}.pdf"
+    # O PDF traz a data de emissão: cada dia tem sua entrada no cache compartilhado
+    chave_cache = f"pdf:{ano}:{versao}:{cpf_clean}:{PDF_CONFIG['PROFILE']}:{date.today().isoformat()}"
+
+    def gerar():
+        pdf_cache = shared_cache.obter(chave_cache)
+        if pdf_cache is not None:
+            logger.info(f"PDF servido do cache compartilhado: {cpf_clean}")
+            return pdf_cache
+
+        # Outro worker pode ter gerado o mesmo PDF enquanto aguardávamos o lock
+        if destino.exists() and time.time() - destino.stat().st_mtime <= PDF_FLIGHT_TTL:
+            logger.info(f"PDF recém-gerado por outro worker: {destino}")
+            return destino.read_bytes()
+
+        with pdf_admission.slot():
+            logger.info("Criando instância do GeradorIR...")
+            gerador = GeradorIR(registro_snapshots.obter(ano))
+            logger.info("Chamando gerar_declaracao...")
+            sucesso, resultado = gerador.gerar_declaracao(cpf_clean)
+        logger.info(f"Resultado da geração: sucesso={sucesso}, resultado={resultado}")
+
+        if not sucesso:
+            raise PDFGenerationError(resultado)
+        if not resultado or not os.path.exists(resultado):
+            raise PDFGenerationError('PDF gerado mas arquivo não encontrado')
+
+        shutil.move(resultado, destino)
+        pdf_bytes = destino.read_bytes()
+        shared_cache.gravar(chave_cache, pdf_bytes, SHARED_CACHE_TTL)
+        return pdf_bytes
+
+    resultado = pdf_flight.executar(chave, gerar)
+    clean_pdf_flight()
+    return resultado
+
+
+_pdf_flight_cleanup = {'ultima': 0.0}
+_pdf_flight_cleanup_lock = threading.Lock()
+
+
+def clean_pdf_flight():
+    """
+    Remove PDFs e locks de PDF_FLIGHT_DIR com mais de PDF_FLIGHT_TTL segundos:
+    passada essa janela eles não são mais reaproveitados. Roda no máximo uma vez
+    por janela, na própria requisição que acabou de gerar.
+    """
+    agora = time.time()
+    with _pdf_flight_cleanup_lock:
+        if agora - _pdf_flight_cleanup['ultima'] < PDF_FLIGHT_TTL:
+            return
+        _pdf_flight_cleanup['ultima'] = agora
+
+    removidos = 0
+    for arquivo in Path(PDF_FLIGHT_DIR).glob('*.pdf'):
+        try:
+            if agora - arquivo.stat().st_mtime > PDF_FLIGHT_TTL:
+                arquivo.unlink()
+                removidos += 1
+        except FileNotFoundError:
+            continue
+    locks = pdf_flight.limpar_locks(PDF_FLIGHT_TTL)
+    if removidos or locks:
+        logger.info(f"pdf_flight: {removidos} PDFs e {locks} locks expirados removidos")
 
 def validate_cpf(cpf):
     """Valida CPF"""
@@ -207,36 +480,167 @@ def validate_cpf(cpf):
     
     return True, cpf_clean
 
+def validate_year(ano):
+    """Valida ano-calendário (ano padrão quando não informado)"""
+    if ano is None or ano == '':
+        ano = DEFAULT_YEAR
+    
+    try:
+        ano = int(ano)
+    except (TypeError, ValueError):
+        return False, "Ano inválido"
+    
+    if ano not in registro_snapshots.planilhas:
+        return False, f"Ano {ano} não disponível"
+    
+    return True, ano
+
+@app.before_request
+def start_request_context():
+    """Request id (X-Request-ID ou gerado) e amostragem de logs da requisição"""
+    g.request_start = time.monotonic()
+    request_id = request.headers.get('X-Request-ID', '')
+    if not re.fullmatch(r'[\w\-]{1,64}', request_id):
+        request_id = None
+    # X-Log-Sample: 1 força os logs informativos desta requisição
+    amostrar = True if request.headers.get('X-Log-Sample') == '1' else None
+    g.request_id, g.log_tokens = iniciar_contexto(request_id, amostrar)
+    
+    if PROFILE_REQUESTS and profiling_requested():
+        g.profile = PerfilRequisicao.iniciar(g.request_id, PROFILE_DIR)
+
+def profiling_requested():
+    pedido = request.headers.get('X-Profile', '')
+    if not pedido:
+        return False
+    return not PROFILE_TOKEN or hmac.compare_digest(pedido, PROFILE_TOKEN)
+
+def stop_profiling():
+    """Encerra o profiling da requisição, se houver; retorna o arquivo gravado"""
+    perfil = g.pop('profile', None)
+    return perfil.encerrar() if perfil else None
+
+@app.after_request
+def finish_request_context(response):
+    """Devolve o request id e registra uma linha de acesso estruturada"""
+    response.headers['X-Request-ID'] = g.request_id
+    arquivo_profile = stop_profiling()
+    if arquivo_profile:
+        response.headers['X-Profile-File'] = arquivo_profile.name
+    logger.info('Requisição concluída', extra={
+        'metodo': request.method,
+        'rota': request.path,
+        'status': response.status_code,
+        'duracao_ms': round((time.monotonic() - g.request_start) * 1000, 2)
+    })
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli para respostas de texto (ativos estáticos já saem comprimidos)"""
+    return comprimir_resposta(response, request.accept_encodings)
+
+@app.teardown_request
+def clear_request_context(error):
+    # Requisição que terminou em exceção não passa pelo after_request
+    stop_profiling()
+    tokens = g.pop('log_tokens', None)
+    if tokens:
+        encerrar_contexto(tokens)
+
+def static_response(ativo):
+    """
+    Arquivo estático com ETag do conteúdo e 304.
+    Pedido com ?v=<hash> atual é imutável; sem ele, o navegador revalida a cada uso.
+    """
+    if ativo is None:
+        abort(404)
+    
+    if request.if_none_match.contains_weak(ativo.hash):
+        response = Response(status=304)
+    else:
+        codificacao = escolher_codificacao(request.accept_encodings) if ativo.comprimivel else None
+        response = Response(ativo.variante(codificacao), mimetype=ativo.mimetype)
+        if codificacao:
+            response.headers['Content-Encoding'] = codificacao
+    
+    if ativo.comprimivel:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(ativo.hash, weak=True)
+    response.last_modified = datetime.fromtimestamp(ativo.mtime / 1e9, timezone.utc)
+    response.headers['Cache-Control'] = CACHE_IMUTAVEL if request.args.get('v') == ativo.hash else CACHE_REVALIDAR
+    return response
+
+def conditional_on_data_version(view):
+    """
+    ETag/Last-Modified da versão da planilha para GETs que dependem só dela e da URL.
+    Validador ainda atual responde 304 sem executar a consulta.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        is_valid, ano = validate_year(request.args.get('ano'))
+        if not is_valid:
+            return view(*args, **kwargs)
+        
+        fonte = excel_processor._load_snapshot(ano)
+        etag = f"{fonte.versao}-{hashlib.sha256(request.full_path.encode()).hexdigest()[:8]}"
+        try:
+            last_modified = datetime.fromtimestamp(int(os.path.getmtime(fonte.arquivo_excel)), timezone.utc)
+        except OSError:
+            last_modified = None
+        
+        if request.if_none_match:
+            nao_modificado = request.if_none_match.contains_weak(etag)
+        else:
+            nao_modificado = bool(last_modified and request.if_modified_since
+                                  and last_modified <= request.if_modified_since)
+        
+        if nao_modificado:
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        response.headers['Cache-Control'] = CACHE_REVALIDAR
+        return response
+    return wrapper
+
 @app.route('/')
 def index():
-    """Página inicial"""
-    return send_file('index.html')
+    """Página inicial (referências a CSS/JS/imagens versionadas por hash)"""
+    return static_response(static_assets.versionar_html(static_assets.obter('index.html')))
 
 @app.route('/styles.css')
 def styles():
     """Arquivo CSS"""
-    return send_file('styles.css')
+    return static_response(static_assets.obter('styles.css'))
 
 @app.route('/script.js')
 def script():
     """Arquivo JavaScript"""
-    return send_file('script.js')
+    return static_response(static_assets.obter('script.js'))
 
 @app.route('/Imagens/<filename>')
 def serve_images(filename):
     """Servir imagens"""
-    return send_file(f'Imagens/{filename}')
+    return static_response(static_assets.obter(f'Imagens/{filename}'))
 
 @app.route('/api/health')
 def health():
     """Health check"""
     try:
-        wb = excel_processor._load_workbook()
+        snapshot = excel_processor._load_snapshot()
         return jsonify({
             'success': True,
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
-            'sheets': wb.sheetnames
+            'sheets': snapshot.abas,
+            'versao': snapshot.versao,
+            'anos': registro_snapshots.anos()
         })
     except Exception as e:
         return jsonify({
@@ -245,6 +649,20 @@ def health():
             'error': str(e)
         }), 500
 
+@app.route('/api/metrics')
+def metrics():
+    """Métricas de fila/concorrência deste worker"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'timestamp': datetime.now().isoformat(),
+        'pdf_admission': pdf_admission.metrics(),
+        'pdf_single_flight': pdf_flight.metricas(),
+        'cache_compartilhado': shared_cache.metricas(),
+        'snapshots': registro_snapshots.status(),
+        'materializacao': {ano: m.status() for ano, m in materializadores.items()} or None
+    })
+
 @app.route('/api/buscar-e-gerar-pdf', methods=['POST'])
 def buscar_e_gerar_pdf():
     """Busca cliente e calcula valores"""
@@ -266,10 +684,25 @@ def buscar_e_gerar_pdf():
                 'message': cpf_clean
             }), 400
         
-        logger.info(f"Processando CPF: {cpf_clean}")
+        # Validar ano-calendário
+        is_valid, ano = validate_year(data.get('ano'))
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': ano
+            }), 400
+        
+        logger.info(f"Processando CPF: {cpf_clean} ({ano})")
+        
+        # Resultado já calculado por algum worker para esta versão da planilha
+        chave_cache = f"consulta:{ano}:{versao_planilha(registro_snapshots.arquivo(ano))}:{cpf_clean}"
+        resultado = shared_cache.obter_json(chave_cache)
+        if resultado is not None:
+            logger.info(f"Consulta servida do cache compartilhado: {cpf_clean}")
+            return jsonify(resultado)
         
         # Buscar cliente
-        cliente = excel_processor.search_client(cpf_clean)
+        cliente = excel_processor.search_client(cpf_clean, ano)
         if not cliente:
             return jsonify({
                 'success': False,
@@ -277,15 +710,17 @@ def buscar_e_gerar_pdf():
             }), 404
         
         # Calcular valores
-        valores = excel_processor.calculate_values(cpf_clean)
+        valores = excel_processor.calculate_values(cpf_clean, ano)
         
         resultado = {
             'success': True,
             'message': 'Processamento concluído',
+            'ano': ano,
             'cliente': cliente,
             'valores': valores
         }
         
+        shared_cache.gravar_json(chave_cache, resultado, SHARED_CACHE_TTL)
         logger.info(f"Processamento concluído para CPF: {cpf_clean}")
         return jsonify(resultado)
         
@@ -296,6 +731,412 @@ def buscar_e_gerar_pdf():
             'message': f'Erro interno: {str(e)}'
         }), 500
 
+@app.route('/api/buscar-lote', methods=['POST'])
+def buscar_lote():
+    """
+    Consulta em lote: {"cpfs": [...], "ano": 2024}.
+    Responde NDJSON (uma linha por CPF, na ordem recebida) a partir de um único snapshot;
+    CPFs inválidos ou não encontrados geram erro apenas no próprio item.
+    """
+    try:
+        if not request.is_json:
+            return jsonify({
+                'success': False,
+                'message': 'Content-Type deve ser application/json'
+            }), 400
+        
+        data = request.get_json()
+        cpfs = data.get('cpfs')
+        if not isinstance(cpfs, list) or not cpfs:
+            return jsonify({
+                'success': False,
+                'message': 'Informe "cpfs" como uma lista não vazia'
+            }), 400
+        
+        if len(cpfs) > BULK_MAX_CPFS:
+            return jsonify({
+                'success': False,
+                'message': f'Máximo de {BULK_MAX_CPFS} CPFs por lote'
+            }), 413
+        
+        is_valid, ano = validate_year(data.get('ano'))
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': ano
+            }), 400
+        
+        # Todo o lote é respondido a partir da mesma versão dos dados
+        snapshot = excel_processor._load_snapshot(ano)
+        logger.info(f"Consulta em lote: {len(cpfs)} CPFs ({ano}, versão {snapshot.versao})")
+        
+        def gerar_linhas():
+            for indice, cpf_raw in enumerate(cpfs):
+                item = {'indice': indice, 'cpf': cpf_raw}
+                
+                is_valid, cpf_clean = validate_cpf(cpf_raw)
+                dados = snapshot.buscar_cliente(cpf_clean) if is_valid else None
+                
+                if not is_valid:
+                    item.update(success=False, message=cpf_clean)
+                elif dados is None:
+                    item.update(success=False, message='Cliente não encontrado na base de dados')
+                else:
+                    item.update(
+                        success=True,
+                        cliente=excel_processor._format_client(cpf_clean, dados),
+                        valores=excel_processor._format_values(snapshot.totais_cliente(cpf_clean))
+                    )
+                
+                yield app.json.dumps(item) + '\n'
+        
+        response = Response(stream_with_context(gerar_linhas()), mimetype='application/x-ndjson')
+        response.headers['X-Data-Version'] = snapshot.versao
+        return response
+        
+    except Exception as e:
+        logger.error(f"Erro na consulta em lote: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
+@app.route('/api/buscar')
+@conditional_on_data_version
+def buscar_prefixo():
+    """
+    Autocompletar: ?q=<início do nome ou do CPF>&limite=10&ano=2024.
+    Cada termo de q deve ser prefixo do CPF ou de uma palavra do nome (sem acentos).
+    """
+    try:
+        consulta = request.args.get('q', '').strip()
+        if not consulta:
+            return jsonify({
+                'success': False,
+                'message': 'Informe o parâmetro "q"'
+            }), 400
+        
+        is_valid, ano = validate_year(request.args.get('ano'))
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': ano
+            }), 400
+        
+        try:
+            limite = min(LIMITE_MAXIMO, max(1, int(request.args.get('limite', LIMITE_PADRAO))))
+        except ValueError:
+            limite = LIMITE_PADRAO
+        
+        fonte = excel_processor._load_snapshot(ano)
+        response = jsonify({
+            'success': True,
+            'ano': ano,
+            'consulta': consulta,
+            'resultados': fonte.buscar_prefixo(consulta[:100], limite)
+        })
+        response.headers['X-Data-Version'] = fonte.versao
+        return response
+        
+    except Exception as e:
+        logger.error(f"Erro na busca por prefixo: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
+@app.route('/api/lancamentos')
+@conditional_on_data_version
+def lancamentos_cliente():
+    """
+    Linhas da UNION somadas nos totais do CPF, paginadas:
+    ?cpf=...&ano=2024&pagina=1&por_pagina=50&total=receita_bruta|despesas_acessorias
+    """
+    try:
+        is_valid, cpf_clean = validate_cpf(request.args.get('cpf', ''))
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': cpf_clean
+            }), 400
+        
+        is_valid, ano = validate_year(request.args.get('ano'))
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': ano
+            }), 400
+        
+        total = request.args.get('total') or None
+        if total not in (None, 'receita_bruta', 'despesas_acessorias'):
+            return jsonify({
+                'success': False,
+                'message': 'total deve ser receita_bruta ou despesas_acessorias'
+            }), 400
+        
+        try:
+            pagina = max(1, int(request.args.get('pagina', 1)))
+            por_pagina = min(LANCAMENTOS_MAX_POR_PAGINA, max(1, int(request.args.get('por_pagina', 50))))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'pagina e por_pagina devem ser números inteiros'
+            }), 400
+        
+        fonte = excel_processor._load_snapshot(ano)
+        resultado = fonte.lancamentos_cliente(cpf_clean, (pagina - 1) * por_pagina, por_pagina, total)
+        if resultado is None:
+            return jsonify({
+                'success': False,
+                'message': 'Cliente não encontrado na base de dados'
+            }), 404
+        
+        quantidade, itens = resultado
+        response = jsonify({
+            'success': True,
+            'ano': ano,
+            'cliente': excel_processor._format_client(cpf_clean, fonte.buscar_cliente(cpf_clean)),
+            'valores': excel_processor._format_values(fonte.totais_cliente(cpf_clean)),
+            'total': total,
+            'pagina': pagina,
+            'por_pagina': por_pagina,
+            'quantidade': quantidade,
+            'paginas': (quantidade + por_pagina - 1) // por_pagina,
+            'lancamentos': itens
+        })
+        response.headers['X-Data-Version'] = fonte.versao
+        return response
+        
+    except Exception as e:
+        logger.error(f"Erro no detalhamento de lançamentos: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
+def batch_job(ano, versao=None):
+    """(id, GeracaoLote) do ano na versão informada ou na atual da planilha"""
+    arquivo = registro_snapshots.arquivo(ano)
+    versao = versao or versao_planilha(arquivo)
+    return f"{ano}-{versao}", GeracaoLote(arquivo, Path(BATCH_DIR) / str(ano) / versao, ano)
+
+def run_batch(lote_id, lote):
+    """Executa o lote em uma thread deste worker (retomando o checkpoint, se houver)"""
+    def executar():
+        try:
+            # Reaproveita os dados já carregados pelo servidor para o ano
+            lote.executar(BATCH_PROCESSES, snapshot=registro_snapshots.obter(lote.ano))
+        except LoteEmAndamento:
+            logger.info(f"Lote {lote_id} já em andamento em outro worker")
+        except Exception as e:
+            logger.error(f"Erro no lote {lote_id}: {str(e)}")
+    
+    threading.Thread(target=executar, name=f'lote-{lote_id}', daemon=True).start()
+
+def batch_state(lote):
+    """(estado, manifesto) a partir do manifesto em disco - vale para qualquer worker"""
+    manifesto = lote.ler_manifesto()
+    if manifesto and manifesto.get('concluido'):
+        return 'concluido', manifesto
+    if lote.em_andamento():
+        return 'em_andamento', manifesto
+    return 'interrompido' if manifesto else 'nao_iniciado', manifesto
+
+@app.route('/api/lotes', methods=['POST'])
+def iniciar_lote():
+    """
+    Gera em segundo plano as declarações de todos os CPFs do ano: {"ano": 2024}.
+    Um lote interrompido (worker reiniciado) é retomado do manifesto chamando de novo.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        is_valid, ano = validate_year(data.get('ano'))
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': ano
+            }), 400
+        
+        if not PDF_GENERATOR_AVAILABLE:
+            return jsonify({
+                'success': False,
+                'message': 'Gerador de PDF não disponível no momento'
+            }), 503
+        
+        lote_id, lote = batch_job(ano)
+        estado, manifesto = batch_state(lote)
+        if estado in ('nao_iniciado', 'interrompido'):
+            run_batch(lote_id, lote)
+            estado = 'iniciado' if estado == 'nao_iniciado' else 'retomado'
+        logger.info(f"Lote {lote_id}: {estado}")
+        
+        return jsonify({
+            'success': True,
+            'lote': lote_id,
+            'estado': estado,
+            'progresso': manifesto['progresso'] if manifesto else None,
+            'url_progresso': f'/api/lotes/{lote_id}/progresso'
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Erro ao iniciar lote: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
+@app.route('/api/lotes/<lote_id>/progresso')
+def progresso_lote(lote_id):
+    """
+    Progresso do lote (renderizados, falhas, restantes, vazão, ETA) a cada checkpoint.
+    Server-Sent Events com Accept: text/event-stream, senão NDJSON.
+    A conexão termina quando o lote conclui, é interrompido ou após BATCH_STREAM_MAX
+    (curto: cada conexão ocupa um worker síncrono). Cada evento SSE tem um id; ao
+    reconectar com Last-Event-ID, o estado já recebido não é reenviado.
+    """
+    encontrado = re.fullmatch(r'(\d{4})-([0-9a-f]{16})', lote_id)
+    is_valid, ano = validate_year(encontrado.group(1) if encontrado else None)
+    if not encontrado or not is_valid:
+        return jsonify({
+            'success': False,
+            'message': 'Lote não encontrado'
+        }), 404
+    
+    _, lote = batch_job(ano, encontrado.group(2))
+    if not lote.diretorio.exists():
+        return jsonify({
+            'success': False,
+            'message': 'Lote não encontrado'
+        }), 404
+    
+    sse = request.accept_mimetypes.best_match(['application/x-ndjson', 'text/event-stream']) == 'text/event-stream'
+    
+    def identificador(evento):
+        return f"{evento['estado']}-{evento.get('renderizados', 0)}-{evento.get('falhas', 0)}"
+    
+    def formatar(evento):
+        dados = app.json.dumps(evento)
+        if sse:
+            return f"id: {identificador(evento)}\nevent: progresso\ndata: {dados}\n\n"
+        return dados + '\n'
+    
+    ultimo_recebido = request.headers.get('Last-Event-ID') if sse else None
+    
+    def eventos():
+        if sse:
+            yield 'retry: 3000\n\n'
+        fim = time.monotonic() + BATCH_STREAM_MAX
+        ultimo = None
+        while True:
+            estado, manifesto = batch_state(lote)
+            evento = {'lote': lote_id, 'estado': estado, **((manifesto or {}).get('progresso') or {})}
+            if evento != ultimo and identificador(evento) != ultimo_recebido:
+                yield formatar(evento)
+            ultimo = evento
+            if estado != 'em_andamento' or time.monotonic() >= fim:
+                return
+            time.sleep(BATCH_PROGRESS_INTERVAL)
+    
+    response = Response(
+        stream_with_context(eventos()),
+        mimetype='text/event-stream' if sse else 'application/x-ndjson'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/exportar')
+def exportar_declaracoes():
+    """
+    Dados de todas as declarações: ?formato=csv|jsonl|parquet&ano=2024.
+    Escrito em streaming a partir de um único snapshot (memória constante).
+    """
+    try:
+        is_valid, ano = validate_year(request.args.get('ano'))
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': ano
+            }), 400
+        
+        formato = request.args.get('formato', 'csv')
+        fonte = excel_processor._load_snapshot(ano)
+        try:
+            blocos = exportar(fonte, formato)
+        except FormatoIndisponivel as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        logger.info(f"Exportação {formato} ({ano}, versão {fonte.versao})")
+        response = Response(stream_with_context(blocos), mimetype=FORMATOS[formato])
+        response.headers['Content-Disposition'] = f'attachment; filename="declaracoes_{ano}_{fonte.versao}.{formato}"'
+        response.headers['X-Data-Version'] = fonte.versao
+        return response
+        
+    except Exception as e:
+        logger.error(f"Erro na exportação: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
+@app.route('/api/validacao-base')
+@conditional_on_data_version
+def validacao_base():
+    """Relatório de CPFs inválidos, malformados e duplicados da 'Base de Clientes '"""
+    try:
+        is_valid, ano = validate_year(request.args.get('ano'))
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': ano
+            }), 400
+        
+        fonte = excel_processor._load_snapshot(ano)
+        relatorio = fonte.relatorio_validacao().para_dict()
+        return jsonify({
+            'success': True,
+            'ano': ano,
+            'versao': fonte.versao,
+            **relatorio
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro na validação da base: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
+@app.route('/api/auditoria-base')
+@conditional_on_data_version
+def auditoria_base():
+    """Valores "Verificar", clientes sem lançamentos e linhas da UNION casadas por mais de um cliente"""
+    try:
+        is_valid, ano = validate_year(request.args.get('ano'))
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': ano
+            }), 400
+
+        fonte = excel_processor._load_snapshot(ano)
+        relatorio = fonte.auditoria().para_dict()
+        return jsonify({
+            'success': True,
+            'ano': ano,
+            'versao': fonte.versao,
+            **relatorio
+        })
+
+    except Exception as e:
+        logger.error(f"Erro na auditoria da base: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
 @app.route('/api/gerar-pdf', methods=['POST'])
 def gerar_pdf():
     """Gera PDF da declaração de IR"""
@@ -317,7 +1158,15 @@ def gerar_pdf():
                 'message': cpf_clean
             }), 400
         
-        logger.info(f"Gerando PDF para CPF: {cpf_clean}")
+        # Validar ano-calendário
+        is_valid, ano = validate_year(data.get('ano'))
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': ano
+            }), 400
+        
+        logger.info(f"Gerando PDF para CPF: {cpf_clean} ({ano})")
         
         # Gerar PDF
         logger.info(f"PDF_GENERATOR_AVAILABLE: {PDF_GENERATOR_AVAILABLE}")
@@ -330,35 +1179,38 @@ def gerar_pdf():
             }), 503
         
         try:
-            logger.info("Criando instância do GeradorIR...")
-            gerador = GeradorIR()
-            logger.info("Chamando gerar_declaracao...")
-            sucesso, resultado = gerador.gerar_declaracao(cpf_clean)
-            logger.info(f"Resultado da geração: sucesso={sucesso}, resultado={resultado}")
-            
-            if sucesso:
-                pdf_path = resultado
-                logger.info(f"Verificando se arquivo existe: {pdf_path}")
-                if pdf_path and os.path.exists(pdf_path):
-                    logger.info(f"PDF encontrado, enviando arquivo: {pdf_path}")
+            # Declaração pré-gerada para a versão atual: apenas servir o arquivo
+            materializador = materializadores.get(ano)
+            if materializador is not None:
+                pdf_path = materializador.caminho_pdf(cpf_clean)
+                if pdf_path:
+                    logger.info(f"Servindo PDF pré-gerado: {pdf_path}")
                     return send_file(
                         pdf_path,
                         as_attachment=True,
                         download_name=f"Declaracao_IR_{cpf_clean}.pdf",
                         mimetype='application/pdf'
                     )
-                else:
-                    logger.error(f"PDF gerado mas arquivo não encontrado: {pdf_path}")
-                    return jsonify({
-                        'success': False,
-                        'message': 'PDF gerado mas arquivo não encontrado'
-                    }), 500
-            else:
-                logger.error(f"Erro na geração do PDF: {resultado}")
-                return jsonify({
-                    'success': False,
-                    'message': resultado
-                }), 500
+            
+            pdf_bytes, compartilhado = render_pdf(cpf_clean, ano)
+            if compartilhado:
+                logger.info(f"PDF compartilhado com requisição idêntica em andamento: {cpf_clean}")
+            
+            return send_file(
+                io.BytesIO(pdf_bytes),
+                as_attachment=True,
+                download_name=f"Declaracao_IR_{cpf_clean}.pdf",
+                mimetype='application/pdf'
+            )
+        except AdmissionRejected as e:
+            logger.warning(f"Geração de PDF recusada ({e.status}): {e.message}")
+            return overload_response(e)
+        except PDFGenerationError as e:
+            logger.error(f"Erro na geração do PDF: {str(e)}")
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 500
         except Exception as e:
             logger.error(f"Erro ao gerar PDF: {str(e)}")
             import traceback